@@ -1,8 +1,12 @@
 
+import atexit
+import functools
 import logging
 import os
+import struct
 import threading
 import time
+import zlib
 from sqlite3 import OperationalError
 
 from django.db.backends.sqlite3 import base as sqlite3base
@@ -17,6 +21,9 @@ IntegrityError = sqlite3base.IntegrityError
 execute_sync = False
 log = logging.getLogger('freeadmin.sqlite3_ha')
 
+# Number of distinct queries to keep parsed
+STATEMENT_CACHE_SIZE = 512
+
 
 """
 Mapping of tables to not to replicate to the remote side
@@ -49,15 +56,122 @@ class DBSync(object):
             raise
 
 
+class FailoverStatus(object):
+    """
+    Cache of the failover status of this node so writes do not have to look
+    it up (`notifier().failover_status()` is extremely time-consuming).
+
+    The cache is kept up to date by `failover.status` events, sent by the
+    failover plugin on every transition: pushed by `set` within middlewared
+    (see `push`) and received through a middlewared connection in other
+    processes. The status is looked up again whenever events may have been
+    missed (e.g. the connection is lost) and at least every `TTL` seconds, so
+    a transition is noticed even if no event is sent for it.
+    """
+
+    EVENT = 'failover.status'
+    # Seconds to wait before connecting again to middlewared
+    RETRY_INTERVAL = 5
+    # Seconds a status is used before being looked up again
+    TTL = 5
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._status = None
+        self._expires_at = 0
+        self._pushed = False
+        self._client = None
+        self._retry_at = 0
+
+    def push(self):
+        """
+        Status changes are pushed with `set` by the current process.
+        """
+        self._pushed = True
+
+    def set(self, status):
+        with self._lock:
+            self._status = status
+            self._expires_at = time.monotonic() + self.TTL
+
+    def invalidate(self):
+        with self._lock:
+            self._status = None
+
+    def get(self):
+        with self._lock:
+            if self._status is not None and time.monotonic() < self._expires_at and self._subscribed():
+                return self._status
+
+        status, ttl = self._lookup()
+        if status is not None:
+            with self._lock:
+                if self._subscribe():
+                    self._status = status
+                    self._expires_at = time.monotonic() + ttl
+        return status
+
+    def _lookup(self):
+        """
+        Returns the failover status and for how long it can be used.
+        """
+        try:
+            from freenasUI.middleware.notifier import notifier
+            if not hasattr(notifier, 'failover_status'):
+                # Not an HA system, this is not going to change
+                self._pushed = True
+                return 'SINGLE', float('inf')
+            return notifier().failover_status(), self.TTL
+        except Exception:
+            return None, 0
+
+    def _subscribed(self):
+        return self._pushed or (self._client is not None and not self._client._closed.is_set())
+
+    def _subscribe(self):
+        if self._subscribed():
+            return True
+        if time.monotonic() < self._retry_at:
+            return False
+
+        from freenasUI.middleware.client import Client
+        try:
+            self._client = Client()
+            self._client.subscribe(self.EVENT, self._on_event)
+        except Exception:
+            log.debug('Failed to subscribe to %s', self.EVENT, exc_info=True)
+            self._client = None
+            self._retry_at = time.monotonic() + self.RETRY_INTERVAL
+            return False
+        return True
+
+    def _on_event(self, mtype, **message):
+        status = (message.get('fields') or {}).get('status')
+        if status:
+            self.set(status)
+        else:
+            self.invalidate()
+
+
+failover_status = FailoverStatus()
+
+
 class Journal(object):
     """
     Interface for accessing the journal for the queries that couldn't run in
     the remote side, either for it being offline or failed to execute.
 
+    The journal is an append-only log of checksummed records so queueing
+    queries does not rewrite it, it is compacted once queries are removed
+    from it (e.g. replayed). A torn or corrupted tail is discarded.
+
     This should be used in a context and provides file locking by itself.
     """
 
     JOURNAL_FILE = '/data/ha-journal'
+    MAGIC = b'HAJ1'
+    # Record header: magic, length and crc32 of the pickled query
+    HEADER = struct.Struct('!4sII')
 
     @classmethod
     def is_empty(cls):
@@ -68,12 +182,52 @@ class Journal(object):
         except OSError:
             return True
 
+    @classmethod
+    def _record(cls, query):
+        data = pickle.dumps(query)
+        return cls.HEADER.pack(cls.MAGIC, len(data), zlib.crc32(data)) + data
+
     def _get_queries(self):
-        try:
-            with open(self.JOURNAL_FILE, 'rb') as f:
-                self.queries = pickle.loads(f.read())
-        except (pickle.PickleError, EOFError):
-            self.queries = []
+        with open(self.JOURNAL_FILE, 'rb') as f:
+            data = f.read()
+
+        self.queries = []
+        if data and not data.startswith(self.MAGIC):
+            # Journal written as a single pickled list by previous versions
+            try:
+                self.queries = pickle.loads(data)
+            except Exception:
+                log.warning('Discarding unreadable journal', exc_info=True)
+            self._compact = True
+            return
+
+        offset = 0
+        while offset + self.HEADER.size <= len(data):
+            magic, length, crc = self.HEADER.unpack_from(data, offset)
+            record = data[offset + self.HEADER.size:offset + self.HEADER.size + length]
+            if magic != self.MAGIC or len(record) != length or zlib.crc32(record) != crc:
+                break
+            try:
+                self.queries.append(pickle.loads(record))
+            except Exception:
+                break
+            offset += self.HEADER.size + length
+
+        if offset < len(data):
+            log.warning('Discarding %d bytes of corrupted journal', len(data) - offset)
+            self._compact = True
+
+    def append(self, queries):
+        """
+        Append `queries` to the journal without rewriting it.
+        """
+        self.queries.extend(queries)
+        self._written.extend(queries)
+        if not self._compact:
+            with open(self.JOURNAL_FILE, 'ab') as f:
+                f.write(b''.join(self._record(query) for query in queries))
+                f.flush()
+                os.fsync(f.fileno())
 
     def __enter__(self):
         self._lock = LockFile(self.JOURNAL_FILE)
@@ -86,51 +240,176 @@ class Journal(object):
         if not os.path.exists(self.JOURNAL_FILE):
             open(self.JOURNAL_FILE, 'a').close()
 
+        self._compact = False
         self._get_queries()
+        # Queries as written in the journal file
+        self._written = list(self.queries)
         return self
 
     def __exit__(self, typ, value, traceback):
 
-        with open(self.JOURNAL_FILE, 'wb+') as f:
-            if self.queries:
-                f.write(pickle.dumps(self.queries))
-
-        self._lock.release()
+        try:
+            if self._compact or self.queries != self._written:
+                tmp = self.JOURNAL_FILE + '.tmp'
+                with open(tmp, 'wb') as f:
+                    f.write(b''.join(self._record(query) for query in self.queries))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.rename(tmp, self.JOURNAL_FILE)
+        finally:
+            self._lock.release()
         if typ is not None:
             raise
 
 
-class RunSQLRemote(threading.Thread):
+class Replicator(threading.Thread):
     """
-    This is a thread responsible for running the queries on the remote side.
+    Long lived thread responsible for running the queries on the remote side.
 
-    The query will be appended to the Journal in case the Journal is not empty
-    or if it fails (e.g. remote side offline)
+    Queries are queued and sent in batches, each one run by the remote side
+    within a single transaction. A batch is sent `flush_interval` seconds after
+    its first query, or right away if a caller is waiting for it (DBSync).
+
+    The queries will be appended to the Journal in case the Journal is not empty
+    or if the batch fails (e.g. remote side offline). The Journal is replayed
+    before sending new queries, at most once per `RETRY_INTERVAL` while the
+    remote side keeps failing.
     """
 
-    def __init__(self, *args, **kwargs):
-        self._sql = kwargs.pop('sql')
-        self._params = kwargs.pop('params')
-        super(RunSQLRemote, self).__init__(*args, **kwargs)
+    BATCH_SIZE = 500
+    FLUSH_INTERVAL = 0.2
+    RETRY_INTERVAL = 10
+
+    def __init__(self, send=None, flush_interval=None):
+        super(Replicator, self).__init__(name='sqlite3_ha', daemon=True)
+        self._send = send or self._send_remote
+        self._flush_interval = self.FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self._cond = threading.Condition()
+        self._queue = []
+        # Sequence numbers of the last query queued and sent (or journaled)
+        self._queued = 0
+        self._flushed = 0
+        self._waiting = 0
+        self._retry_at = 0
+        self._client = None
+
+    def put(self, sql, params, wait=False):
+        """
+        Queue a query, waiting for it to be sent if `wait` is set.
+        """
+        with self._cond:
+            self._queue.append((sql, params))
+            self._queued += 1
+            self._cond.notify_all()
+        if wait:
+            self.flush()
+
+    def flush(self):
+        """
+        Wait for all queued queries to be sent.
+        """
+        with self._cond:
+            seq = self._queued
+            self._waiting += 1
+            self._cond.notify_all()
+            try:
+                self._cond.wait_for(lambda: self._flushed >= seq)
+            finally:
+                self._waiting -= 1
 
     def run(self):
-        from freenasUI.middleware.client import client, ClientException
-        try:
-            with Journal() as f:
-                if f.queries:
-                    f.queries.append((self._sql, self._params))
-                else:
-                    with client as c:
-                        c.call('failover.call_remote', 'datastore.sql', [self._sql, self._params])
-        except ClientException:
-            with Journal() as f:
-                f.queries.append((self._sql, self._params))
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queue)
+                # Give other queries a chance to make into the same batch
+                self._cond.wait_for(
+                    lambda: self._waiting or len(self._queue) >= self.BATCH_SIZE, self._flush_interval,
+                )
+                queries, self._queue = self._queue, []
+                seq = self._queued
+
+            try:
+                self._replicate(queries)
+            except Exception as err:
+                log.error('Failed to run SQL remotely: %s', err, exc_info=True)
+
+            with self._cond:
+                self._flushed = seq
+                self._cond.notify_all()
+
+    def _replicate(self, queries):
+        from freenasUI.middleware.client import ClientException
+        with Journal() as j:
+            if j.queries and not self._replay(j):
+                j.append(queries)
+                return
+
+            for i in range(0, len(queries), self.BATCH_SIZE):
+                try:
+                    self._send(queries[i:i + self.BATCH_SIZE])
+                except Exception as err:
+                    # Not only the remote side being offline: connecting to middlewared
+                    # may fail as well (e.g. while it restarts)
+                    if not isinstance(err, ClientException):
+                        log.error('Failed to run SQL remotely: %s', err, exc_info=True)
+                    j.append(queries[i:])
+                    self._retry_at = time.monotonic() + self.RETRY_INTERVAL
+                    return
+
+    def _replay(self, journal):
+        """
+        Send the queries of `journal`, removing the ones sent.
+        Returns whether all of them have been sent.
+        """
+        from freenasUI.middleware.client import ClientException
+        if time.monotonic() < self._retry_at:
             return False
+
+        sent = 0
+        try:
+            while sent < len(journal.queries):
+                self._send(journal.queries[sent:sent + self.BATCH_SIZE])
+                sent += self.BATCH_SIZE
         except Exception as err:
-            log.error('Failed to run SQL remotely %s: %s', self._sql, err, exc_info=True)
+            if not isinstance(err, ClientException):
+                log.error('Failed to replay journal remotely: %s', err, exc_info=True)
+            self._retry_at = time.monotonic() + self.RETRY_INTERVAL
             return False
+        finally:
+            del journal.queries[:sent]
         return True
 
+    def _send_remote(self, queries):
+        from freenasUI.middleware.client import Client, ClientException
+        if self._client is None or self._client._closed.is_set():
+            self._client = Client()
+        try:
+            self._client.call('failover.call_remote', 'datastore.sql_batch', [queries])
+        except ClientException:
+            raise
+        except Exception:
+            # Connection may be broken, connect again next time
+            self._client = None
+            raise
+
+
+_replicator = None
+_replicator_lock = threading.Lock()
+
+
+def get_replicator():
+    """
+    Returns the replication thread of this process, starting it if needed.
+    """
+    global _replicator
+    with _replicator_lock:
+        if _replicator is None or not _replicator.is_alive():
+            _replicator = Replicator()
+            _replicator.start()
+            # Do not lose queued queries when the process exits
+            atexit.register(_replicator.flush)
+        return _replicator
+
 
 class DatabaseFeatures(sqlite3base.DatabaseFeatures):
     pass
@@ -244,136 +523,139 @@ class DatabaseWrapper(sqlite3base.DatabaseWrapper):
         return True
 
 
-class HASQLiteCursorWrapper(Database.Cursor):
+@functools.lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def parse_query(query):
+    """
+    Parse `query` to find out the statements to run on the remote side,
+    modified if necessary based on NO_SYNC_MAP rules.
 
-    def execute_passive(self, query, params=None):
-        """
-        Process the query, modify it if necessary based on NO_SYNC_MAP rules
-        and execute it on the remote side.
-        """
-        global execute_sync
+    Returns a tuple of `(statement, params indexes to remove)`.
+    Results are cached since the same queries are run over and over.
+    """
+    statements = []
+    parse = sqlparse.parse(query)
+    for p in parse:
 
-        # Skip SELECT queries
-        if query.lower().startswith('select'):
-            return
+        # Only care for DELETE, INSERT and UPDATE queries
+        if p.tokens[0].normalized not in ('DELETE', 'INSERT', 'UPDATE'):
+            continue
 
-        try:
-            # FIXME: This is extremely time-consuming (failover.status)
-            from freenasUI.middleware.notifier import notifier
-            if not (
-                hasattr(notifier, 'failover_status') and
-                notifier().failover_status() == 'MASTER'
-            ):
-                return
-        except:
-            return
+        delete_idx = []
 
-        parse = sqlparse.parse(query)
-        for p in parse:
+        if p.tokens[0].normalized == 'INSERT':
 
-            # Only care for DELETE, INSERT and UPDATE queries
-            if p.tokens[0].normalized not in ('DELETE', 'INSERT', 'UPDATE'):
+            into = p.token_next_by(m=(sqlparse.tokens.Keyword, 'INTO'))
+            if not into:
                 continue
 
-            cparams = list(params)
-            if p.tokens[0].normalized == 'INSERT':
+            next_ = p.token_next(into[0])
 
-                into = p.token_next_by(m=(sqlparse.tokens.Keyword, 'INTO'))
-                if not into:
-                    continue
+            if next_[1].value in NO_SYNC_MAP:
+                continue
 
-                next_ = p.token_next(into[0])
+        elif p.tokens[0].normalized == 'DELETE':
 
-                if next_[1].value in NO_SYNC_MAP:
-                    continue
+            from_ = p.token_next_by(m=(sqlparse.tokens.Keyword, 'FROM'))
+            if not from_:
+                continue
 
-            elif p.tokens[0].normalized == 'DELETE':
+            next_ = p.token_next(from_[0])
 
-                from_ = p.token_next_by(m=(sqlparse.tokens.Keyword, 'FROM'))
-                if not from_:
-                    continue
+            if next_[1].value in NO_SYNC_MAP:
+                continue
 
-                next_ = p.token_next(from_[0])
+        elif p.tokens[0].normalized == 'UPDATE':
 
-                if next_[1].value in NO_SYNC_MAP:
-                    continue
+            name = p.token_next(0)[1].value
+            no_sync = NO_SYNC_MAP.get(name)
+            # Skip if table is in set to not to sync and has no attrs
+            if no_sync is None and name in NO_SYNC_MAP:
+                continue
+
+            set_ = p.token_next_by(m=(sqlparse.tokens.Keyword, 'SET'))
+            if not set_:
+                continue
 
-            elif p.tokens[0].normalized == 'UPDATE':
+            next_ = p.token_next(set_[0])
+            if not next_:
+                continue
 
-                name = p.token_next(0)[1].value
-                no_sync = NO_SYNC_MAP.get(name)
-                # Skip if table is in set to not to sync and has no attrs
-                if no_sync is None and name in NO_SYNC_MAP:
-                    continue
+            if no_sync is None:
+                lookup = []
+            else:
 
-                set_ = p.token_next_by(m=(sqlparse.tokens.Keyword, 'SET'))
-                if not set_:
+                if 'fields' not in no_sync:
                     continue
 
-                next_ = p.token_next(set_[0])
-                if not next_:
+                if issubclass(
+                    next_[1].__class__, sqlparse.sql.IdentifierList
+                ):
+                    lookup = list(next_[1].get_sublists())
+                elif issubclass(next_[1].__class__, sqlparse.sql.Comparison):
+                    lookup = [next_[1]]
+
+                # Get all placeholders from the query (%s or ?)
+                placeholders = [a for a in p.flatten() if a.value in ('%s', '?')]
+
+            # Remember correspondent params to delete
+            for l in lookup:
+
+                if l.value not in no_sync['fields']:
                     continue
 
-                if no_sync is None:
-                    lookup = []
-                else:
+                # Remove placeholder from the params
+                try:
+                    delete_idx.append(placeholders.index(l.tokens[-1]))
+                except ValueError:
+                    pass
 
-                    if 'fields' not in no_sync:
-                        continue
+                # If it is a list we must also remove the comma around it
+                t_index = l.parent.token_index(l)
+                prev_ = l.parent.token_prev(t_index)
+                next_ = l.parent.token_next(t_index)
+                if next_ and issubclass(
+                    next_[1].__class__, sqlparse.sql.Token
+                ) and next_[1].value == ',':
+                    del l.parent.tokens[next_[0]]
+                elif prev_ and issubclass(
+                    prev_[1].__class__, sqlparse.sql.Token
+                ) and prev_[1].value == ',':
+                    del l.parent.tokens[prev_[0]]
+                del l.parent.tokens[l.parent.token_index(l)]
 
-                    if issubclass(
-                        next_[1].__class__, sqlparse.sql.IdentifierList
-                    ):
-                        lookup = list(next_[1].get_sublists())
-                    elif issubclass(next_[1].__class__, sqlparse.sql.Comparison):
-                        lookup = [next_[1]]
+            delete_idx.sort(reverse=True)
 
-                    # Get all placeholders from the query (%s or ?)
-                    placeholders = [a for a in p.flatten() if a.value in ('%s', '?')]
+        statements.append((str(p), tuple(delete_idx)))
 
-                # Remember correspondent cparams to delete
-                delete_idx = []
+    return tuple(statements)
 
-                for l in lookup:
 
-                    if l.value not in no_sync['fields']:
-                        continue
+class HASQLiteCursorWrapper(Database.Cursor):
 
-                    # Remove placeholder from the params
-                    try:
-                        idx = placeholders.index(l.tokens[-1])
-                        if cparams:
-                            delete_idx.append(idx)
-                    except ValueError:
-                        pass
+    def execute_passive(self, query, params=None):
+        """
+        Process the query, modify it if necessary based on NO_SYNC_MAP rules
+        and execute it on the remote side.
+        """
+        global execute_sync
+
+        # Skip SELECT queries
+        if query.lower().startswith('select'):
+            return
 
-                    # If it is a list we must also remove the comma around it
-                    t_index = l.parent.token_index(l)
-                    prev_ = l.parent.token_prev(t_index)
-                    next_ = l.parent.token_next(t_index)
-                    if next_ and issubclass(
-                        next_[1].__class__, sqlparse.sql.Token
-                    ) and next_[1].value == ',':
-                        del l.parent.tokens[next_[0]]
-                    elif prev_ and issubclass(
-                        prev_[1].__class__, sqlparse.sql.Token
-                    ) and prev_[1].value == ',':
-                        del l.parent.tokens[prev_[0]]
-                    del l.parent.tokens[l.parent.token_index(l)]
-
-                delete_idx.sort(reverse=True)
+        if failover_status.get() != 'MASTER':
+            return
+
+        for sql, delete_idx in parse_query(query):
+            cparams = list(params)
+            if cparams:
                 for i in delete_idx:
                     del cparams[i]
 
             if params is not None:
-                sql = self.convert_query(str(p))
-            else:
-                sql = str(p)
-            # Actually try to run the query on the remote side within a thread
-            rsr = RunSQLRemote(sql=sql, params=cparams)
-            rsr.start()
-            if execute_sync:
-                rsr.join()
+                sql = self.convert_query(sql)
+            # Queue the query to run on the remote side
+            get_replicator().put(sql, cparams, wait=execute_sync)
 
     def locked_retry(self, method, *args, **kwargs):
         """
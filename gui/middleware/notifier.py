@@ -2364,6 +2364,15 @@ class notifier(metaclass=HookMetaclass):
 
         return share_type
 
+    def get_dataset_share_types(self, datasets):
+        """
+        Same as get_dataset_share_type for a list of datasets, in a single call.
+
+        Returns:
+            dict(dataset) = share type
+        """
+        return {dataset: self.get_dataset_share_type(dataset) for dataset in datasets}
+
     def change_dataset_share_type(self, dataset, changeto):
         share_type = self.get_dataset_share_type(dataset)
 
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Benchmark `@accepts` argument cleaning and validation for schemas shaped like
+`pool.create`, `user.create` and `*.query` filters/options, comparing deep
+copying the arguments and validating every attribute (how
+`clean_and_validate_args` used to work) against the validator compiled by
+`resolve_methods`.
+
+    python bench_accepts.py [--calls 20000]
+"""
+import argparse
+import copy
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from middlewared.schema import (  # noqa
+    accepts, resolve_methods, Bool, Dict, Int, List, NOT_PROVIDED, Schemas, Str, ValidationErrors,
+)
+
+
+class Service(object):
+
+    @accepts(Dict(
+        'pool_create',
+        Str('name', required=True),
+        Bool('encryption', default=False),
+        Str('deduplication', enum=[None, 'ON', 'VERIFY', 'OFF'], default=None, null=True),
+        Dict(
+            'topology',
+            List('data', items=[
+                Dict(
+                    'datavdevs',
+                    Str('type', enum=['RAIDZ1', 'RAIDZ2', 'RAIDZ3', 'MIRROR', 'STRIPE'], required=True),
+                    List('disks', items=[Str('disk')], required=True),
+                ),
+            ], required=True),
+            List('cache', items=[
+                Dict(
+                    'cachevdevs',
+                    Str('type', enum=['STRIPE']),
+                    List('disks', items=[Str('disk')], required=True),
+                ),
+            ]),
+            List('spares', items=[Str('disk')], default=[]),
+            required=True,
+        ),
+        register=True,
+    ))
+    def pool_create(self, data):
+        return data
+
+    @accepts(Dict(
+        'user_create',
+        Int('uid'),
+        Str('username', required=True, max_length=16),
+        Int('group'),
+        Bool('group_create', default=False),
+        Str('home', default='/nonexistent'),
+        Str('home_mode', default='755'),
+        Str('shell', default='/bin/csh'),
+        Str('full_name', required=True),
+        Str('email', null=True, default=None),
+        Str('password', private=True),
+        Bool('password_disabled', default=False),
+        Bool('locked', default=False),
+        Bool('microsoft_account', default=False),
+        Bool('sudo', default=False),
+        Str('sshpubkey', null=True),
+        List('groups', default=[]),
+        Dict('attributes', additional_attrs=True),
+        register=True,
+    ))
+    def user_create(self, data):
+        return data
+
+    @accepts(
+        List('query-filters', default=None, null=True),
+        Dict(
+            'query-options',
+            Str('extend', default=None, null=True),
+            Str('extend_many', default=None, null=True),
+            Dict('extra', additional_attrs=True),
+            List('order_by', default=[]),
+            List('select', default=[]),
+            Bool('count', default=False),
+            Bool('get', default=False),
+            Int('offset', default=0),
+            Int('limit', default=0),
+            Str('prefix', null=True),
+            default=None,
+            null=True,
+        ),
+    )
+    def query(self, filters=None, options=None):
+        return filters, options
+
+
+def legacy_clean_and_validate_args(schema, args):
+    args = copy.deepcopy(list(args))
+    verrors = ValidationErrors()
+    for i, attr in enumerate(schema):
+        value = attr.clean(args[i] if i < len(args) else NOT_PROVIDED)
+        if i < len(args):
+            args[i] = value
+        try:
+            attr.validate(value)
+        except ValidationErrors as e:
+            verrors.extend(e)
+    if verrors:
+        raise verrors
+    return args
+
+
+CASES = {
+    'pool.create': ('pool_create', [{
+        'name': 'tank',
+        'encryption': False,
+        'topology': {
+            'data': [
+                {'type': 'RAIDZ2', 'disks': [f'da{i}' for i in range(j * 6, j * 6 + 6)]} for j in range(4)
+            ],
+            'cache': [{'type': 'STRIPE', 'disks': ['nvd0']}],
+            'spares': ['da24', 'da25'],
+        },
+    }]),
+    'user.create': ('user_create', [{
+        'username': 'jdoe',
+        'full_name': 'John Doe',
+        'group_create': True,
+        'password': 'secret',
+        'email': 'jdoe@example.com',
+        'groups': [41, 42],
+        'attributes': {'preferences': {'theme': 'dark'}},
+    }]),
+    'query (no args)': ('query', []),
+    'query (filters/options)': ('query', [
+        [['name', '^', 'tank/'], ['OR', [['used', '>', 1024], ['type', '=', 'FILESYSTEM']]]],
+        {'order_by': ['name'], 'select': ['id', 'name'], 'limit': 50, 'extra': {'flat': False}},
+    ]),
+}
+
+
+def timeit(fn, calls):
+    start = time.perf_counter()
+    for i in range(calls):
+        fn()
+    return (time.perf_counter() - start) / calls * 1000000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calls', type=int, default=20000)
+    args = parser.parse_args()
+
+    service = Service()
+    resolve_methods(Schemas(), [getattr(service, method) for method in ('pool_create', 'user_create', 'query')])
+
+    print(f'{"method":<26} {"deepcopy":>10} {"compiled":>10}')
+    for name, (method, params) in CASES.items():
+        wrapped = getattr(service, method)
+        before = timeit(lambda: legacy_clean_and_validate_args(wrapped.accepts, params), args.calls)
+        after = timeit(lambda: wrapped(*params), args.calls)
+        print(f'{name:<26} {before:>8.1f}us {after:>8.1f}us')
+
+
+if __name__ == '__main__':
+    main()
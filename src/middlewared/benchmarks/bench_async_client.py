@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Benchmark calls/sec of the thread based `Client` against `AsyncClient`, one
+call at a time and with many calls in flight over the same connection.
+
+Calls go to a local stand-in for middlewared speaking the same websocket
+protocol on a unix socket, whose methods take `--latency` ms to return.
+
+    python bench_async_client.py [--calls 2000] [--concurrency 64] [--latency 1]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from middlewared.client import ejson as json  # noqa
+from middlewared.client.async_client import AsyncClient  # noqa
+
+
+async def websocket(request):
+    ws = web.WebSocketResponse()
+    await ws.prepare(request)
+    latency = request.app['latency']
+
+    async def method(message):
+        await asyncio.sleep(latency)
+        await ws.send_str(json.dumps({'msg': 'result', 'id': message['id'], 'result': message['params']}))
+
+    async for msg in ws:
+        message = json.loads(msg.data)
+        if message['msg'] == 'connect':
+            await ws.send_str(json.dumps({'msg': 'connected', 'session': 'bench'}))
+        elif message['msg'] == 'method':
+            asyncio.ensure_future(method(message))
+        elif message['msg'] == 'ping':
+            await ws.send_str(json.dumps({'msg': 'pong', 'id': message['id']}))
+    return ws
+
+
+def serve(path, latency, started):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    app = web.Application()
+    app['latency'] = latency
+    app.router.add_route('GET', '/websocket', websocket)
+    runner = web.AppRunner(app, access_log=None)
+    loop.run_until_complete(runner.setup())
+    loop.run_until_complete(web.UnixSite(runner, path).start())
+    started.set()
+    loop.run_forever()
+
+
+def report(name, calls, elapsed):
+    print(f'{name:<20} {calls / elapsed:>9.0f} calls/sec ({elapsed:.2f}s)')
+
+
+def bench_client(uri, calls):
+    try:
+        from middlewared.client import Client
+    except ImportError:
+        print('Client (ws4py) not available, skipping')
+        return
+
+    with Client(uri) as c:
+        start = time.perf_counter()
+        for i in range(calls):
+            c.call('core.ping', i)
+        report('Client', calls, time.perf_counter() - start)
+
+
+async def bench_async_client(uri, calls, concurrency):
+    async with AsyncClient(uri) as c:
+        start = time.perf_counter()
+        for i in range(calls):
+            await c.call('core.ping', i)
+        report('AsyncClient', calls, time.perf_counter() - start)
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def call(i):
+            async with semaphore:
+                return await c.call('core.ping', i)
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*[call(i) for i in range(calls)])
+        assert results == [[i] for i in range(calls)]
+        report(f'AsyncClient x{concurrency}', calls, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calls', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--latency', type=float, default=1, help='Method latency in ms')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'middlewared.sock')
+        started = threading.Event()
+        threading.Thread(target=serve, args=(path, args.latency / 1000, started), daemon=True).start()
+        started.wait()
+
+        uri = f'ws+unix://{path}'
+        bench_client(uri, args.calls)
+        asyncio.get_event_loop().run_until_complete(bench_async_client(uri, args.calls, args.concurrency))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Benchmark rendering configuration files: a Mako template rendered `--renders`
+times, and `etc.generate_all` with `--groups` groups made of a Python renderer
+which takes `--latency` ms waiting for middleware calls.
+
+Compares building a `TemplateLookup` and loading the Python renderer on every
+render and generating groups one after the other (how `EtcService` used to
+work) against cached templates and renderers and concurrent groups.
+
+    python bench_etc_render.py [--renders 200] [--groups 20] [--rounds 5] [--latency 20]
+"""
+import argparse
+import asyncio
+import imp
+import logging
+import os
+import sys
+import tempfile
+import time
+
+from mako.lookup import TemplateLookup
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from middlewared.plugins.etc import EtcService  # noqa
+
+TEMPLATE = '''<%
+    shares = [{'name': f'share{i}', 'path': f'/mnt/tank/share{i}', 'ro': i % 2} for i in range(50)]
+%>
+% for share in shares:
+[${share['name']}]
+    path = ${share['path']}
+    read only = ${'yes' if share['ro'] else 'no'}
+% endfor
+'''
+
+RENDERER = '''import asyncio
+
+
+async def render(service, middleware):
+    await asyncio.sleep({latency})
+'''
+
+
+class Middleware(object):
+
+    async def run_in_thread(self, method, *args, **kwargs):
+        return await asyncio.get_event_loop().run_in_executor(None, lambda: method(*args, **kwargs))
+
+
+class LegacyEtcService(EtcService):
+
+    async def generate_all(self):
+        for name in self.GROUPS.keys():
+            await self.generate(name)
+
+
+def legacy_mako(self, path):
+    name = os.path.basename(path)
+    dir = os.path.dirname(path)
+    lookup = TemplateLookup(directories=[dir], module_directory="/tmp/mako/%s" % dir)
+    return lookup.get_template(name)
+
+
+def legacy_py(self, path):
+    name = os.path.basename(path)
+    find = imp.find_module(name, [os.path.dirname(path)])
+    return imp.load_module(name, *find)
+
+
+def service(cls, files_dir, groups):
+    etc = cls(Middleware())
+    etc.logger.setLevel(logging.WARNING)
+    etc.files_dir = files_dir
+    etc.GROUPS = groups
+    return etc
+
+
+async def bench_mako(etc, path, renders):
+    start = time.perf_counter()
+    for i in range(renders):
+        await etc._renderers['mako'].render(path)
+    return (time.perf_counter() - start) / renders
+
+
+async def bench_generate_all(etc, rounds):
+    start = time.perf_counter()
+    for i in range(rounds):
+        await etc.generate_all()
+    return (time.perf_counter() - start) / rounds
+
+
+async def main(args):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        template = os.path.join(tmpdir, 'smb4.conf')
+        with open(template, 'w') as f:
+            f.write(TEMPLATE)
+        groups = {}
+        for i in range(args.groups):
+            with open(os.path.join(tmpdir, f'renderer{i}.py'), 'w') as f:
+                f.write(RENDERER.format(latency=args.latency / 1000))
+            groups[f'group{i}'] = [{'type': 'py', 'path': f'renderer{i}'}]
+
+        legacy = service(LegacyEtcService, tmpdir, groups)
+        legacy._renderers['mako'].get_template = legacy_mako.__get__(legacy._renderers['mako'])
+        legacy._renderers['py'].get_module = legacy_py.__get__(legacy._renderers['py'])
+        etc = service(EtcService, tmpdir, groups)
+
+        for name, bench, args_ in (
+            ('mako render', bench_mako, (template, args.renders)),
+            ('generate_all', bench_generate_all, (args.rounds,)),
+        ):
+            before = await bench(legacy, *args_)
+            after = await bench(etc, *args_)
+            print(f'{name:<14} {before * 1000:>8.2f} ms before, {after * 1000:>8.2f} ms after')
+
+        slowest = next(iter((await etc.render_times()).items()))
+        print(f'slowest file   {slowest[0]} ({slowest[1] * 1000:.1f} ms)')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--renders', type=int, default=200)
+    parser.add_argument('--groups', type=int, default=20)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=20, help='Middleware calls time per renderer in ms')
+    asyncio.get_event_loop().run_until_complete(main(parser.parse_args()))
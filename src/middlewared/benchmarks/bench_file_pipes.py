@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Benchmark download throughput of a job output pipe served over HTTP, comparing
+reading the pipe in a thread with one `run_coroutine_threadsafe` round trip per
+chunk (how `FileApplication.download` used to work) against reading it with
+`Pipe.reader`, and against sending the file with `sendfile` (`filesystem.get`).
+
+The source file is created sparse so disk speed does not matter.
+
+    python bench_file_pipes.py [--size 2048] [--chunk-size 1048576]
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import aiohttp
+from aiohttp import web
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from middlewared.pipe import Pipe  # noqa
+
+
+class Middleware(object):
+
+    async def run_in_thread(self, method, *args, **kwargs):
+        return await asyncio.get_event_loop().run_in_executor(None, lambda: method(*args, **kwargs))
+
+
+def start_job(pipe, path, chunk_size):
+    def copy():
+        with open(path, 'rb') as f:
+            shutil.copyfileobj(f, pipe.w, chunk_size)
+        pipe.w.close()
+    threading.Thread(target=copy, daemon=True).start()
+
+
+async def download_thread(request):
+    app = request.app
+    pipe = Pipe(app['middleware'])
+    start_job(pipe, app['path'], app['chunk_size'])
+
+    resp = web.StreamResponse()
+    await resp.prepare(request)
+    loop = asyncio.get_event_loop()
+
+    def do_copy():
+        while True:
+            read = pipe.r.read(app['chunk_size'])
+            if read == b'':
+                break
+            asyncio.run_coroutine_threadsafe(resp.write(read), loop=loop).result()
+
+    await app['middleware'].run_in_thread(do_copy)
+    await pipe.close()
+    return resp
+
+
+async def download_pipe(request):
+    app = request.app
+    pipe = Pipe(app['middleware'])
+    start_job(pipe, app['path'], app['chunk_size'])
+
+    resp = web.StreamResponse()
+    await resp.prepare(request)
+    reader = await pipe.reader(app['chunk_size'])
+    while True:
+        read = await reader.read(app['chunk_size'])
+        if read == b'':
+            break
+        await resp.write(read)
+    await pipe.close()
+    return resp
+
+
+async def download_sendfile(request):
+    return web.FileResponse(request.app['path'], chunk_size=request.app['chunk_size'])
+
+
+async def bench(socket, name, size):
+    async with aiohttp.ClientSession(connector=aiohttp.UnixConnector(path=socket)) as session:
+        start = time.perf_counter()
+        async with session.get(f'http://localhost/{name}') as resp:
+            received = 0
+            async for chunk in resp.content.iter_any():
+                received += len(chunk)
+        elapsed = time.perf_counter() - start
+
+    assert received == size, (received, size)
+    print(f'{name:<10} {size / elapsed / 1048576:>8.0f} MiB/s ({elapsed:.2f}s)')
+
+
+async def main(args):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'file')
+        size = args.size * 1048576
+        with open(path, 'wb') as f:
+            f.truncate(size)
+
+        app = web.Application()
+        app['middleware'] = Middleware()
+        app['path'] = path
+        app['chunk_size'] = args.chunk_size
+        app.router.add_route('GET', '/thread', download_thread)
+        app.router.add_route('GET', '/pipe', download_pipe)
+        app.router.add_route('GET', '/sendfile', download_sendfile)
+
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        socket = os.path.join(tmpdir, 'middlewared.sock')
+        await web.UnixSite(runner, socket).start()
+        try:
+            for name in ('thread', 'pipe', 'sendfile'):
+                await bench(socket, name, size)
+        finally:
+            await runner.cleanup()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=2048, help='Transfer size in MiB')
+    parser.add_argument('--chunk-size', type=int, default=1048576)
+    asyncio.get_event_loop().run_until_complete(main(parser.parse_args()))
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Benchmark `filter_list` over synthetic snapshot dicts (shaped like
+`zfs.snapshot.query` results), comparing it against the previous
+interpreted implementation.
+
+    python bench_filter_list.py [--rows 100000] [--repeat 3]
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from middlewared.utils import filter_list, get  # noqa
+
+
+def filter_list_interpreted(_list, filters=None, options=None):
+    """
+    `filter_list` as it was before filters were compiled.
+    """
+    opmap = {
+        '=': lambda x, y: x == y,
+        '!=': lambda x, y: x != y,
+        '>': lambda x, y: x > y,
+        '>=': lambda x, y: x >= y,
+        '<': lambda x, y: x < y,
+        '<=': lambda x, y: x <= y,
+        '~': lambda x, y: re.match(y, x),
+        'in': lambda x, y: x in y,
+        'nin': lambda x, y: x not in y,
+        'rin': lambda x, y: y in x,
+        'rnin': lambda x, y: y not in x,
+        '^': lambda x, y: x.startswith(y),
+        '$': lambda x, y: x.endswith(y),
+    }
+
+    filters = filters or {}
+    options = options or {}
+    rv = []
+
+    def filterop(f):
+        name, op, value = f
+        source = get(i, name) if isinstance(i, dict) else getattr(i, name)
+        return bool(opmap[op](source, value))
+
+    for i in _list:
+        valid = True
+        for f in filters:
+            if len(f) == 2:
+                if not any(filterop(f) for f in f[1]):
+                    valid = False
+                    break
+            elif not filterop(f):
+                valid = False
+                break
+        if valid:
+            rv.append(i)
+
+    for o in options.get('order_by') or []:
+        if o.startswith('-'):
+            o = o[1:]
+            reverse = True
+        else:
+            reverse = False
+        rv = sorted(rv, key=lambda x: x[o], reverse=reverse)
+    return rv
+
+
+def snapshots(count):
+    rv = []
+    for i in range(count):
+        dataset = f'tank/share{i % 50}'
+        name = f'{dataset}@auto-{20180101 + i // 50:08d}.0000-2w'
+        rv.append({
+            'id': name,
+            'name': name,
+            'pool': 'tank',
+            'type': 'SNAPSHOT',
+            'snapshot_name': name.split('@')[1],
+            'properties': {
+                'used': {'parsed': i * 4096},
+                'creation': {'parsed': 1514764800 + i * 60},
+            },
+        })
+    return rv
+
+
+CASES = [
+    ('equal', [['pool', '=', 'tank'], ['type', '=', 'SNAPSHOT']], {}),
+    ('regex', [['name', '~', r'^tank/share1[0-9]@auto-']], {}),
+    ('nested', [['properties.used.parsed', '>', 4096 * 50000]], {}),
+    ('OR', [['OR', [['name', '^', 'tank/share1@'], ['name', '^', 'tank/share2@']]]], {}),
+    ('order_by', [['pool', '=', 'tank']], {'order_by': ['-pool', 'name']}),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    data = snapshots(args.rows)
+    print(f'{"case":<10} {"before":>10} {"after":>10} {"speedup":>8}')
+    for name, filters, options in CASES:
+        timings = []
+        for func in (filter_list_interpreted, filter_list):
+            best = None
+            for i in range(args.repeat):
+                start = time.perf_counter()
+                func(data, filters, options)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            timings.append(best)
+        print(f'{name:<10} {timings[0]:>9.3f}s {timings[1]:>9.3f}s {timings[0] / timings[1]:>7.2f}x')
+
+    start = time.perf_counter()
+    filter_list(data, [['pool', '=', 'tank']], {'order_by': ['-name'], 'offset': 100, 'limit': 50})
+    print(f'page of 50 rows (limit/offset) {time.perf_counter() - start:.3f}s')
+
+
+if __name__ == '__main__':
+    main()
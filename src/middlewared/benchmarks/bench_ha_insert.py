@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Benchmark `datastore.insert` like writes (Django model saves) through the
+sqlite3_ha backend on a simulated HA pair: this node is MASTER, looking up the
+failover status takes `--status-latency` ms and queries are replicated to a
+fake standby.
+
+Compares looking up the failover status and parsing every query with sqlparse
+on each write (how `execute_passive` used to work) against the cached failover
+status and parsed statements.
+
+    python bench_ha_insert.py [--inserts 2000] [--status-latency 5]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import types
+
+sys.path.append('/usr/local/www')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+
+def setup(path, status_latency):
+    class notifier(object):
+        def failover_status(self):
+            time.sleep(status_latency)
+            return 'MASTER'
+
+    module = types.ModuleType('freenasUI.middleware.notifier')
+    module.notifier = notifier
+    sys.modules[module.__name__] = module
+
+    from django.conf import settings
+    settings.configure(DATABASES={
+        'default': {
+            'ENGINE': 'freenasUI.freeadmin.sqlite3_ha',
+            'NAME': path,
+        },
+    })
+    import django
+    django.setup()
+
+    from django.db import connection, models
+
+    class Share(models.Model):
+        cifs_path = models.CharField(max_length=255)
+        cifs_name = models.CharField(max_length=120)
+        cifs_comment = models.CharField(max_length=120, blank=True)
+        cifs_ro = models.BooleanField(default=False)
+        cifs_browsable = models.BooleanField(default=True)
+
+        class Meta:
+            app_label = 'sharing'
+            db_table = 'sharing_cifs_share'
+
+    with connection.schema_editor() as editor:
+        editor.create_model(Share)
+    return Share
+
+
+def bench(Share, inserts):
+    start = time.perf_counter()
+    for i in range(inserts):
+        Share.objects.create(cifs_path=f'/mnt/tank/share{i}', cifs_name=f'share{i}', cifs_comment='bench')
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--inserts', type=int, default=2000)
+    parser.add_argument('--status-latency', type=float, default=5, help='Failover status lookup time in ms')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        Share = setup(os.path.join(tmpdir, 'freenas-v1.db'), args.status_latency / 1000)
+
+        from freenasUI.freeadmin.sqlite3_ha import base
+        base.Journal.JOURNAL_FILE = os.path.join(tmpdir, 'ha-journal')
+        standby = []
+        replicator = base.get_replicator()
+        replicator._send = standby.extend
+
+        cached_status, cached_parse = base.failover_status, base.parse_query
+        base.failover_status = types.SimpleNamespace(get=lambda: cached_status._lookup()[0])
+        base.parse_query = cached_parse.__wrapped__
+        before = bench(Share, args.inserts)
+
+        # Within middlewared the failover status is pushed by events
+        cached_status.push()
+        base.failover_status, base.parse_query = cached_status, cached_parse
+        after = bench(Share, args.inserts)
+
+        replicator.flush()
+        assert len(standby) == 2 * args.inserts
+
+        print(f'uncached {args.inserts / before:>9.0f} inserts/sec')
+        print(f'cached   {args.inserts / after:>9.0f} inserts/sec')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Benchmark replication of database writes to the standby node by the sqlite3_ha
+backend, against a local fake standby: a sqlite database the queries are run
+on, one transaction per call, after `--latency` ms.
+
+Compares sending every query in its own call (how `RunSQLRemote` used to work)
+against the batching `Replicator`, then takes the standby offline while
+writing, checks the queries are journaled and replayed in order once it is
+back and that both databases end up the same.
+
+    python bench_ha_replication.py [--queries 5000] [--latency 2] [--outage 2]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append('/usr/local/www')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from freenasUI.freeadmin.sqlite3_ha import base  # noqa
+from freenasUI.middleware.client import ClientException  # noqa
+
+SCHEMA = 'CREATE TABLE account_bsdusers (id INTEGER PRIMARY KEY, bsdusr_username TEXT, bsdusr_uid INTEGER)'
+INSERT = 'INSERT INTO account_bsdusers (bsdusr_username, bsdusr_uid) VALUES (?, ?)'
+
+
+class FakeStandby(object):
+
+    def __init__(self, path, latency):
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute(SCHEMA)
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.online = True
+        self.calls = 0
+
+    def sql_batch(self, queries):
+        time.sleep(self.latency)
+        if not self.online:
+            raise ClientException('Standby is offline')
+        with self.lock:
+            self.calls += 1
+            self.db.execute('BEGIN')
+            for query, params in queries:
+                self.db.execute(query, params)
+            self.db.execute('COMMIT')
+
+    def rows(self):
+        with self.lock:
+            return self.db.execute('SELECT * FROM account_bsdusers ORDER BY id').fetchall()
+
+
+def queries(count, start=0):
+    return [(INSERT, [f'user{i}', 1000 + i]) for i in range(start, start + count)]
+
+
+def bench_per_query(standby, count):
+    start = time.perf_counter()
+    for query in queries(count):
+        thread = threading.Thread(target=standby.sql_batch, args=([query],))
+        thread.start()
+        thread.join()
+    return time.perf_counter() - start
+
+
+def bench_replicator(standby, count):
+    replicator = base.Replicator(send=standby.sql_batch)
+    replicator.start()
+    start = time.perf_counter()
+    for query, params in queries(count):
+        replicator.put(query, params)
+    replicator.flush()
+    return time.perf_counter() - start
+
+
+def bench_outage(standby, count, outage):
+    base.Replicator.RETRY_INTERVAL = 0.5
+    replicator = base.Replicator(send=standby.sql_batch)
+    replicator.start()
+    standby.online = False
+    threading.Timer(outage, lambda: setattr(standby, 'online', True)).start()
+
+    start = time.perf_counter()
+    interval = outage * 2 / count
+    journaled = 0
+    for query, params in queries(count):
+        replicator.put(query, params)
+        time.sleep(interval)
+        if not base.Journal.is_empty():
+            journaled += 1
+    # Make sure the journal gets replayed
+    while not base.Journal.is_empty():
+        time.sleep(0.1)
+        replicator.put('DELETE FROM account_bsdusers WHERE id < 0', [])
+    replicator.flush()
+    return time.perf_counter() - start, journaled
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--queries', type=int, default=5000)
+    parser.add_argument('--latency', type=float, default=2, help='Standby latency per call in ms')
+    parser.add_argument('--outage', type=float, default=2, help='Standby outage in seconds')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base.Journal.JOURNAL_FILE = os.path.join(tmpdir, 'ha-journal')
+
+        for name, bench in (('per query', bench_per_query), ('replicator', bench_replicator)):
+            standby = FakeStandby(os.path.join(tmpdir, f'{name}.db'), args.latency / 1000)
+            elapsed = bench(standby, args.queries)
+            assert len(standby.rows()) == args.queries
+            print(f'{name:<12} {args.queries / elapsed:>9.0f} writes/sec ({standby.calls} calls)')
+
+        primary = sqlite3.connect(os.path.join(tmpdir, 'primary.db'), isolation_level=None)
+        primary.execute(SCHEMA)
+        for query, params in queries(args.queries):
+            primary.execute(query, params)
+
+        standby = FakeStandby(os.path.join(tmpdir, 'outage.db'), args.latency / 1000)
+        elapsed, journaled = bench_outage(standby, args.queries, args.outage)
+        assert standby.rows() == primary.execute('SELECT * FROM account_bsdusers ORDER BY id').fetchall()
+        print(f'outage       {args.queries / elapsed:>9.0f} writes/sec ({journaled} writes while journal '
+              f'was not empty), replayed in order')
+
+
+if __name__ == '__main__':
+    main()
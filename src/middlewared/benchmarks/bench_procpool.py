@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Benchmark small calls run in the middlewared process pool, comparing a new
+websocket connection per call (how `FakeMiddleware._call` used to work)
+against the connection kept for the lifetime of each worker.
+
+Every call runs `BenchService.ping` in a worker, which calls `core.ping`
+back into middlewared, so it needs middlewared running on this system.
+
+    python bench_procpool.py [--calls 1000] [--workers 2,4,8]
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import functools
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from middlewared import worker  # noqa
+from middlewared.client import Client  # noqa
+
+
+class BenchService(object):
+
+    def __init__(self, middleware):
+        self.middleware = middleware
+
+    def ping(self):
+        return self.middleware.call_sync('core.ping')
+
+
+class PerCallConnection(worker.FakeMiddleware):
+
+    async def _call(self, *args, **kwargs):
+        with Client(py_exceptions=True) as c:
+            self.client = c
+            return await super()._call(*args, **kwargs)
+
+
+def init(per_call_connection):
+    worker.worker_init('INFO', 'console')
+    if per_call_connection:
+        worker.MIDDLEWARE = PerCallConnection()
+
+
+async def bench(name, calls, workers, per_call_connection):
+    loop = asyncio.get_event_loop()
+    pool = concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers, initializer=functools.partial(init, per_call_connection),
+    )
+    call = functools.partial(worker.main_worker, '__main__', 'BenchService', 'ping', [], None)
+
+    # Start the workers before measuring
+    await asyncio.gather(*[loop.run_in_executor(pool, call) for i in range(workers)])
+
+    start = time.perf_counter()
+    await asyncio.gather(*[loop.run_in_executor(pool, call) for i in range(calls)])
+    elapsed = time.perf_counter() - start
+    pool.shutdown()
+
+    print(f'{name:<10} workers={workers:<3} {calls / elapsed:>9.0f} calls/sec ({elapsed:.2f}s)')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calls', type=int, default=1000)
+    parser.add_argument('--workers', default='2,4,8')
+    args = parser.parse_args()
+
+    multiprocessing.set_start_method('spawn')
+    loop = asyncio.get_event_loop()
+    for workers in map(int, args.workers.split(',')):
+        loop.run_until_complete(bench('per-call', args.calls, workers, True))
+        loop.run_until_complete(bench('persistent', args.calls, workers, False))
+
+
+if __name__ == '__main__':
+    main()
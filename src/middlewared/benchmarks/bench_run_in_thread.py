@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Compare calls/sec of `Middleware.run_in_thread` using the pooled
+`IoThreadPoolExecutor` against a new one-worker `ThreadPoolExecutor` per call
+(how `run_in_thread` used to work).
+
+    python bench_run_in_thread.py [--calls 20000] [--concurrency 16]
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import functools
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from middlewared.utils.io_thread_pool import IoThreadPoolExecutor  # noqa
+
+
+async def run_in_fresh_thread(loop, method, *args):
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    try:
+        return await loop.run_in_executor(executor, functools.partial(method, *args))
+    finally:
+        executor.shutdown(wait=False)
+
+
+async def run_in_pool(loop, pool, method, *args):
+    return await loop.run_in_executor(pool, functools.partial(method, *args))
+
+
+async def bench(name, run, calls, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            await run(sum, range(10))
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one() for i in range(calls)])
+    elapsed = time.perf_counter() - start
+    print(f'{name:<12} {calls / elapsed:>12.0f} calls/sec ({elapsed:.2f}s)')
+    return calls / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calls', type=int, default=20000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    args = parser.parse_args()
+
+    loop = asyncio.get_event_loop()
+    pool = IoThreadPoolExecutor()
+
+    fresh = loop.run_until_complete(bench(
+        'fresh', functools.partial(run_in_fresh_thread, loop), args.calls, args.concurrency,
+    ))
+    pooled = loop.run_until_complete(bench(
+        'pooled', functools.partial(run_in_pool, loop, pool), args.calls, args.concurrency,
+    ))
+    print(f'speedup      {pooled / fresh:>12.2f}x')
+    print(pool.stats()['threads'], 'pooled threads')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Benchmark `Middleware.send_event` fan-out of `core.get_jobs` progress events
+to simulated websocket clients, comparing the previous per-connection scan
+and JSON encoding (`Application.send_event` scheduling `send_json` for every
+client) against the subscription index with events encoded once.
+
+Every client has a few subscriptions, a quarter of them to `core.get_jobs`
+and some to `*`.
+
+    python bench_send_event.py [--clients 200] [--events 2000]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from middlewared.client import ejson as json  # noqa
+from middlewared.event import EventSendQueue, EventSubscriptions, encode_event  # noqa
+
+SUBSCRIPTIONS = ['alert.list', 'pool.scan', 'system.health', 'failover.status', 'disk.query']
+
+
+class WebSocket(object):
+    """
+    Stands in for `aiohttp.web.WebSocketResponse`, only counting what is written.
+    """
+
+    def __init__(self):
+        self.sent = 0
+        self.bytes = 0
+
+    async def send_json(self, data, dumps):
+        await self.send_str(dumps(data))
+
+    async def send_str(self, data):
+        self.sent += 1
+        self.bytes += len(data)
+
+
+class LegacyClient(object):
+    """
+    How `Application.send_event` used to work.
+    """
+
+    def __init__(self, loop, subscribed):
+        self.loop = loop
+        self.response = WebSocket()
+        self.subscribed = {str(i): name for i, name in enumerate(subscribed)}
+        self.event_sources = {}
+
+    def send_event(self, name, event_type, **kwargs):
+        if not any(i == name or i == '*' for i in self.subscribed.values()):
+            if not any(i['name'] == name for i in self.event_sources.values()):
+                return
+        event = {
+            'msg': event_type.lower(),
+            'collection': name,
+        }
+        kwargs = kwargs.copy()
+        if 'id' in kwargs:
+            event['id'] = kwargs.pop('id')
+        if event_type in ('ADDED', 'CHANGED'):
+            if 'fields' in kwargs:
+                event['fields'] = kwargs.pop('fields')
+        if kwargs:
+            event['extra'] = kwargs
+        asyncio.run_coroutine_threadsafe(self.response.send_json(event, dumps=json.dumps), loop=self.loop)
+
+
+class Client(object):
+
+    def __init__(self):
+        self.response = WebSocket()
+        self.queue = EventSendQueue(self.response.send_str)
+
+    def queue_event(self, key, data):
+        self.queue.put(key, data)
+
+
+def subscriptions_for(i):
+    subscribed = SUBSCRIPTIONS[:i % len(SUBSCRIPTIONS) + 1]
+    if i % 4 == 0:
+        subscribed.append('core.get_jobs')
+    if i % 10 == 0:
+        subscribed.append('*')
+    return subscribed
+
+
+def job_fields(i):
+    return {
+        'id': i % 20,
+        'method': 'pool.scrub',
+        'arguments': [1, 'START'],
+        'state': 'RUNNING',
+        'progress': {'percent': i % 100, 'description': f'Scrubbing {i}', 'extra': None},
+        'result': None,
+        'error': None,
+        'exception': None,
+        'exc_info': None,
+        'time_started': None,
+        'time_finished': None,
+    }
+
+
+async def legacy(clients, events):
+    for i in range(events):
+        for client in clients:
+            client.send_event('core.get_jobs', 'CHANGED', id=i % 20, fields=job_fields(i))
+        # Let the scheduled writes run
+        await asyncio.sleep(0)
+
+
+async def indexed(subscriptions, clients, events):
+    tasks = [asyncio.ensure_future(client.queue.run()) for client in clients]
+    for i in range(events):
+        subscribers = subscriptions.get('core.get_jobs')
+        if subscribers:
+            key, data = encode_event('core.get_jobs', 'CHANGED', {'id': i % 20, 'fields': job_fields(i)})
+            for client in subscribers:
+                client.queue_event(key, data)
+        await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    for task in tasks:
+        task.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=200)
+    parser.add_argument('--events', type=int, default=2000)
+    args = parser.parse_args()
+
+    loop = asyncio.get_event_loop()
+
+    clients = [LegacyClient(loop, subscriptions_for(i)) for i in range(args.clients)]
+    start = time.perf_counter()
+    loop.run_until_complete(legacy(clients, args.events))
+    # Drain writes scheduled by run_coroutine_threadsafe
+    loop.run_until_complete(asyncio.sleep(0.1))
+    elapsed = time.perf_counter() - start - 0.1
+    sent = sum(c.response.sent for c in clients)
+    print(f'legacy   {elapsed * 1000:9.2f}ms  {elapsed / args.events * 1e6:8.1f}us/event  {sent} messages')
+
+    subscriptions = EventSubscriptions()
+    clients = [Client() for i in range(args.clients)]
+    for i, client in enumerate(clients):
+        for name in subscriptions_for(i):
+            subscriptions.add(name, client)
+    start = time.perf_counter()
+    loop.run_until_complete(indexed(subscriptions, clients, args.events))
+    elapsed = time.perf_counter() - start
+    sent = sum(c.response.sent for c in clients)
+    coalesced = sum(c.queue.coalesced for c in clients)
+    print(f'indexed  {elapsed * 1000:9.2f}ms  {elapsed / args.events * 1e6:8.1f}us/event  {sent} messages'
+          f' ({coalesced} coalesced)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Benchmark the service status probing done by `service.query` (one probe per
+row of `services.services`), comparing forking `/bin/pgrep` through a shell
+(how `ServiceService._started` used to work) against the in-process `pgrep`
+and against a cached status.
+
+    python bench_service_query.py [--services 30] [--repeat 20]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from subprocess import PIPE
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from middlewared.common.pgrep import pgrep  # noqa
+from middlewared.utils.io_thread_pool import IoThreadPoolExecutor  # noqa
+
+
+async def started_fork(procname, pidfile):
+    if pidfile:
+        cmd = '/bin/pgrep -F {}{}'.format(pidfile, ' ' + procname if procname else '')
+    else:
+        cmd = '/bin/pgrep {}'.format(procname)
+    proc = await asyncio.create_subprocess_shell(cmd, stdout=PIPE, stderr=PIPE, close_fds=True)
+    data = (await proc.communicate())[0].decode()
+    if proc.returncode == 0:
+        return True, [int(i) for i in data.strip().split('\n') if i.isdigit()]
+    return False, []
+
+
+def started_native_factory(pool):
+    async def started_native(procname, pidfile):
+        pids = await asyncio.get_event_loop().run_in_executor(pool, pgrep, procname, pidfile)
+        return bool(pids), pids
+    return started_native
+
+
+def started_cached_factory(pool, ttl=5):
+    cache = {}
+    native = started_native_factory(pool)
+
+    async def started_cached(procname, pidfile):
+        key = (procname, pidfile)
+        cached = cache.get(key)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+        cache[key] = (time.monotonic() + ttl, await native(procname, pidfile))
+        return cache[key][1]
+    return started_cached
+
+
+async def query(started, services):
+    return await asyncio.gather(*[started(procname, pidfile) for procname, pidfile in services])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--services', type=int, default=30)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    procname = os.path.basename(sys.executable)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        services = []
+        for i in range(args.services):
+            if i % 5 == 0:
+                # Services without a pidfile (e.g. nfs, afp) look up the process name
+                services.append((procname, None))
+                continue
+            pidfile = os.path.join(tmpdir, f'service{i}.pid')
+            # Half of the services are running
+            if i % 2:
+                with open(pidfile, 'w') as f:
+                    f.write(f'{os.getpid()}\n')
+            services.append((procname, pidfile))
+
+        pool = IoThreadPoolExecutor(max_workers=32)
+        loop = asyncio.get_event_loop()
+
+        results = []
+        for name, started in (
+            ('fork', started_fork),
+            ('native', started_native_factory(pool)),
+            ('cached', started_cached_factory(pool)),
+        ):
+            timings = []
+            for i in range(args.repeat):
+                start = time.perf_counter()
+                results.append(loop.run_until_complete(query(started, services)))
+                timings.append(time.perf_counter() - start)
+            timings.sort()
+            print(f'{name:<8} median {timings[len(timings) // 2] * 1000:8.2f}ms  max {timings[-1] * 1000:8.2f}ms')
+
+        pool.shutdown()
+
+    assert all(
+        [r[0] for r in result] == [r[0] for r in results[0]] for result in results
+    ), 'probes disagree'
+
+
+if __name__ == '__main__':
+    main()
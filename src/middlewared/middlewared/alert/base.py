@@ -75,6 +75,9 @@ class AlertSource:
 
     run_on_backup_node = True
 
+    # Seconds `check` can run for before an "alert source timed out" alert is raised instead
+    timeout = 120
+
     def __init__(self, middleware):
         self.middleware = middleware
 
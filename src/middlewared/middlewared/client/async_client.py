@@ -0,0 +1,252 @@
+from . import ejson as json
+from .client import CALL_TIMEOUT, CallTimeout, ClientException, ValidationErrors
+
+from base64 import b64decode
+import aiohttp
+import asyncio
+import pickle
+import urllib.parse
+import uuid
+
+
+class AsyncClient(object):
+    """
+    asyncio client for middlewared.
+
+    Calls are multiplexed over a single connection: every call is sent right
+    away and its result is matched by id, so many calls can be in flight at
+    once (e.g. using `asyncio.gather`).
+
+        async with AsyncClient() as c:
+            await c.call('auth.login', 'root', password)
+            await asyncio.gather(*[c.call('disk.query') for i in range(10)])
+    """
+
+    def __init__(self, uri=None, py_exceptions=False, loop=None):
+        if uri is None:
+            uri = 'ws+unix:///var/run/middlewared.sock'
+        self._uri = uri
+        self._py_exceptions = py_exceptions
+        self._loop = loop or asyncio.get_event_loop()
+        self._session = None
+        self._ws = None
+        self._receiver = None
+        self._send_lock = asyncio.Lock()
+        self._calls = {}
+        self._pings = {}
+        self._subscriptions = {}
+        self._closed = False
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, typ, value, traceback):
+        await self.close()
+
+    async def connect(self, timeout=10):
+        uri = urllib.parse.urlparse(self._uri)
+        if uri.scheme == 'ws+unix':
+            connector = aiohttp.UnixConnector(path=uri.path)
+            url = 'ws://localhost/websocket'
+        else:
+            connector = None
+            url = self._uri
+
+        self._session = aiohttp.ClientSession(connector=connector)
+        try:
+            self._ws = await self._session.ws_connect(url, timeout=timeout, max_msg_size=0)
+            self._receiver = asyncio.ensure_future(self._receive(), loop=self._loop)
+
+            connected = self._loop.create_future()
+            self._calls[None] = connected
+            features = ['PY_EXCEPTIONS'] if self._py_exceptions else []
+            await self._send({
+                'msg': 'connect',
+                'version': '1',
+                'support': ['1'],
+                'features': features,
+            })
+            try:
+                await asyncio.wait_for(connected, timeout)
+            except asyncio.TimeoutError:
+                raise ClientException('Failed connection handshake')
+        except Exception:
+            await self.close()
+            raise
+
+    async def _send(self, data):
+        async with self._send_lock:
+            await self._ws.send_str(json.dumps(data))
+
+    async def _receive(self):
+        try:
+            async for msg in self._ws:
+                if msg.type != aiohttp.WSMsgType.TEXT:
+                    break
+                try:
+                    self._recv(json.loads(msg.data))
+                except Exception:
+                    # A broken message or callback must not stop the connection
+                    continue
+        finally:
+            self._closed = True
+            error = ClientException('Connection closed')
+            futures = list(self._calls.values()) + list(self._pings.values()) + [
+                subscription['ready'] for subscription in self._subscriptions.values()
+            ]
+            for future in futures:
+                if not future.done():
+                    future.set_exception(error)
+            self._calls.clear()
+            self._pings.clear()
+            self._subscriptions.clear()
+
+    def _recv(self, message):
+        _id = message.get('id')
+        msg = message.get('msg')
+        if msg == 'connected':
+            self._resolve(self._calls.pop(None, None), message)
+        elif msg == 'failed':
+            future = self._calls.pop(None, None)
+            if future is not None and not future.done():
+                future.set_exception(ClientException('Unsupported protocol version'))
+        elif msg == 'pong':
+            self._resolve(self._pings.pop(_id, None), True)
+        elif msg == 'result':
+            self._resolve(self._calls.pop(_id, None), message)
+        elif msg in ('added', 'changed', 'removed'):
+            for subscription in list(self._subscriptions.values()):
+                if subscription['name'] in (message.get('collection'), '*'):
+                    subscription['callback'](msg.upper(), **message)
+        elif msg in ('ready', 'nosub'):
+            for subid in message.get('subs') or [_id]:
+                subscription = self._subscriptions.get(subid)
+                if subscription is not None:
+                    self._resolve(subscription['ready'], message)
+
+    @staticmethod
+    def _resolve(future, result):
+        if future is not None and not future.done():
+            future.set_result(result)
+
+    def _raise_error(self, error):
+        py_exception = error.get('py_exception')
+        if self._py_exceptions and py_exception:
+            raise pickle.loads(b64decode(py_exception))
+        if error.get('trace') and error.get('type') == 'VALIDATION':
+            raise ValidationErrors(error.get('extra'))
+        raise ClientException(error.get('reason'), error.get('error'), error.get('trace'), error.get('extra'))
+
+    async def call(self, method, *params, timeout=CALL_TIMEOUT, job=False, callback=None):
+        """
+        Call `method` with `params`.
+
+        With `job` the job started by `method` is waited for using `core.job_wait`,
+        so events of other jobs are not received. Events of jobs are only
+        subscribed to if a progress `callback` is given.
+        """
+        if self._closed:
+            raise ClientException('Connection closed')
+
+        _id = str(uuid.uuid4())
+        future = self._calls[_id] = self._loop.create_future()
+        try:
+            await self._send({
+                'msg': 'method',
+                'method': method,
+                'id': _id,
+                'params': params,
+            })
+            message = await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise CallTimeout('Call timeout')
+        finally:
+            self._calls.pop(_id, None)
+
+        if 'error' in message:
+            self._raise_error(message['error'])
+
+        if job:
+            return await self._wait_job(message.get('result'), callback)
+        return message.get('result')
+
+    async def _wait_job(self, job_id, callback):
+        subscription = None
+        if callback is not None:
+            def on_job(mtype, **message):
+                fields = message.get('fields')
+                if fields and message.get('id') == job_id:
+                    callback(fields)
+
+            subscription = await self.subscribe('core.get_jobs', on_job)
+
+        try:
+            job = await self.call('core.job_wait', job_id, timeout=None)
+        finally:
+            if subscription is not None:
+                await self.unsubscribe(subscription)
+
+        if job['state'] != 'SUCCESS':
+            if job['exc_info'] and job['exc_info']['type'] == 'VALIDATION':
+                raise ValidationErrors(job['exc_info']['extra'])
+            raise ClientException(job['error'], trace=job['exception'])
+        return job['result']
+
+    async def subscribe(self, name, callback):
+        """
+        Subscribe to events `name`, calling `callback(event_type, **message)` for each one.
+
+        Returns:
+            str: subscription id to be used with `unsubscribe`
+        """
+        if self._closed:
+            raise ClientException('Connection closed')
+
+        _id = str(uuid.uuid4())
+        ready = self._loop.create_future()
+        self._subscriptions[_id] = {
+            'name': name,
+            'callback': callback,
+            'ready': ready,
+        }
+        await self._send({
+            'msg': 'sub',
+            'id': _id,
+            'name': name,
+        })
+        message = await ready
+        if message['msg'] == 'nosub':
+            self._subscriptions.pop(_id, None)
+            raise ClientException((message.get('error') or {}).get('error') or f'Failed to subscribe to {name}')
+        return _id
+
+    async def unsubscribe(self, _id):
+        if self._subscriptions.pop(_id, None) is not None and not self._closed:
+            await self._send({
+                'msg': 'unsub',
+                'id': _id,
+            })
+
+    async def ping(self, timeout=10):
+        _id = str(uuid.uuid4())
+        future = self._pings[_id] = self._loop.create_future()
+        await self._send({
+            'msg': 'ping',
+            'id': _id,
+        })
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self._pings.pop(_id, None)
+
+    async def close(self):
+        self._closed = True
+        if self._ws is not None:
+            await self._ws.close()
+        if self._receiver is not None:
+            await self._receiver
+        if self._session is not None:
+            await self._session.close()
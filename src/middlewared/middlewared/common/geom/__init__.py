@@ -0,0 +1,135 @@
+from collections import defaultdict
+from xml.etree import ElementTree
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class GeomTopology(object):
+    """
+    Indexed view of the GEOM tree as reported by `kern.geom.confxml`.
+
+    Parsing the whole tree is expensive on systems with hundreds of disks,
+    so it is meant to be built once and shared (see `geom.cache`).
+
+    Attributes:
+        providers: dict(provider name) = dict(name, class, geom, mediasize, sectorsize, stripesize, config)
+        geoms: dict(class name) = dict(geom name) = dict(name, providers, consumers)
+        disks: dict(disk name) = dict(name, mediasize, sectorsize, stripesize, **config)
+        partitions: dict(partition name) = dict(name, disk, mediasize, config)
+        labels: dict(label name) = device name the label points to
+        serials: dict(serial) = disk name
+    """
+
+    def __init__(self, confxml):
+        root = ElementTree.fromstring(confxml)
+
+        self.providers = {}
+        self.geoms = defaultdict(dict)
+
+        by_id = {}
+        consumers = []
+        for klass in root.findall('./class'):
+            class_name = klass.findtext('name')
+            for g in klass.findall('./geom'):
+                geom = {
+                    'name': g.findtext('name'),
+                    'providers': [],
+                    'consumers': [],
+                }
+                for p in g.findall('./provider'):
+                    config = p.find('./config')
+                    provider = {
+                        'name': p.findtext('name'),
+                        'class': class_name,
+                        'geom': geom['name'],
+                        'mediasize': _int(p.findtext('mediasize')),
+                        'sectorsize': _int(p.findtext('sectorsize')),
+                        'stripesize': _int(p.findtext('stripesize')),
+                        'config': {c.tag: c.text for c in config} if config is not None else {},
+                    }
+                    by_id[p.get('id')] = provider
+                    self.providers[provider['name']] = provider
+                    geom['providers'].append(provider['name'])
+                for c in g.findall('./consumer/provider'):
+                    consumers.append((geom, c.get('ref')))
+                self.geoms[class_name][geom['name']] = geom
+
+        # Consumers may reference providers of classes defined later in the tree
+        for geom, ref in consumers:
+            if ref in by_id:
+                geom['consumers'].append(by_id[ref]['name'])
+
+        self.disks = {}
+        self.serials = {}
+        for name, geom in self.geoms['DISK'].items():
+            if not geom['providers']:
+                continue
+            provider = self.providers[geom['providers'][0]]
+            disk = {
+                'name': name,
+                'mediasize': provider['mediasize'],
+                'sectorsize': provider['sectorsize'],
+                'stripesize': provider['stripesize'],
+            }
+            disk.update(provider['config'])
+            self.disks[name] = disk
+            if provider['config'].get('ident'):
+                self.serials.setdefault(provider['config']['ident'], name)
+
+        self.partitions = {}
+        for name, geom in self.geoms['PART'].items():
+            for provider in map(self.providers.get, geom['providers']):
+                self.partitions[provider['name']] = {
+                    'name': provider['name'],
+                    'disk': name,
+                    'mediasize': provider['mediasize'],
+                    'config': provider['config'],
+                }
+
+        self.labels = {}
+        for name, geom in self.geoms['LABEL'].items():
+            for label in geom['providers']:
+                self.labels[label] = name
+
+    def label_to_dev(self, label):
+        """
+        Device (e.g. ada0p2) a label (e.g. gptid/<uuid>) points to.
+        """
+        return self.labels.get(label)
+
+    def label_to_disk(self, label):
+        """
+        Disk (e.g. ada0) a label or a partition belongs to.
+        """
+        dev = self.label_to_dev(label) or label
+        partition = self.partitions.get(dev)
+        if partition:
+            return partition['disk']
+
+    def dev_to_disk(self, dev):
+        """
+        Disk a device used by ZFS (label, partition or whole disk) is on,
+        following the consumer of its LABEL or DEV geom.
+        """
+        geom = self.geoms['LABEL'].get(self.labels.get(dev)) if dev in self.labels else None
+        if geom is None:
+            geom = self.geoms['DEV'].get(dev)
+        if geom is None or not geom['consumers']:
+            return None
+        name = self.providers[geom['consumers'][0]]['geom']
+        if name in self.disks:
+            return name
+
+    def serial_to_disk(self, serial):
+        return self.serials.get(serial)
+
+    def has_partitions(self, disk):
+        return disk in self.geoms['PART']
+
+    def geom_by_name(self, class_name, name):
+        return self.geoms[class_name].get(name)
@@ -0,0 +1,43 @@
+import re
+
+import psutil
+
+
+def pgrep(procname=None, pidfile=None):
+    """
+    In-process equivalent of `pgrep [-F pidfile] [procname]`.
+
+    `procname` is a regular expression searched in the process name.
+    If `pidfile` is given only the process it refers to is considered.
+
+    Returns:
+        list(int): pids of the matching processes
+    """
+    if pidfile:
+        try:
+            with open(pidfile) as f:
+                pid = int(f.readline().strip())
+        except (OSError, ValueError):
+            return []
+
+        try:
+            process = psutil.Process(pid)
+            if procname and not re.search(procname, process.name()):
+                return []
+        except psutil.Error:
+            return []
+
+        return [pid]
+
+    if not procname:
+        return []
+
+    pattern = re.compile(procname)
+    pids = []
+    for process in psutil.process_iter():
+        try:
+            if pattern.search(process.name()):
+                pids.append(process.pid)
+        except psutil.Error:
+            continue
+    return pids
@@ -1,6 +1,10 @@
+from collections import Counter, defaultdict, deque
 import asyncio
+import fnmatch
 import threading
 
+from .client import ejson as json
+
 
 class EventSource(object):
 
@@ -24,3 +28,150 @@ class EventSource(object):
 
     def cancel(self):
         self._cancel.set()
+
+
+def encode_event(name, event_type, kwargs):
+    """
+    Build and JSON-encode an event message, so it is serialized only once no
+    matter how many connections it is sent to.
+
+    Returns:
+        tuple(key, str): `key` identifies which queued events the message supersedes
+            (None if it should not replace any), see `EventSendQueue`.
+    """
+    event = {
+        'msg': event_type.lower(),
+        'collection': name,
+    }
+    kwargs = kwargs.copy()
+    if 'id' in kwargs:
+        event['id'] = kwargs.pop('id')
+    if event_type in ('ADDED', 'CHANGED'):
+        if 'fields' in kwargs:
+            event['fields'] = kwargs.pop('fields')
+    if event_type == 'CHANGED':
+        if 'cleared' in kwargs:
+            event['cleared'] = kwargs.pop('cleared')
+    if kwargs:
+        event['extra'] = kwargs
+
+    key = None
+    if event_type == 'CHANGED' and 'id' in event and 'fields' in event and set(event) == {
+        'msg', 'collection', 'id', 'fields',
+    }:
+        # A newer CHANGED event with the same fields supersedes it
+        key = (name, event['id'], tuple(sorted(event['fields'])))
+    return key, json.dumps(event)
+
+
+class EventSubscriptions(object):
+    """
+    Index of the connections subscribed to each event name.
+
+    Names can have wildcards (`*` for every event, `pool.*`), matched with `fnmatch`.
+    It can be queried from any thread.
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__names = defaultdict(Counter)
+        self.__patterns = defaultdict(Counter)
+
+    def add(self, name, subscriber):
+        with self.__lock:
+            (self.__patterns if '*' in name else self.__names)[name][subscriber] += 1
+
+    def remove(self, name, subscriber):
+        with self.__lock:
+            index = self.__patterns if '*' in name else self.__names
+            subscribers = index.get(name)
+            if not subscribers or subscriber not in subscribers:
+                return
+            subscribers[subscriber] -= 1
+            if subscribers[subscriber] <= 0:
+                del subscribers[subscriber]
+            if not subscribers:
+                del index[name]
+
+    def get(self, name):
+        """
+        Returns the set of subscribers of `name`.
+        """
+        with self.__lock:
+            rv = set(self.__names.get(name, ()))
+            for pattern, subscribers in self.__patterns.items():
+                if fnmatch.fnmatchcase(name, pattern):
+                    rv.update(subscribers)
+        return rv
+
+
+class EventSendQueue(object):
+    """
+    Bounded queue of encoded events waiting to be written to a connection.
+
+    An event superseding a queued event (same key) replaces it, the older one is
+    not sent. When the queue is full the oldest event is dropped, so a slow
+    consumer cannot make memory grow without limits.
+    """
+
+    def __init__(self, send, maxsize=1000):
+        """
+        `send` is a coroutine function writing an encoded event to the connection.
+        """
+        self.send = send
+        self.maxsize = maxsize
+        self.dropped = 0
+        self.coalesced = 0
+        self.__queue = deque()
+        self.__keys = {}
+        self.__ready = asyncio.Event()
+
+    def __len__(self):
+        return len(self.__queue)
+
+    def put(self, key, data):
+        """
+        Queue an encoded event, must be called from the event loop.
+
+        Returns:
+            bool: False if an older event had to be dropped.
+        """
+        if key is not None:
+            entry = self.__keys.get(key)
+            if entry is not None:
+                # Skip it instead of replacing in place so events are still sent in order
+                entry[1] = None
+                self.coalesced += 1
+
+        rv = True
+        if len(self.__queue) >= self.maxsize:
+            old = self.__queue.popleft()
+            old_key, old_data = old
+            # Key may now belong to the newer event that replaced this one
+            if old_key is not None and self.__keys.get(old_key) is old:
+                del self.__keys[old_key]
+            # An event replaced by a newer one is not lost
+            if old_data is not None:
+                self.dropped += 1
+                rv = False
+
+        entry = [key, data]
+        self.__queue.append(entry)
+        if key is not None:
+            self.__keys[key] = entry
+        self.__ready.set()
+        return rv
+
+    async def run(self):
+        """
+        Write queued events until cancelled or the connection fails.
+        """
+        while True:
+            await self.__ready.wait()
+            self.__ready.clear()
+            while self.__queue:
+                key, data = entry = self.__queue.popleft()
+                if key is not None and self.__keys.get(key) is entry:
+                    del self.__keys[key]
+                if data is not None:
+                    await self.send(data)
@@ -1,8 +1,9 @@
 import asyncio
-from collections import OrderedDict
+from collections import defaultdict, OrderedDict
 import copy
 from datetime import datetime
 import enum
+import heapq
 import logging
 import os
 import sys
@@ -15,6 +16,9 @@ from middlewared.pipe import Pipes
 
 logger = logging.getLogger(__name__)
 
+# Minimum interval (in seconds) between progress events of a job
+PROGRESS_INTERVAL = 0.5
+
 
 class State(enum.Enum):
     WAITING = 1
@@ -24,6 +28,16 @@ class State(enum.Enum):
     ABORTED = 5
 
 
+class Priority(enum.IntEnum):
+    """
+    Priority class of a job. Among the jobs ready to run, jobs of a lower
+    class are started first.
+    """
+    INTERACTIVE = 0
+    NORMAL = 1
+    BACKGROUND = 2
+
+
 class JobSharedLock(object):
     """
     Shared lock for jobs.
@@ -35,17 +49,21 @@ class JobSharedLock(object):
     def __init__(self, queue, name):
         self.queue = queue
         self.name = name
-        self.jobs = []
+        self.jobs = set()
         self.semaphore = asyncio.Semaphore()
+        # Jobs waiting for this lock, in order of arrival
+        self.queued = OrderedDict()
+        # Jobs that were ready to run while the lock was held (heap)
+        self.blocked = []
 
     def add_job(self, job):
-        self.jobs.append(job)
+        self.jobs.add(job)
 
     def get_jobs(self):
         return self.jobs
 
     def remove_job(self, job):
-        self.jobs.remove(job)
+        self.jobs.discard(job)
 
     def locked(self):
         return self.semaphore.locked()
@@ -58,11 +76,19 @@ class JobSharedLock(object):
 
 
 class JobsQueue(object):
+    """
+    Jobs are scheduled from a heap of jobs ready to run, ordered by priority
+    class and then by arrival. A job found blocked by its lock or by the
+    `max_concurrency` of its method is parked on a heap of the lock or method
+    and only the first one is made ready again when it is released, so each
+    dispatch is O(log n) however many jobs are waiting.
+    """
 
     def __init__(self, middleware):
         self.middleware = middleware
         self.deque = JobsDeque()
-        self.queue = []
+        self.ready = []
+        self.sequence = 0
 
         # Event responsible for the job queue schedule loop.
         # This event is set and a new job is potentially ready to run
@@ -71,6 +97,20 @@ class JobsQueue(object):
         # Shared lock (JobSharedLock) dict
         self.job_locks = {}
 
+        # Per method number of running jobs and jobs blocked by `max_concurrency` (heap)
+        self.running = defaultdict(int)
+        self.blocked = defaultdict(list)
+
+        self.times = {}
+        self.methods_stats = defaultdict(lambda: {
+            'waiting': 0,
+            'running': 0,
+            'finished': 0,
+            'wait_total': 0.0,
+            'wait_max': 0.0,
+            'run_total': 0.0,
+        })
+
     def __getitem__(self, item):
         return self.deque[item]
 
@@ -81,14 +121,21 @@ class JobsQueue(object):
         return self.deque.all()
 
     def add(self, job):
-        if job.options["lock_queue_size"] is not None:
-            lock = self.get_lock(job)
-            queued_jobs = [another_job for another_job in self.queue if self.get_lock(another_job) is lock]
-            if len(queued_jobs) >= job.options["lock_queue_size"]:
-                return queued_jobs[-1]
+        lock = self.get_lock(job)
+        if lock is not None:
+            if job.options["lock_queue_size"] is not None and lock.queued:
+                if len(lock.queued) >= job.options["lock_queue_size"]:
+                    return next(reversed(lock.queued.values()))
+            lock.add_job(job)
 
         self.deque.add(job)
-        self.queue.append(job)
+        if lock is not None:
+            lock.queued[job.id] = job
+
+        self.sequence += 1
+        heapq.heappush(self.ready, (job.priority, self.sequence, job, lock))
+        self.times[job.id] = time.monotonic()
+        self.methods_stats[job.method_name]['waiting'] += 1
 
         if not job.options["transient"]:
             self.middleware.send_event('core.get_jobs', 'ADDED', id=job.id, fields=job.__encode__())
@@ -105,7 +152,11 @@ class JobsQueue(object):
         """
         Get a shared lock for a job
         """
-        name = job.get_lock_name()
+        try:
+            name = job.get_lock_name()
+        except Exception:
+            logger.error('Failed to get lock for %r', job, exc_info=True)
+            return None
         if name is None:
             return None
 
@@ -113,7 +164,6 @@ class JobsQueue(object):
         if lock is None:
             lock = JobSharedLock(self, name)
             self.job_locks[lock.name] = lock
-        lock.add_job(job)
         return lock
 
     def release_lock(self, job):
@@ -129,7 +179,48 @@ class JobsQueue(object):
 
         # Once a lock is released there could be another job in the queue
         # waiting for the same lock
-        self.queue_event.set()
+        self.unblock(lock.blocked)
+
+    def release(self, job):
+        """
+        Release everything held by a finished `job`.
+        """
+        self.release_lock(job)
+
+        self.running[job.method_name] -= 1
+        self.unblock(self.blocked[job.method_name])
+        if self.running[job.method_name] == 0 and not self.blocked[job.method_name]:
+            self.running.pop(job.method_name)
+            self.blocked.pop(job.method_name)
+
+        stats = self.methods_stats[job.method_name]
+        stats['running'] -= 1
+        stats['finished'] += 1
+        stats['run_total'] += time.monotonic() - self.times.pop(job.id)
+
+    def blocked_by(self, job, lock):
+        """
+        Heap of the lock or method blocking `job` from running, if any.
+        """
+        if lock is not None and lock.locked():
+            return lock.blocked
+        max_concurrency = job.options.get("max_concurrency")
+        if max_concurrency and self.running[job.method_name] >= max_concurrency:
+            return self.blocked[job.method_name]
+        return None
+
+    def unblock(self, heap):
+        """
+        Make the first job of `heap` not blocked by anything else ready to run.
+        """
+        while heap:
+            entry = heapq.heappop(heap)
+            blocked = self.blocked_by(entry[2], entry[3])
+            if blocked is None:
+                heapq.heappush(self.ready, entry)
+                self.queue_event.set()
+                return
+            heapq.heappush(blocked, entry)
 
     async def __next__(self):
         """
@@ -139,29 +230,45 @@ class JobsQueue(object):
         while True:
             # Awaits a new event to look for a job
             await self.queue_event.wait()
-            found = None
-            for job in self.queue:
-                try:
-                    lock = self.get_lock(job)
-                except Exception:
-                    logger.error('Failed to get lock for %r', job, exc_info=True)
-                    lock = None
-                # Get job in the queue if it has no lock or its not locked
-                if lock is None or not lock.locked():
-                    found = job
-                    if lock:
-                        await job.set_lock(lock)
-                    break
-            if found:
-                # Unlocked job found to run
-                self.queue.remove(found)
-                # If there are no more jobs in the queue, clear the event
-                if len(self.queue) == 0:
+            while self.ready:
+                entry = heapq.heappop(self.ready)
+                job, lock = entry[2], entry[3]
+                blocked = self.blocked_by(job, lock)
+                if blocked is not None:
+                    heapq.heappush(blocked, entry)
+                    continue
+
+                if lock:
+                    lock.queued.pop(job.id)
+                    await job.set_lock(lock)
+                self.running[job.method_name] += 1
+
+                now = time.monotonic()
+                wait = now - self.times[job.id]
+                self.times[job.id] = now
+                stats = self.methods_stats[job.method_name]
+                stats['waiting'] -= 1
+                stats['running'] += 1
+                stats['wait_total'] += wait
+                stats['wait_max'] = max(stats['wait_max'], wait)
+
+                # If there are no more jobs ready to run, clear the event
+                if not self.ready:
                     self.queue_event.clear()
-                return found
-            else:
-                # No jobs available to run, clear the event
-                self.queue_event.clear()
+                return job
+            # No jobs available to run, clear the event
+            self.queue_event.clear()
+
+    def stats(self):
+        return {
+            name: dict(
+                stats,
+                wait_avg=stats['wait_total'] / (stats['running'] + stats['finished'])
+                if stats['running'] + stats['finished'] else 0.0,
+                run_avg=stats['run_total'] / stats['finished'] if stats['finished'] else 0.0,
+            )
+            for name, stats in self.methods_stats.items()
+        }
 
     async def run(self):
         while True:
@@ -223,6 +330,7 @@ class Job(object):
 
         self.id = None
         self.lock = None
+        self.priority = Priority[options.get("priority") or "NORMAL"]
         self.result = None
         self.error = None
         self.exception = None
@@ -242,6 +350,10 @@ class Job(object):
         self.logs_fd = None
         self.logs_excerpt = None
 
+        self.__progress_lock = threading.Lock()
+        self.__progress_sent_at = 0
+        self.__progress_scheduled = False
+
         if self.options["check_pipes"]:
             for pipe in self.options["pipes"]:
                 self.check_pipe(pipe)
@@ -254,9 +366,16 @@ class Job(object):
         self.id = id
 
     def get_lock_name(self):
-        lock_name = self.options.get('lock')
+        return self.lock_name(self.options, self.args)
+
+    @staticmethod
+    def lock_name(options, args):
+        """
+        Name of the lock of a job with `options` called with `args`.
+        """
+        lock_name = options.get('lock')
         if callable(lock_name):
-            lock_name = lock_name(self.args)
+            lock_name = lock_name(args)
         return lock_name
 
     def get_lock(self):
@@ -292,7 +411,35 @@ class Job(object):
             self.progress['description'] = description
         if extra:
             self.progress['extra'] = extra
-        self.middleware.send_event('core.get_jobs', 'CHANGED', id=self.id, fields=self.__encode__())
+
+        # Progress can be set many times per second, send at most one event per `PROGRESS_INTERVAL`
+        # with the latest progress. Can be called from any thread.
+        with self.__progress_lock:
+            if self.__progress_scheduled:
+                return
+            delay = self.__progress_sent_at + PROGRESS_INTERVAL - time.monotonic()
+            if delay > 0:
+                self.__progress_scheduled = True
+
+        if delay > 0:
+            self.loop.call_soon_threadsafe(self.loop.call_later, delay, self.__send_progress)
+        else:
+            self.__send_progress()
+
+    def __send_progress(self):
+        with self.__progress_lock:
+            self.__progress_scheduled = False
+            self.__progress_sent_at = time.monotonic()
+
+        if self.state in (State.SUCCESS, State.FAILED, State.ABORTED):
+            # Already sent with the full record
+            return
+
+        self.middleware.send_job_event(self, {
+            'id': self.id,
+            'state': self.state.name,
+            'progress': self.progress,
+        })
 
     async def wait(self, timeout=None):
         if timeout is None:
@@ -332,6 +479,8 @@ class Job(object):
             self.logs_fd = open(self.logs_path, "wb")
 
         self.set_state('RUNNING')
+        if not self.options['transient']:
+            self.middleware.send_event('core.get_jobs', 'CHANGED', id=self.id, fields=self.__encode__())
         try:
             self.future = asyncio.ensure_future(self.__run_body())
             await self.future
@@ -344,7 +493,7 @@ class Job(object):
             await self.__close_logs()
             await self.__close_pipes()
 
-            queue.release_lock(self)
+            queue.release(self)
             self._finished.set()
             if self.options['transient']:
                 queue.remove(self.id)
@@ -1,12 +1,13 @@
 from .apidocs import app as apidocs_app
 from .client import ejson as json
-from .event import EventSource
-from .job import Job, JobsQueue
-from .pipe import Pipes, Pipe
+from .event import EventSendQueue, EventSource, EventSubscriptions, encode_event
+from .job import Job, JobsQueue, Priority
+from .pipe import CHUNK_SIZE as PIPE_CHUNK_SIZE, Pipes, Pipe
 from .restful import RESTfulAPI
 from .schema import Error as SchemaError, Schemas
 from .service import CallError, CallException, ValidationError, ValidationErrors
 from .utils import start_daemon_thread, load_modules, load_classes
+from .utils.io_thread_pool import IoThreadPoolExecutor
 from .webui_auth import WebUIAuth
 from .worker import main_worker, worker_init
 from aiohttp import web
@@ -41,6 +42,17 @@ import uuid
 from . import logger
 
 
+# Upper bound of the default number of process pool workers, each one is a full python process
+PROCPOOL_MAX_WORKERS = 8
+
+# Default and maximum number of calls of a `multi` message run at the same time
+MULTI_CONCURRENCY = 8
+MULTI_MAX_CONCURRENCY = 32
+
+# Subscription name of `core.get_jobs` for connections using the `JOB_FULL_RECORDS` feature
+JOB_FULL_RECORDS_SUBSCRIPTION = 'core.get_jobs:full_records'
+
+
 class Application(object):
 
     def __init__(self, middleware, loop, request, response):
@@ -65,6 +77,11 @@ class Application(object):
         self.__callbacks = defaultdict(list)
         self.__event_sources = {}
         self.__subscribed = {}
+        # Send full job records on every `core.get_jobs` change like it used to be
+        self._job_full_records = False
+        self.__event_queue = EventSendQueue(self.response.send_str)
+        self.__event_writer = None
+        self.__events_dropped = False
 
     def register_callback(self, name, method):
         assert name in ('on_message', 'on_close')
@@ -140,11 +157,11 @@ class Application(object):
             'formatted': ''.join(traceback.format_exception(*exc_info)),
         }
 
-    def send_error(self, message, errno, reason=None, exc_info=None, etype=None, extra=None):
+    def _error(self, message, errno, reason=None, exc_info=None, etype=None, extra=None):
         error_extra = {}
         if self._py_exceptions and exc_info:
             error_extra['py_exception'] = binascii.b2a_base64(pickle.dumps(exc_info[1])).decode()
-        self._send({
+        return {
             'msg': 'result',
             'id': message['id'],
             'error': dict({
@@ -154,10 +171,59 @@ class Application(object):
                 'trace': self._tb_error(exc_info) if exc_info else None,
                 'extra': extra,
             }, **error_extra),
-        })
+        }
+
+    def send_error(self, message, errno, reason=None, exc_info=None, etype=None, extra=None):
+        self._send(self._error(message, errno, reason, exc_info, etype, extra))
 
     async def call_method(self, message):
+        self._send(await self._call_result(message))
+
+    async def call_multi(self, message):
+        """
+        Run the method calls of a `multi` message concurrently and send all their
+        results in a single reply, in the same order.
+
+        A call not finished within the optional `timeout` (in seconds) gets an
+        ETIMEDOUT error, it is not cancelled if it has already started.
+        """
+        calls = message.get('calls')
+        if not isinstance(calls, list) or not all(isinstance(c, dict) and 'method' in c for c in calls):
+            self.send_error(message, errno.EINVAL, 'calls must be a list of method calls')
+            return
+
+        timeout = message.get('timeout')
+        concurrency = message.get('concurrency')
+        if timeout is not None and not isinstance(timeout, (int, float)):
+            self.send_error(message, errno.EINVAL, 'timeout must be a number')
+            return
+        if concurrency is not None and not isinstance(concurrency, int):
+            self.send_error(message, errno.EINVAL, 'concurrency must be an integer')
+            return
+
+        calls = [dict(c, id=c.get('id', i)) for i, c in enumerate(calls)]
+        tasks = await self.middleware.run_concurrently(
+            [functools.partial(self._call_result, c) for c in calls],
+            timeout,
+            concurrency,
+        )
 
+        results = []
+        for call, task in zip(calls, tasks):
+            if task.done() and not task.cancelled():
+                results.append(task.result())
+            else:
+                results.append(self._error(call, errno.ETIMEDOUT, 'Call timed out'))
+        self._send({
+            'id': message['id'],
+            'msg': 'result',
+            'result': results,
+        })
+
+    async def _call_result(self, message):
+        """
+        Call the method of `message` and return the `result` message to reply with.
+        """
         try:
             result = await self.middleware.call_method(self, message)
             if isinstance(result, Job):
@@ -166,29 +232,30 @@ class Application(object):
                 result = list(result)
             elif isinstance(result, types.AsyncGeneratorType):
                 result = [i async for i in result]
-            self._send({
+            return {
                 'id': message['id'],
                 'msg': 'result',
                 'result': result,
-            })
+            }
         except ValidationError as e:
-            self.send_error(message, e.errno, str(e), sys.exc_info(), etype='VALIDATION', extra=[
+            return self._error(message, e.errno, str(e), sys.exc_info(), etype='VALIDATION', extra=[
                 (e.attribute, e.errmsg, e.errno),
             ])
         except ValidationErrors as e:
-            self.send_error(message, errno.EAGAIN, str(e), sys.exc_info(), etype='VALIDATION', extra=list(e))
+            return self._error(message, errno.EAGAIN, str(e), sys.exc_info(), etype='VALIDATION', extra=list(e))
         except (CallException, SchemaError) as e:
             # CallException and subclasses are the way to gracefully
             # send errors to the client
-            self.send_error(message, e.errno, str(e), sys.exc_info(), extra=e.extra)
+            return self._error(message, e.errno, str(e), sys.exc_info(), extra=e.extra)
         except Exception as e:
-            self.send_error(message, errno.EINVAL, str(e), sys.exc_info())
+            error = self._error(message, errno.EINVAL, str(e), sys.exc_info())
             if not self._py_exceptions:
                 self.logger.warn('Exception while calling {}(*{})'.format(
                     message['method'],
                     self.middleware.dump_args(message.get('params', []), method_name=message['method'])
                 ), exc_info=True)
                 asyncio.ensure_future(self.__crash_reporting(sys.exc_info()))
+            return error
 
     async def __crash_reporting(self, exc_info):
         if self.middleware.crash_reporting.is_disabled():
@@ -230,10 +297,14 @@ class Application(object):
                 'event_source': es,
                 'name': name,
             }
+            self.middleware.register_event_subscription(name, self)
             # Start it after setting __event_sources or it can have a race condition
             start_daemon_thread(target=es.process)
         else:
+            if name == 'core.get_jobs' and self._job_full_records:
+                name = JOB_FULL_RECORDS_SUBSCRIPTION
             self.__subscribed[ident] = name
+            self.middleware.register_event_subscription(name, self)
 
         self._send({
             'msg': 'ready',
@@ -242,35 +313,41 @@ class Application(object):
 
     async def unsubscribe(self, ident):
         if ident in self.__subscribed:
-            self.__subscribed.pop(ident)
+            self.middleware.unregister_event_subscription(self.__subscribed.pop(ident), self)
         elif ident in self.__event_sources:
             event_source = self.__event_sources[ident]['event_source']
             await self.middleware.run_in_thread(event_source.cancel)
+            # Event source may have already unsubscribed itself when finished
+            if self.__event_sources.pop(ident, None):
+                self.middleware.unregister_event_subscription(event_source.name, self)
 
     def send_event(self, name, event_type, **kwargs):
-        if (
-            not any(i == name or i == '*' for i in self.__subscribed.values()) and
-            not any(i['name'] == name for i in self.__event_sources.values())
-        ):
+        """
+        Send event to this connection only (e.g. from an `EventSource`), can be called from any thread.
+        """
+        key, data = encode_event(name, event_type, kwargs)
+        self.loop.call_soon_threadsafe(self.queue_event, key, data)
+
+    def queue_event(self, key, data):
+        """
+        Queue an event encoded with `encode_event` to be sent, must be called from the event loop.
+        """
+        if self.__event_writer is None or self.__event_writer.done():
             return
-        event = {
-            'msg': event_type.lower(),
-            'collection': name,
-        }
-        kwargs = kwargs.copy()
-        if 'id' in kwargs:
-            event['id'] = kwargs.pop('id')
-        if event_type in ('ADDED', 'CHANGED'):
-            if 'fields' in kwargs:
-                event['fields'] = kwargs.pop('fields')
-        if event_type == 'CHANGED':
-            if 'cleared' in kwargs:
-                event['cleared'] = kwargs.pop('cleared')
-        if kwargs:
-            event['extra'] = kwargs
-        self._send(event)
+        if not self.__event_queue.put(key, data) and not self.__events_dropped:
+            self.__events_dropped = True
+            self.logger.warn(f'Connection {self.sessionid} is too slow to receive events, dropping events')
+
+    async def __write_events(self):
+        try:
+            await self.__event_queue.run()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.logger.debug(f'Failed to send events to {self.sessionid}', exc_info=True)
 
     def on_open(self):
+        self.__event_writer = asyncio.ensure_future(self.__write_events())
         self.middleware.register_wsclient(self)
 
     async def on_close(self, *args, **kwargs):
@@ -284,6 +361,15 @@ class Application(object):
         for ident, val in self.__event_sources.items():
             event_source = val['event_source']
             asyncio.ensure_future(self.middleware.run_in_thread(event_source.cancel))
+            self.middleware.unregister_event_subscription(val['name'], self)
+        self.__event_sources = {}
+
+        for name in self.__subscribed.values():
+            self.middleware.unregister_event_subscription(name, self)
+        self.__subscribed = {}
+
+        if self.__event_writer is not None:
+            self.__event_writer.cancel()
 
         self.middleware.unregister_wsclient(self)
 
@@ -305,6 +391,8 @@ class Application(object):
                 features = message.get('features') or []
                 if 'PY_EXCEPTIONS' in features:
                     self._py_exceptions = True
+                if 'JOB_FULL_RECORDS' in features:
+                    self._job_full_records = True
                 # aiohttp can cancel tasks if a request take too long to finish
                 # It is desired to prevent that in this stage in case we are debugging
                 # middlewared via gdb (which makes the program execution a lot slower)
@@ -326,6 +414,9 @@ class Application(object):
         if message['msg'] == 'method':
             asyncio.ensure_future(self.call_method(message))
             return
+        elif message['msg'] == 'multi':
+            asyncio.ensure_future(self.call_multi(message))
+            return
         elif message['msg'] == 'ping':
             pong = {'msg': 'pong'}
             if 'id' in message:
@@ -345,9 +436,10 @@ class Application(object):
 
 class FileApplication(object):
 
-    def __init__(self, middleware, loop):
+    def __init__(self, middleware, loop, chunk_size=PIPE_CHUNK_SIZE):
         self.middleware = middleware
         self.loop = loop
+        self.chunk_size = chunk_size
         self.jobs = {}
 
     def register_job(self, job_id):
@@ -401,22 +493,26 @@ class FileApplication(object):
             resp.set_status(410)
             return resp
 
-        resp = web.StreamResponse(status=200, reason='OK', headers={
+        pipe = job.pipes.output
+        headers = {
             'Content-Type': 'application/octet-stream',
             'Content-Disposition': f'attachment; filename="{filename}"',
-            'Transfer-Encoding': 'chunked',
-        })
-        await resp.prepare(request)
-
-        def do_copy():
-            while True:
-                read = job.pipes.output.r.read(1048576)
-                if read == b'':
-                    break
-                asyncio.run_coroutine_threadsafe(resp.write(read), loop=self.loop).result()
-
+        }
         try:
-            await self.middleware.run_in_thread(do_copy)
+            reader = await pipe.reader(self.chunk_size)
+            read = await reader.read(self.chunk_size)
+            if read == b'' and pipe.path is not None:
+                # The job handed over a regular file, let it be sent with `sendfile`
+                return web.FileResponse(pipe.path, chunk_size=self.chunk_size, headers=headers)
+
+            resp = web.StreamResponse(status=200, reason='OK', headers=dict(headers, **{
+                'Transfer-Encoding': 'chunked',
+            }))
+            await resp.prepare(request)
+
+            while read:
+                await resp.write(read)
+                read = await reader.read(self.chunk_size)
         finally:
             await self._cleanup_job(job_id)
 
@@ -483,23 +579,19 @@ class FileApplication(object):
             resp.set_status(405)
             return resp
 
-        def copy():
-            while True:
-                read = asyncio.run_coroutine_threadsafe(
-                    filepart.read_chunk(1048576),
-                    loop=self.loop,
-                ).result()
-                if read == b'':
-                    break
-                job.pipes.input.w.write(read)
-
         try:
             job = await self.middleware.call(data['method'], *(data.get('params') or []),
                                              pipes=Pipes(input=self.middleware.pipe()))
+            writer = await job.pipes.input.writer()
             try:
-                await self.middleware.run_in_thread(copy)
+                while True:
+                    read = await filepart.read_chunk(self.chunk_size)
+                    if read == b'':
+                        break
+                    writer.write(read)
+                    await writer.drain()
             finally:
-                await self.middleware.run_in_thread(job.pipes.input.w.close)
+                writer.close()
         except CallError as e:
             if e.errno == CallError.ENOMETHOD:
                 status_code = 422
@@ -731,7 +823,7 @@ class Middleware(object):
 
     def __init__(
         self, loop_debug=False, loop_monitor=True, overlay_dirs=None, debug_level=None,
-        log_handler=None,
+        log_handler=None, procpool_workers=None,
     ):
         self.logger = logger.Logger('middlewared', debug_level).getLogger()
         self.crash_reporting = logger.CrashReporting()
@@ -743,18 +835,34 @@ class Middleware(object):
         self.__thread_id = threading.get_ident()
         # Spawn new processes for ProcessPool instead of forking
         multiprocessing.set_start_method('spawn')
+        self.__procpool_workers = procpool_workers or max(2, min(os.cpu_count() or 1, PROCPOOL_MAX_WORKERS))
         self.__procpool = concurrent.futures.ProcessPoolExecutor(
-            max_workers=2,
+            max_workers=self.__procpool_workers,
             initializer=functools.partial(worker_init, debug_level, log_handler),
         )
+        # Worker calls submitted and not finished yet
+        self.__procpool_pending = 0
+        self.__procpool_methods = defaultdict(lambda: {
+            'calls': 0,
+            'errors': 0,
+            'time_total': 0.0,
+            'time_max': 0.0,
+            'wait_total': 0.0,
+            'wait_max': 0.0,
+        })
         self.__threadpool = concurrent.futures.ThreadPoolExecutor(
             initializer=lambda: set_thread_name('threadpool_ws'),
             max_workers=10,
         )
+        self.__io_threadpool = IoThreadPoolExecutor(
+            initializer=lambda: set_thread_name('io_thread'),
+            max_workers=32,
+        )
         self.jobs = JobsQueue(self)
         self.__schemas = Schemas()
         self.__services = {}
         self.__wsclients = {}
+        self.__event_subscriptions = EventSubscriptions()
         self.__event_sources = {}
         self.__event_subs = defaultdict(list)
         self.__hooks = defaultdict(list)
@@ -913,6 +1021,12 @@ class Middleware(object):
     def unregister_wsclient(self, client):
         self.__wsclients.pop(client.sessionid)
 
+    def register_event_subscription(self, name, client):
+        self.__event_subscriptions.add(name, client)
+
+    def unregister_event_subscription(self, name, client):
+        self.__event_subscriptions.remove(name, client)
+
     def register_hook(self, name, method, sync=True):
         """
         Register a hook under `name`.
@@ -975,8 +1089,8 @@ class Middleware(object):
     async def _run_in_conn_threadpool(self, method, *args, **kwargs):
         """
         Threads to handle websocket connection are gated on `__threadpool`.
-        Any other calls should use `run_in_thread` as that launches its own thread
-        and does not cause deadlock waiting another thread to finish in the pool
+        Any other calls should use `run_in_thread` as nested calls there never wait for a busy
+        thread and do not cause deadlock waiting another thread to finish in the pool
         (which could happen on the stack call, e.g.
            service.foo calls something in using the thread pool and something also
            uses the thread pool. If service.foo is called many times before each thread
@@ -988,17 +1102,37 @@ class Middleware(object):
         return await self.run_in_executor(self.__procpool, method, *args, **kwargs)
 
     async def run_in_thread(self, method, *args, **kwargs):
-        executor = concurrent.futures.ThreadPoolExecutor(
-            max_workers=1,
-            initializer=lambda: set_thread_name('io_thread'),
-        )
-        try:
-            return await self.loop.run_in_executor(executor, functools.partial(method, *args, **kwargs))
-        finally:
-            executor.shutdown(wait=False)
+        """
+        Runs method in the I/O thread pool.
 
-    def pipe(self):
-        return Pipe(self)
+        Calls wait for a free thread once `max_workers` threads are busy, except
+        nested ones (e.g. `call_sync` from a method already running in this pool)
+        which never do, see `IoThreadPoolExecutor`. Unlike `_run_in_conn_threadpool`
+        it is safe to use for nested calls.
+        """
+        return await self.loop.run_in_executor(self.__io_threadpool, functools.partial(method, *args, **kwargs))
+
+    def threadpool_stats(self):
+        return self.__io_threadpool.stats()
+
+    def procpool_stats(self):
+        return {
+            'max_workers': self.__procpool_workers,
+            'active': min(self.__procpool_pending, self.__procpool_workers),
+            'queued': max(self.__procpool_pending - self.__procpool_workers, 0),
+            'methods': {
+                name: dict(
+                    stats,
+                    time_avg=stats['time_total'] / stats['calls'] if stats['calls'] else 0.0,
+                    wait_avg=stats['wait_total'] / (stats['calls'] - stats['errors'])
+                    if stats['calls'] > stats['errors'] else 0.0,
+                )
+                for name, stats in self.__procpool_methods.items()
+            },
+        }
+
+    def pipe(self, file_response=False):
+        return Pipe(self, file_response)
 
     async def _call(self, name, serviceobj, methodobj, params=None, app=None, pipes=None, io_thread=True):
 
@@ -1018,6 +1152,9 @@ class Middleware(object):
                 job_options['process'] = True
             # Create a job instance with required args
             job = Job(self, name, serviceobj, methodobj, args, job_options, pipes)
+            if app is not None and job_options.get('priority') is None:
+                # Started by a client, run it ahead of background work
+                job.priority = Priority.INTERACTIVE
             # Add the job to the queue.
             # At this point an `id` is assinged to the job.
             job = self.jobs.add(job)
@@ -1050,14 +1187,33 @@ class Middleware(object):
             return await run_method(methodobj, *args)
 
     async def _call_worker(self, serviceobj, name, *args, job=None):
-        return await self.run_in_proc(
-            main_worker,
-            serviceobj.__class__.__module__,
-            serviceobj.__class__.__name__,
-            name.rsplit('.', 1)[-1],
-            args,
-            job,
-        )
+        stats = self.__procpool_methods[name]
+        stats['calls'] += 1
+        self.__procpool_pending += 1
+        start = time.monotonic()
+        try:
+            rv, elapsed = await self.run_in_proc(
+                main_worker,
+                serviceobj.__class__.__module__,
+                serviceobj.__class__.__name__,
+                name.rsplit('.', 1)[-1],
+                args,
+                job,
+            )
+        except BaseException:
+            stats['errors'] += 1
+            raise
+        else:
+            # Time spent waiting for a free worker (and passing arguments and result around)
+            waited = time.monotonic() - start - elapsed
+            stats['wait_total'] += waited
+            stats['wait_max'] = max(stats['wait_max'], waited)
+            return rv
+        finally:
+            total = time.monotonic() - start
+            stats['time_total'] += total
+            stats['time_max'] = max(stats['time_max'], total)
+            self.__procpool_pending -= 1
 
     def _method_lookup(self, name):
         if '.' not in name:
@@ -1089,11 +1245,38 @@ class Middleware(object):
         serviceobj, methodobj = self._method_lookup(message['method'])
 
         if not app.authenticated and not hasattr(methodobj, '_no_auth_required'):
-            app.send_error(message, errno.EACCES, 'Not authenticated')
-            return
+            raise CallError('Not authenticated', errno.EACCES)
 
         return await self._call(message['method'], serviceobj, methodobj, params, app=app, io_thread=False)
 
+    async def run_concurrently(self, calls, timeout=None, concurrency=None):
+        """
+        Run coroutine functions `calls` (e.g. the calls of a `multi` message) concurrently,
+        at most `concurrency` (`MULTI_CONCURRENCY` by default, up to `MULTI_MAX_CONCURRENCY`)
+        at a time.
+
+        Returns once all of them finished or after `timeout` seconds. Calls which
+        did not start by then are cancelled, the ones already running are not.
+
+        Returns:
+            list(asyncio.Task): one task per call, in the same order
+        """
+        semaphore = asyncio.Semaphore(max(1, min(concurrency or MULTI_CONCURRENCY, MULTI_MAX_CONCURRENCY)))
+        started = set()
+
+        async def run(i, call):
+            async with semaphore:
+                started.add(i)
+                return await call()
+
+        tasks = [asyncio.ensure_future(run(i, call)) for i, call in enumerate(calls)]
+        if tasks:
+            await asyncio.wait(tasks, timeout=timeout)
+        for i, task in enumerate(tasks):
+            if not task.done() and i not in started:
+                task.cancel()
+        return tasks
+
     async def call(self, name, *params, pipes=None, app=None):
         serviceobj, methodobj = self._method_lookup(name)
         return await self._call(name, serviceobj, methodobj, params, app=app, pipes=pipes, io_thread=True)
@@ -1109,7 +1292,8 @@ class Middleware(object):
         # This method is already being called from a thread so we cant use the same
         # thread pool or we may get in a deadlock situation if all threads in the default
         # pool are waiting.
-        # Instead we launch a new thread just for that call (io_thread).
+        # Instead it runs in the I/O thread pool (io_thread) which, the call being nested
+        # when made from one of its threads, never waits for a busy thread.
         fut = asyncio.run_coroutine_threadsafe(self._call(name, serviceobj, methodobj, params, io_thread=True), self.__loop)
         event = threading.Event()
 
@@ -1135,16 +1319,57 @@ class Middleware(object):
 
         self.logger.trace(f'Sending event "{event_type}":{kwargs}')
 
-        for sessionid, wsclient in list(self.__wsclients.items()):
-            try:
-                wsclient.send_event(name, event_type, **kwargs)
-            except Exception:
-                self.logger.warn('Failed to send event {} to {}'.format(name, sessionid), exc_info=True)
+        wsclients = self.__event_subscriptions.get(name)
+        if name == 'core.get_jobs':
+            wsclients |= self.__event_subscriptions.get(JOB_FULL_RECORDS_SUBSCRIPTION)
+        self.__send_event(wsclients, name, event_type, kwargs)
 
         # Send event also for internally subscribed plugins
         for handler in self.__event_subs.get(name, []):
             asyncio.ensure_future(handler(self, event_type, kwargs))
 
+    def send_job_event(self, job, fields):
+        """
+        Send a `core.get_jobs` CHANGED event carrying only `fields` of `job`.
+
+        Connections which asked for full records (`JOB_FULL_RECORDS` feature) get the whole job instead.
+        """
+        kwargs = {'id': job.id, 'fields': fields}
+        self.logger.trace(f'Sending event "CHANGED":{kwargs}')
+
+        wsclients = self.__event_subscriptions.get('core.get_jobs')
+        self.__send_event(wsclients, 'core.get_jobs', 'CHANGED', kwargs)
+
+        full_records = self.__event_subscriptions.get(JOB_FULL_RECORDS_SUBSCRIPTION) - wsclients
+        if full_records:
+            self.__send_event(full_records, 'core.get_jobs', 'CHANGED', {'id': job.id, 'fields': job.__encode__()})
+
+        for handler in self.__event_subs.get('core.get_jobs', []):
+            asyncio.ensure_future(handler(self, 'CHANGED', kwargs))
+
+    def __send_event(self, wsclients, name, event_type, kwargs):
+        if not wsclients:
+            return
+
+        # Encode the event once for all the connections subscribed to it
+        try:
+            key, data = encode_event(name, event_type, kwargs)
+        except Exception:
+            self.logger.warn(f'Failed to encode event {name}', exc_info=True)
+            return
+
+        if threading.get_ident() == self.__thread_id:
+            self.__queue_event(wsclients, name, key, data)
+        else:
+            self.__loop.call_soon_threadsafe(self.__queue_event, wsclients, name, key, data)
+
+    def __queue_event(self, wsclients, name, key, data):
+        for wsclient in wsclients:
+            try:
+                wsclient.queue_event(key, data)
+            except Exception:
+                self.logger.warn('Failed to send event {} to {}'.format(name, wsclient.sessionid), exc_info=True)
+
     def pdb(self):
         import pdb
         pdb.set_trace()
@@ -1295,6 +1520,7 @@ def main():
     parser.add_argument('--disable-loop-monitor', '-L', action='store_true')
     parser.add_argument('--loop-debug', action='store_true')
     parser.add_argument('--overlay-dirs', '-o', action='append')
+    parser.add_argument('--process-pool-workers', type=int, help='Number of process pool workers')
     parser.add_argument('--debug-level', choices=[
         'TRACE',
         'DEBUG',
@@ -1336,6 +1562,7 @@ def main():
         overlay_dirs=args.overlay_dirs,
         debug_level=args.debug_level,
         log_handler=args.log_handler,
+        procpool_workers=args.process_pool_workers,
     ).run()
 
 
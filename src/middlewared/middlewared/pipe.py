@@ -1,4 +1,8 @@
+import asyncio
 import os
+import shutil
+
+CHUNK_SIZE = 1048576
 
 
 class Pipes:
@@ -19,13 +23,62 @@ class Pipes:
 
 
 class Pipe:
-    def __init__(self, middleware):
+    def __init__(self, middleware, file_response=False):
         self.middleware = middleware
 
         r, w = os.pipe()
         self.r = os.fdopen(r, "rb")
         self.w = os.fdopen(w, "wb")
 
+        # Whether the reader can send a regular file by itself (see `copy_file`)
+        self.file_response = file_response
+        self.path = None
+
+        self._transports = []
+
+    async def reader(self, chunk_size=CHUNK_SIZE):
+        """
+        Returns an `asyncio.StreamReader` for the read end of the pipe.
+
+        Reading from the pipe is paused while more than `chunk_size` bytes are
+        buffered, so a slow consumer blocks the writer of the pipe.
+        """
+        reader = asyncio.StreamReader(limit=chunk_size)
+        transport, protocol = await asyncio.get_event_loop().connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(reader), self.r,
+        )
+        self._transports.append(transport)
+        return reader
+
+    async def writer(self):
+        """
+        Returns an `asyncio.StreamWriter` for the write end of the pipe.
+
+        `drain()` waits while the reader of the pipe falls behind. Closing the
+        writer closes the write end once the buffered data is written.
+        """
+        loop = asyncio.get_event_loop()
+        transport, protocol = await loop.connect_write_pipe(asyncio.streams.FlowControlMixin, self.w)
+        self._transports.append(transport)
+        return asyncio.StreamWriter(transport, protocol, None, loop)
+
+    async def copy_file(self, path, chunk_size=CHUNK_SIZE):
+        """
+        Write the contents of regular file `path` to the pipe and close it.
+
+        If the reader sends files by itself (e.g. `sendfile` for HTTP downloads)
+        only `path` is handed over and the pipe is closed empty.
+        """
+        if self.file_response:
+            self.path = path
+        else:
+            with open(path, 'rb') as f:
+                await self.middleware.run_in_thread(shutil.copyfileobj, f, self.w, chunk_size)
+        await self.middleware.run_in_thread(self.w.close)
+
     async def close(self):
+        # Transports must stop polling the pipe before it is closed
+        for transport in self._transports:
+            transport.close()
         await self.middleware.run_in_thread(self.r.close)
         await self.middleware.run_in_thread(self.w.close)
@@ -3,6 +3,7 @@ from middlewared.service import (
     CallError, CRUDService, ValidationErrors, item_method, no_auth_required, pass_app, private
 )
 from middlewared.utils import run, Popen
+from collections import defaultdict
 
 import asyncio
 import binascii
@@ -17,6 +18,9 @@ import subprocess
 import time
 
 SKEL_PATH = '/usr/share/skel/'
+# Past this number of rows membership is read for every row at once, it is cheaper
+# and keeps away from SQLite's limit of query parameters
+EXTEND_MANY_FILTER_MAX = 500
 
 
 def pw_checkname(verrors, attribute, name):
@@ -68,6 +72,7 @@ class UserService(CRUDService):
     class Config:
         datastore = 'account.bsdusers'
         datastore_extend = 'user.user_extend'
+        datastore_extend_many = 'user.user_extend_many'
         datastore_prefix = 'bsdusr_'
 
     @private
@@ -76,6 +81,30 @@ class UserService(CRUDService):
         # Get group membership
         user['groups'] = [gm['group']['id'] for gm in await self.middleware.call('datastore.query', 'account.bsdgroupmembership', [('user', '=', user['id'])], {'prefix': 'bsdgrpmember_'})]
 
+        self.__read_sshpubkey(user)
+        return user
+
+    @private
+    def user_extend_many(self, users):
+        """
+        Same as `user_extend` but retrieves group membership of every user in a single query.
+        """
+        filters = []
+        if len(users) <= EXTEND_MANY_FILTER_MAX:
+            filters.append(('user', 'in', [user['id'] for user in users]))
+
+        groups = defaultdict(list)
+        for gm in self.middleware.call_sync(
+            'datastore.query', 'account.bsdgroupmembership', filters, {'prefix': 'bsdgrpmember_'},
+        ):
+            groups[gm['user']['id']].append(gm['group']['id'])
+
+        for user in users:
+            user['groups'] = groups[user['id']]
+            self.__read_sshpubkey(user)
+        return users
+
+    def __read_sshpubkey(self, user):
         # Get authorized keys
         keysfile = f'{user["home"]}/.ssh/authorized_keys'
         user['sshpubkey'] = None
@@ -85,7 +114,6 @@ class UserService(CRUDService):
                     user['sshpubkey'] = f.read()
             except Exception:
                 pass
-        return user
 
     @accepts(Dict(
         'user_create',
@@ -592,6 +620,7 @@ class GroupService(CRUDService):
         datastore = 'account.bsdgroups'
         datastore_prefix = 'bsdgrp_'
         datastore_extend = 'group.group_extend'
+        datastore_extend_many = 'group.group_extend_many'
 
     @private
     async def group_extend(self, group):
@@ -600,6 +629,33 @@ class GroupService(CRUDService):
         group['users'] += [gmu['id'] for gmu in await self.middleware.call('datastore.query', 'account.bsdusers', [('bsdusr_group_id', '=', group['id'])])]
         return group
 
+    @private
+    async def group_extend_many(self, groups):
+        """
+        Same as `group_extend` but retrieves membership of every group in two queries.
+        """
+        membership_filters = []
+        users_filters = []
+        if len(groups) <= EXTEND_MANY_FILTER_MAX:
+            ids = [group['id'] for group in groups]
+            membership_filters.append(('group', 'in', ids))
+            users_filters.append(('bsdusr_group_id', 'in', ids))
+
+        members = defaultdict(list)
+        for gm in await self.middleware.call(
+            'datastore.query', 'account.bsdgroupmembership', membership_filters, {'prefix': 'bsdgrpmember_'},
+        ):
+            members[gm['group']['id']].append(gm['user']['id'])
+        for gmu in await self.middleware.call(
+            'datastore.query', 'account.bsdusers', users_filters, {'select': ['id', 'bsdusr_group']},
+        ):
+            if gmu['bsdusr_group']:
+                members[gmu['bsdusr_group']['id']].append(gmu['id'])
+
+        for group in groups:
+            group['users'] = members[group['id']]
+        return groups
+
     @accepts(Dict(
         'group_create',
         Int('gid'),
@@ -1,7 +1,9 @@
+import asyncio
 from collections import defaultdict
 import copy
 from datetime import datetime
 import os
+import time
 import traceback
 
 from freenasUI.support.utils import get_license
@@ -30,6 +32,9 @@ from middlewared.utils import load_modules, load_classes
 POLICIES = ["IMMEDIATELY", "HOURLY", "DAILY", "NEVER"]
 DEFAULT_POLICY = "IMMEDIATELY"
 
+# How many alert sources can be checked at the same time
+ALERT_SOURCES_CONCURRENCY = 8
+
 ALERT_SOURCES = {}
 ALERT_SERVICES_FACTORIES = {}
 
@@ -70,6 +75,18 @@ class AlertService(Service):
         self.alerts = defaultdict(lambda: defaultdict(dict))
 
         self.alert_source_last_run = defaultdict(lambda: datetime.min)
+        # Checks still running after their timeout, they are not started again until they finish
+        self.alert_source_running = {}
+        self.alert_source_stats = defaultdict(lambda: {
+            "last_run": None,
+            "last_duration": None,
+            "max_duration": None,
+            "runs": 0,
+            "timeouts": 0,
+            # Runs on the backup node which did not answer in time
+            "remote_timeouts": 0,
+        })
+        self.sources_concurrency = ALERT_SOURCES_CONCURRENCY
 
         self.policies = {
             "IMMEDIATELY": AlertPolicy(),
@@ -124,14 +141,30 @@ class AlertService(Service):
 
     @accepts()
     async def list_sources(self):
+        """
+        List alert sources.
+
+        `stats` holds the time of the last run of the source on this node, how long it took
+        (`last_duration` and `max_duration`, in seconds), how many times it was run and how many
+        of those runs timed out, and how many runs on the backup node timed out (`remote_timeouts`).
+        """
         return [
             {
                 "name": source.name,
                 "title": source.title,
+                "timeout": source.timeout,
+                "stats": dict(self.alert_source_stats[source.name]),
             }
             for source in sorted(ALERT_SOURCES.values(), key=lambda source: source.title.lower())
         ]
 
+    @private
+    async def set_sources_concurrency(self, concurrency):
+        """
+        Set how many alert sources can be checked at the same time.
+        """
+        self.sources_concurrency = max(1, concurrency)
+
     @accepts()
     def list(self):
         return [
@@ -297,6 +330,8 @@ class AlertService(Service):
                         if remote_failover_status == "BACKUP":
                             run_on_backup_node = True
 
+        semaphore = asyncio.Semaphore(self.sources_concurrency)
+        tasks = []
         for alert_source in ALERT_SOURCES.values():
             if isinstance(alert_source, OneShotAlertSource):
                 continue
@@ -306,6 +341,15 @@ class AlertService(Service):
 
             self.alert_source_last_run[alert_source.name] = datetime.utcnow()
 
+            tasks.append(self.__run_alert_source(semaphore, alert_source, master_node, backup_node,
+                                                 run_on_backup_node))
+
+        for result in await asyncio.gather(*tasks, return_exceptions=True):
+            if isinstance(result, Exception):
+                self.logger.error("Error running alert source", exc_info=result)
+
+    async def __run_alert_source(self, semaphore, alert_source, master_node, backup_node, run_on_backup_node):
+        async with semaphore:
             self.logger.trace("Running alert source: %r", alert_source.name)
 
             try:
@@ -319,8 +363,14 @@ class AlertService(Service):
             if run_on_backup_node and alert_source.run_on_backup_node:
                 try:
                     try:
-                        alerts_b = await self.middleware.call("failover.call_remote", "alert.run_source",
-                                                              [alert_source.name])
+                        # Do not let a hung peer hold a concurrency slot
+                        alerts_b = await asyncio.wait_for(
+                            self.middleware.call("failover.call_remote", "alert.run_source", [alert_source.name]),
+                            alert_source.timeout,
+                        )
+                    except asyncio.TimeoutError:
+                        self.alert_source_stats[alert_source.name]["remote_timeouts"] += 1
+                        alerts_b = [self.__timeout_alert(alert_source)]
                     except CallError as e:
                         if e.errno == CallError.EALERTCHECKERUNAVAILABLE:
                             alerts_b = list(self.alerts["B"][alert_source.name].values())
@@ -376,8 +426,18 @@ class AlertService(Service):
     async def __run_source(self, source_name):
         alert_source = ALERT_SOURCES[source_name]
 
+        check = self.alert_source_running.get(source_name)
+        if check is None:
+            check = asyncio.ensure_future(self.__check_source(alert_source))
+            self.alert_source_running[source_name] = check
+
         try:
-            alerts = (await alert_source.check()) or []
+            # Shielded so a check that timed out (e.g. running in a thread) is not started again
+            # until it finishes
+            alerts = (await asyncio.wait_for(asyncio.shield(check), alert_source.timeout)) or []
+        except asyncio.TimeoutError:
+            self.alert_source_stats[source_name]["timeouts"] += 1
+            alerts = [self.__timeout_alert(alert_source)]
         except UnavailableException:
             raise
         except Exception:
@@ -396,6 +456,28 @@ class AlertService(Service):
 
         return alerts
 
+    def __timeout_alert(self, alert_source):
+        return Alert(title="Alert source %(source_name)r timed out after %(timeout)d seconds",
+                     args={
+                         "source_name": alert_source.name,
+                         "timeout": alert_source.timeout,
+                     },
+                     key="__timeout__",
+                     level=AlertLevel.WARNING)
+
+    async def __check_source(self, alert_source):
+        stats = self.alert_source_stats[alert_source.name]
+        stats["last_run"] = datetime.utcnow()
+        start = time.monotonic()
+        try:
+            return await alert_source.check()
+        finally:
+            duration = time.monotonic() - start
+            stats["last_duration"] = duration
+            stats["max_duration"] = max(stats["max_duration"] or 0, duration)
+            stats["runs"] += 1
+            self.alert_source_running.pop(alert_source.name, None)
+
     @periodic(3600)
     async def flush_alerts(self):
         if (
@@ -1,25 +1,129 @@
 from middlewared.schema import Any, Str, accepts, Int
-from middlewared.service import Service, private
-from collections import namedtuple
+from middlewared.service import Service, periodic, private
+from collections import namedtuple, OrderedDict
+import sys
+import threading
 import time
 
 
+def sizeof(value, seen=None, depth=16):
+    """
+    Approximate memory used by `value`, following containers and object attributes
+    up to `depth` levels deep.
+    """
+    if seen is None:
+        seen = set()
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+
+    size = sys.getsizeof(value)
+    if depth == 0:
+        return size
+    depth -= 1
+    if isinstance(value, dict):
+        size += sum(sizeof(k, seen, depth) + sizeof(v, seen, depth) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(sizeof(i, seen, depth) for i in value)
+    elif hasattr(value, '__dict__'):
+        size += sizeof(vars(value), seen, depth)
+    return size
+
+
+class CacheNamespace(object):
+    """
+    Entries of a namespace in least recently used order.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+
+
 class CacheService(Service):
+    """
+    Keys are grouped in namespaces, the part of the key before the first dot
+    (e.g. "update" for "update.applied"), "default" for keys without a dot.
+
+    Each namespace keeps at most `capacity` keys (`DEFAULT_CAPACITY` unless
+    changed with `cache.set_capacity`), evicting the least recently used ones.
+    Expired keys are removed every `SWEEP_INTERVAL` seconds.
+    """
+
+    DEFAULT_CAPACITY = 128
+    SWEEP_INTERVAL = 60
 
     class Config:
         private = True
 
     def __init__(self, *args, **kwargs):
         super(CacheService, self).__init__(*args, **kwargs)
-        self.__cache = {}
-        self.kv_tuple = namedtuple('Cache', ['value', 'timeout'])
+        self.__lock = threading.Lock()
+        self.__namespaces = {}
+        self.__capacities = {}
+        # Keys being computed by `get_or_put`
+        self.__inflight = {}
+        self.kv_tuple = namedtuple('Cache', ['value', 'timeout', 'size'])
+
+    @staticmethod
+    def __namespace_name(key):
+        return key.split('.', 1)[0] if '.' in key else 'default'
+
+    def __namespace(self, key):
+        name = self.__namespace_name(key)
+        namespace = self.__namespaces.get(name)
+        if namespace is None:
+            namespace = self.__namespaces[name] = CacheNamespace(
+                self.__capacities.get(name, self.DEFAULT_CAPACITY)
+            )
+        return namespace
+
+    def __remove(self, namespace, key):
+        namespace.size -= namespace.entries.pop(key).size
+
+    def __get(self, key):
+        namespace = self.__namespace(key)
+        try:
+            self.__check_timeout(key)
+            entry = namespace.entries[key]
+        except KeyError:
+            namespace.misses += 1
+            raise
+        namespace.entries.move_to_end(key)
+        namespace.hits += 1
+        return entry.value
+
+    def __put(self, key, value, timeout, size):
+        if timeout != 0:
+            timeout = time.monotonic() + timeout
+
+        namespace = self.__namespace(key)
+        if key in namespace.entries:
+            self.__remove(namespace, key)
+        v = self.kv_tuple(value=value, timeout=timeout, size=size)
+        namespace.entries[key] = v
+        namespace.size += v.size
+
+        while len(namespace.entries) > namespace.capacity:
+            self.__remove(namespace, next(iter(namespace.entries)))
+            namespace.evictions += 1
 
     @accepts(Str('key'))
     def has_key(self, key):
         """
         Check if given `key` is in cache.
         """
-        return key in self.__cache
+        with self.__lock:
+            try:
+                self.__check_timeout(key)
+            except KeyError:
+                return False
+            return True
 
     @accepts(Str('key'))
     def get(self, key):
@@ -29,55 +133,125 @@ class CacheService(Service):
         Raises:
             KeyError: not found in the cache
         """
-
-        if self.__cache[key].timeout > 0:
-            self.get_timeout(key)
-
-        return self.__cache[key].value
+        with self.__lock:
+            return self.__get(key)
 
     @accepts(Str('key'), Any('value'), Int('timeout', default=0))
     def put(self, key, value, timeout):
         """
         Put `key` of `value` in the cache.
         """
-
-        if timeout != 0:
-            timeout = time.monotonic() + timeout
-
-        v = self.kv_tuple(value=value, timeout=timeout)
-        self.__cache[key] = v
+        # Walking a large value must not block other cache calls
+        size = sizeof(value)
+        with self.__lock:
+            self.__put(key, value, timeout, size)
 
     @accepts(Str('key'))
     def pop(self, key):
         """
         Removes and returns `key` from cache.
         """
-        cache = self.__cache.pop(key, None)
-
-        if cache is not None:
-            cache = cache.value
+        with self.__lock:
+            namespace = self.__namespace(key)
+            cache = namespace.entries.get(key)
+            if cache is not None:
+                self.__remove(namespace, key)
+                cache = cache.value
 
         return cache
 
-    @private
-    def get_timeout(self, key):
+    def __check_timeout(self, key):
         """
-        Check if 'key' has expired
+        Check if 'key' has expired, must be called with the lock held.
         """
-        now = time.monotonic()
-        value, timeout = self.__cache[key]
+        namespace = self.__namespace(key)
+        value, timeout, size = namespace.entries[key]
 
-        if now >= timeout:
+        if timeout > 0 and time.monotonic() >= timeout:
             # Bust the cache
-            del self.__cache[key]
+            self.__remove(namespace, key)
+            namespace.expired += 1
 
             raise KeyError(f'{key} has expired')
 
     @private
     def get_or_put(self, key, timeout, method):
+        """
+        Get `key` from cache or put the value returned by `method` in it.
+
+        Concurrent calls for a missing `key` call `method` only once, the other
+        ones wait for its value.
+        """
+        while True:
+            with self.__lock:
+                try:
+                    return self.__get(key)
+                except KeyError:
+                    pass
+
+                inflight = self.__inflight.get(key)
+                if inflight is None:
+                    inflight = self.__inflight[key] = threading.Event()
+                    break
+
+            # Value has been put in the cache unless `method` failed, in which case try it again
+            inflight.wait()
+
         try:
-            return self.get(key)
-        except KeyError:
             value = method()
-            self.put(key, value, timeout)
+            size = sizeof(value)
+            with self.__lock:
+                self.__put(key, value, timeout, size)
             return value
+        finally:
+            with self.__lock:
+                self.__inflight.pop(key)
+            inflight.set()
+
+    @private
+    def set_capacity(self, namespace, capacity):
+        """
+        Set how many keys `namespace` can have.
+        """
+        with self.__lock:
+            self.__capacities[namespace] = capacity
+            if namespace in self.__namespaces:
+                ns = self.__namespaces[namespace]
+                ns.capacity = capacity
+                while len(ns.entries) > capacity:
+                    self.__remove(ns, next(iter(ns.entries)))
+                    ns.evictions += 1
+
+    @periodic(SWEEP_INTERVAL, run_on_start=False)
+    @private
+    def sweep(self):
+        """
+        Remove expired keys.
+        """
+        with self.__lock:
+            now = time.monotonic()
+            for namespace in self.__namespaces.values():
+                for key, entry in list(namespace.entries.items()):
+                    if entry.timeout > 0 and now >= entry.timeout:
+                        self.__remove(namespace, key)
+                        namespace.expired += 1
+
+    @private
+    def stats(self):
+        """
+        Per namespace number of keys, capacity, approximate memory used in bytes,
+        and hits, misses, evictions and expired keys counters.
+        """
+        with self.__lock:
+            return {
+                name: {
+                    'keys': len(namespace.entries),
+                    'capacity': namespace.capacity,
+                    'size': namespace.size,
+                    'hits': namespace.hits,
+                    'misses': namespace.misses,
+                    'evictions': namespace.evictions,
+                    'expired': namespace.expired,
+                }
+                for name, namespace in self.__namespaces.items()
+            }
@@ -1,5 +1,5 @@
 from middlewared.service import CallError, Service
-from middlewared.schema import accepts, Any, Bool, Dict, List, Ref, Str
+from middlewared.schema import accepts, Any, Bool, Dict, Int, List, Ref, Str
 from sqlite3 import OperationalError
 
 import os
@@ -15,7 +15,7 @@ if not apps.ready:
     django.setup()
 
 from django.apps import apps
-from django.db import connection
+from django.db import connection, transaction
 from django.db.models import Q
 from django.db.models.fields.related import ForeignKey, ManyToManyField
 
@@ -25,7 +25,7 @@ from django.db.models.fields.related import ForeignKey, ManyToManyField
 from freenasUI.freeadmin.sqlite3_ha import base as sqlite3_ha_base
 sqlite3_ha_base.execute_sync = True
 
-from middlewared.utils import django_modelobj_serialize
+from middlewared.utils import django_modelobj_serialize, django_queryset_optimize
 
 
 class DatastoreService(Service):
@@ -98,11 +98,14 @@ class DatastoreService(Service):
         Dict(
             'query-options',
             Str('extend', default=None, null=True),
+            Str('extend_many', default=None, null=True),
             Dict('extra', additional_attrs=True),
             List('order_by', default=[]),
             List('select', default=[]),
             Bool('count', default=False),
             Bool('get', default=False),
+            Int('offset', default=0),
+            Int('limit', default=0),
             Str('prefix', null=True),
             default=None,
             null=True,
@@ -127,6 +130,13 @@ class DatastoreService(Service):
 
         `[ ['username', '=', 'root' ] ]`
 
+        `extend` is a method called for each row of the result to transform it while
+        `extend_many` is called once with the list of all rows, returning the
+        transformed list. `extend_many` takes precedence when both are given.
+
+        `offset` and `limit` options can be used to return a slice of the result,
+        they do not affect `count`.
+
         .. examples(websocket)::
 
           Querying for username "root" and returning a single item:
@@ -173,13 +183,24 @@ class DatastoreService(Service):
         if options.get('count') is True:
             return qs.count()
 
+        qs = django_queryset_optimize(qs, field_prefix=prefix, select=options.get('select'))
+
+        offset = options.get('offset') or 0
+        limit = options.get('limit') or 0
+        if offset or limit:
+            qs = qs[offset:offset + limit if limit else None]
+
+        extend_many = options.get('extend_many')
         result = []
         for i in self.__queryset_serialize(
-            qs, extend=options.get('extend'), field_prefix=options.get('prefix'),
+            qs, extend=None if extend_many else options.get('extend'), field_prefix=options.get('prefix'),
             select=options.get('select'),
         ):
             result.append(i)
 
+        if extend_many and result:
+            result = self.middleware.call_sync(extend_many, result)
+
         if options.get('get') is True:
             return result[0]
 
@@ -299,6 +320,26 @@ class DatastoreService(Service):
             cursor.close()
         return rv
 
+    @accepts(List('queries'))
+    def sql_batch(self, queries):
+        """
+        Executes `queries`, a list of `[query, params]`, within a single transaction.
+        Used to replicate changes to the standby node.
+        """
+        cursor = connection.cursor()
+        try:
+            with transaction.atomic():
+                for query, params in queries:
+                    if params is None:
+                        cursor.executelocal(query)
+                    else:
+                        cursor.executelocal(query, params)
+        except OperationalError as err:
+            raise CallError(err)
+        finally:
+            cursor.close()
+        return True
+
     @accepts(List('queries'))
     def restore(self, queries):
         """
@@ -345,3 +386,13 @@ class DatastoreService(Service):
             })
 
         return models
+
+
+async def _event_failover_status(middleware, event_type, args):
+    sqlite3_ha_base.failover_status.set((args.get('fields') or {}).get('status'))
+
+
+def setup(middleware):
+    # Keep the failover status cached by the sqlite3_ha backend up to date
+    sqlite3_ha_base.failover_status.push()
+    middleware.event_subscribe('failover.status', _event_failover_status)
@@ -6,7 +6,7 @@ import socket
 from middlewared.schema import accepts, Str
 from middlewared.service import Service
 
-from bsd import devinfo, geom
+from bsd import devinfo
 
 DEVD_SOCKETFILE = '/var/run/devd.pipe'
 
@@ -39,25 +39,9 @@ class DeviceService(Service):
         return ports
 
     async def _get_disk(self):
-        await self.middleware.run_in_thread(geom.scan)
-        disks = {}
-        klass = geom.class_by_name('DISK')
-        if not klass:
-            return disks
-        for g in klass.geoms:
-            # Skip cd*
-            if g.name.startswith('cd'):
-                continue
-            disk = {
-                'name': g.name,
-                'mediasize': g.provider.mediasize,
-                'sectorsize': g.provider.sectorsize,
-                'stripesize': g.provider.stripesize,
-            }
-            if g.provider.config:
-                disk.update(g.provider.config)
-            disks[g.name] = disk
-        return disks
+        topology = await self.middleware.call('geom.cache.get')
+        # Skip cd*
+        return {k: v.copy() for k, v in topology.disks.items() if not k.startswith('cd')}
 
 
 async def devd_loop(middleware):
@@ -613,10 +613,9 @@ class DiskService(CRUDService):
             if search:
                 return search.group('serial')
 
-        await self.middleware.run_in_thread(geom.scan)
-        g = geom.geom_by_name('DISK', name)
-        if g and g.provider.config.get('ident'):
-            return g.provider.config['ident']
+        disk = (await self.middleware.call('geom.cache.get')).disks.get(name)
+        if disk and disk.get('ident'):
+            return disk['ident']
 
         return None
 
@@ -637,12 +636,12 @@ class DiskService(CRUDService):
         Returns:
             str - identifier
         """
-        await self.middleware.run_in_thread(geom.scan)
+        topology = await self.middleware.call('geom.cache.get')
 
-        g = geom.geom_by_name('DISK', name)
-        if g and g.provider.config.get('ident'):
-            serial = g.provider.config['ident']
-            lunid = g.provider.config.get('lunid')
+        disk = topology.disks.get(name)
+        if disk and disk.get('ident'):
+            serial = disk['ident']
+            lunid = disk.get('lunid')
             if lunid:
                 return f'{{serial_lunid}}{serial}_{lunid}'
             return f'{{serial}}{serial}'
@@ -651,52 +650,43 @@ class DiskService(CRUDService):
         if serial:
             return f'{{serial}}{serial}'
 
-        klass = geom.class_by_name('PART')
-        if klass:
-            for g in klass.geoms:
-                for p in g.providers:
-                    if p.name == name:
-                        # freebsd-zfs partition
-                        if p.config['rawtype'] == '516e7cba-6ecf-11d6-8ff8-00022d09712b':
-                            return f'{{uuid}}{p.config["rawuuid"]}'
+        part = topology.partitions.get(name)
+        # freebsd-zfs partition
+        if part and part['config'].get('rawtype') == '516e7cba-6ecf-11d6-8ff8-00022d09712b':
+            return f'{{uuid}}{part["config"]["rawuuid"]}'
 
-        g = geom.geom_by_name('LABEL', name)
-        if g:
-            return f'{{label}}{g.provider.name}'
+        g = topology.geom_by_name('LABEL', name)
+        if g and g['providers']:
+            return f'{{label}}{g["providers"][0]}'
 
-        g = geom.geom_by_name('DEV', name)
-        if g:
+        if topology.geom_by_name('DEV', name):
             return f'{{devicename}}{name}'
 
         return ''
 
     @private
     def label_to_dev(self, label, geom_scan=True):
+        """
+        `geom_scan` reads the GEOM topology again instead of using the cached one.
+        """
         if label.endswith('.nop'):
             label = label[:-4]
         elif label.endswith('.eli'):
             label = label[:-4]
 
         if geom_scan:
-            geom.scan()
-        klass = geom.class_by_name('LABEL')
-        prov = klass.xml.find(f'.//provider[name="{label}"]/../name')
-        if prov is not None:
-            return prov.text
+            self.middleware.call_sync('geom.cache.invalidate')
+        return self.middleware.call_sync('geom.cache.get').label_to_dev(label)
 
     @private
     def label_to_disk(self, label, geom_scan=True):
         if geom_scan:
-            geom.scan()
-        dev = self.label_to_dev(label, geom_scan=False) or label
-        part = geom.class_by_name('PART').xml.find(f'.//provider[name="{dev}"]/../name')
-        if part is not None:
-            return part.text
+            self.middleware.call_sync('geom.cache.invalidate')
+        return self.middleware.call_sync('geom.cache.get').label_to_disk(label)
 
     @private
     def check_clean(self, disk):
-        geom.scan()
-        return geom.class_by_name('PART').xml.find(f'.//geom[name="{disk}"]') is None
+        return not self.middleware.call_sync('geom.cache.get').has_partitions(disk)
 
     @private
     @accepts(Str('name'))
@@ -735,13 +725,12 @@ class DiskService(CRUDService):
             disk = {'disk_identifier': ident}
         disk.update({'disk_name': name, 'disk_expiretime': None})
 
-        await self.middleware.run_in_thread(geom.scan)
-        g = geom.geom_by_name('DISK', name)
+        g = (await self.middleware.call('geom.cache.get')).disks.get(name)
         if g:
-            if g.provider.config['ident']:
-                disk['disk_serial'] = g.provider.config['ident']
-            if g.provider.mediasize:
-                disk['disk_size'] = g.provider.mediasize
+            if g.get('ident'):
+                disk['disk_serial'] = g['ident']
+            if g['mediasize']:
+                disk['disk_size'] = g['mediasize']
         if not disk.get('disk_serial'):
             disk['disk_serial'] = await self.serial_from_device(name) or ''
         reg = RE_DSKNAME.search(name)
@@ -775,7 +764,7 @@ class DiskService(CRUDService):
 
         seen_disks = {}
         serials = []
-        await self.middleware.run_in_thread(geom.scan)
+        topology = await self.middleware.call('geom.cache.get')
         for disk in (await self.middleware.call('datastore.query', 'storage.disk', [], {'order_by': ['disk_expiretime']})):
 
             original_disk = disk.copy()
@@ -804,13 +793,13 @@ class DiskService(CRUDService):
                 disk['disk_subsystem'] = reg.group(1)
                 disk['disk_number'] = int(reg.group(2))
             serial = ''
-            g = geom.geom_by_name('DISK', name)
+            g = topology.disks.get(name)
             if g:
-                if g.provider.config['ident']:
-                    serial = disk['disk_serial'] = g.provider.config['ident']
-                serial += g.provider.config.get('lunid') or ''
-                if g.provider.mediasize:
-                    disk['disk_size'] = g.provider.mediasize
+                if g.get('ident'):
+                    serial = disk['disk_serial'] = g['ident']
+                serial += g.get('lunid') or ''
+                if g['mediasize']:
+                    disk['disk_size'] = g['mediasize']
             if not disk.get('disk_serial'):
                 serial = disk['disk_serial'] = await self.serial_from_device(name) or ''
 
@@ -843,13 +832,13 @@ class DiskService(CRUDService):
                 original_disk = disk.copy()
                 disk['disk_name'] = name
                 serial = ''
-                g = geom.geom_by_name('DISK', name)
+                g = topology.disks.get(name)
                 if g:
-                    if g.provider.config['ident']:
-                        serial = disk['disk_serial'] = g.provider.config['ident']
-                    serial += g.provider.config.get('lunid') or ''
-                    if g.provider.mediasize:
-                        disk['disk_size'] = g.provider.mediasize
+                    if g.get('ident'):
+                        serial = disk['disk_serial'] = g['ident']
+                    serial += g.get('lunid') or ''
+                    if g['mediasize']:
+                        disk['disk_size'] = g['mediasize']
                 if not disk.get('disk_serial'):
                     serial = disk['disk_serial'] = await self.serial_from_device(name) or ''
                 if serial:
@@ -1389,6 +1378,7 @@ class DiskService(CRUDService):
                 if reg:
                     job.set_progress((int(reg.group(1)) / size) * 100, extra={'speed': int(reg.group(2))})
 
+        await self.middleware.call('geom.cache.invalidate')
         await self.sync(dev)
 
     @private
@@ -1435,6 +1425,7 @@ class DiskService(CRUDService):
                 raise CallError(f'Unable to GPT format the disk "{disk}": {cp.stderr}')
 
         # We might need to sync with reality (e.g. devname -> uuid)
+        self.middleware.call_sync('geom.cache.invalidate')
         self.middleware.call_sync('disk.sync', disk)
 
     @private
@@ -1469,6 +1460,7 @@ class DiskService(CRUDService):
         )
 
         # We might need to sync with reality (e.g. uuid -> devname)
+        self.middleware.call_sync('geom.cache.invalidate')
         self.middleware.call_sync('disk.sync', disk)
 
 
@@ -1,36 +1,48 @@
+from collections import defaultdict
 from mako import exceptions
 from mako.template import Template
 from mako.lookup import TemplateLookup
 from middlewared.service import Service
 
+import asyncio
 import grp
 import hashlib
 import imp
 import os
 import pwd
+import time
 
 
 class MakoRenderer(object):
 
     def __init__(self, service):
         self.service = service
+        # Template lookups by directory. They keep compiled templates and, with
+        # `filesystem_checks`, reload them and the templates they include
+        # (e.g. `<%namespace file="pam.inc"/>`) once modified.
+        self.lookups = {}
+
+    def get_template(self, path):
+        # Split the path into template name and directory
+        name = os.path.basename(path)
+        dir = os.path.dirname(path)
+
+        # This will be where we search for templates
+        lookup = self.lookups.get(dir)
+        if lookup is None:
+            lookup = self.lookups[dir] = TemplateLookup(
+                directories=[dir], module_directory="/tmp/mako/%s" % dir, filesystem_checks=True,
+            )
+
+        # Get the template by its relative path
+        return lookup.get_template(name)
 
     async def render(self, path):
         try:
             # Mako is not asyncio friendly so run it within a thread
             def do():
-                # Split the path into template name and directory
-                name = os.path.basename(path)
-                dir = os.path.dirname(path)
-
-                # This will be where we search for templates
-                lookup = TemplateLookup(directories=[dir], module_directory="/tmp/mako/%s" % dir)
-
-                # Get the template by its relative path
-                tmpl = lookup.get_template(name)
-
                 # Render the template
-                return tmpl.render(middleware=self.service.middleware)
+                return self.get_template(path).render(middleware=self.service.middleware)
 
             return await self.service.middleware.run_in_thread(do)
         except Exception:
@@ -44,12 +56,20 @@ class PyRenderer(object):
 
     def __init__(self, service):
         self.service = service
+        # Loaded modules by path, along with the module file mtime
+        self.modules = {}
+
+    def get_module(self, path):
+        filename = f'{path}.py'
+        mtime = os.stat(filename).st_mtime
+        cached = self.modules.get(path)
+        if cached is None or cached[0] != mtime:
+            cached = self.modules[path] = (mtime, imp.load_source(os.path.basename(path), filename))
+
+        return cached[1]
 
     async def render(self, path):
-        name = os.path.basename(path)
-        find = imp.find_module(name, [os.path.dirname(path)])
-        mod = imp.load_module(name, *find)
-        return await mod.render(self.service, self.service.middleware)
+        return await self.get_module(path).render(self.service, self.service.middleware)
 
 
 class EtcService(Service):
@@ -117,6 +137,18 @@ class EtcService(Service):
         ]
     }
 
+    # Groups which must be generated before others by `generate_all`
+    DEPENDENCIES = {
+        # Certificates files are referenced by these configuration files
+        'nginx': ['ssl'],
+        'webdav': ['ssl'],
+    }
+
+    # How many groups `generate_all` generates at the same time
+    GENERATE_CONCURRENCY = 4
+    # Files taking longer (in seconds) to render are logged as slow
+    SLOW_RENDER_TIME = 5
+
     class Config:
         private = True
 
@@ -129,12 +161,20 @@ class EtcService(Service):
             'mako': MakoRenderer(self),
             'py': PyRenderer(self),
         }
+        # Same group must not be generated concurrently
+        self._locks = defaultdict(asyncio.Lock)
+        # Time (in seconds) it took to render each file the last time
+        self._render_times = {}
 
     async def generate(self, name):
         group = self.GROUPS.get(name)
         if group is None:
             raise ValueError('{0} group not found'.format(name))
 
+        async with self._locks[name]:
+            await self._generate(group)
+
+    async def _generate(self, group):
         for entry in group:
 
             renderer = self._renderers.get(entry['type'])
@@ -142,11 +182,18 @@ class EtcService(Service):
                 raise ValueError(f'Unknown type: {entry["type"]}')
 
             path = os.path.join(self.files_dir, entry['path'])
+            start = time.monotonic()
             try:
                 rendered = await renderer.render(path)
             except Exception:
                 self.logger.error(f'Failed to render {entry["type"]}:{entry["path"]}', exc_info=True)
                 continue
+            finally:
+                elapsed = self._render_times[f'{entry["type"]}:{entry["path"]}'] = time.monotonic() - start
+                if elapsed >= self.SLOW_RENDER_TIME:
+                    self.logger.warning(f'Rendering {entry["type"]}:{entry["path"]} took {elapsed:.3f} seconds')
+                else:
+                    self.logger.debug(f'Rendered {entry["type"]}:{entry["path"]} in {elapsed:.3f} seconds')
 
             if rendered is None:
                 continue
@@ -204,9 +251,29 @@ class EtcService(Service):
     async def generate_all(self):
         """
         Generate all configuration file groups
+
+        Groups are generated concurrently, up to `GENERATE_CONCURRENCY` at a
+        time, each one after the groups it depends on.
         """
+        semaphore = asyncio.Semaphore(self.GENERATE_CONCURRENCY)
+        tasks = {}
+
+        async def generate(name):
+            dependencies = [tasks[dependency] for dependency in self.DEPENDENCIES.get(name, [])]
+            if dependencies:
+                await asyncio.wait(dependencies)
+            async with semaphore:
+                try:
+                    await self.generate(name)
+                except Exception:
+                    self.logger.error(f'Failed to generate {name} group', exc_info=True)
+
         for name in self.GROUPS.keys():
-            try:
-                await self.generate(name)
-            except Exception:
-                self.logger.error(f'Failed to generate {name} group', exc_info=True)
+            tasks[name] = asyncio.ensure_future(generate(name))
+        await asyncio.wait(list(tasks.values()))
+
+    async def render_times(self):
+        """
+        Time (in seconds) it took to render each file the last time, slowest first
+        """
+        return dict(sorted(self._render_times.items(), key=lambda item: item[1], reverse=True))
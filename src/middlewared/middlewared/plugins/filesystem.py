@@ -175,8 +175,7 @@ class FilesystemService(Service):
         if not os.path.isfile(path):
             raise CallError(f'{path} is not a file')
 
-        with open(path, 'rb') as f:
-            await self.middleware.run_in_thread(shutil.copyfileobj, f, job.pipes.output.w)
+        await job.pipes.output.copy_file(path)
 
     @accepts(
         Str('path'),
@@ -0,0 +1,63 @@
+import threading
+import time
+
+import sysctl
+
+from middlewared.common.geom import GeomTopology
+from middlewared.service import Service
+
+# Safety net in case a GEOM change does not generate a devd event
+GEOM_CACHE_TTL = 60
+
+
+class GeomCacheService(Service):
+
+    class Config:
+        namespace = 'geom.cache'
+        private = True
+
+    def __init__(self, *args, **kwargs):
+        super(GeomCacheService, self).__init__(*args, **kwargs)
+        self.__lock = threading.Lock()
+        self.__generation = 0
+        self.__topology = None
+        self.__expires = 0
+
+    def get(self):
+        """
+        Get the indexed GEOM topology (`GeomTopology`), parsing `kern.geom.confxml`
+        only if it has been invalidated or the TTL has expired.
+        """
+        with self.__lock:
+            if self.__topology is not None and time.monotonic() < self.__expires:
+                return self.__topology
+            generation = self.__generation
+
+        topology = GeomTopology(sysctl.filter('kern.geom.confxml')[0].value)
+
+        with self.__lock:
+            # Do not store a topology read before an invalidation happened
+            if generation == self.__generation:
+                self.__topology = topology
+                self.__expires = time.monotonic() + GEOM_CACHE_TTL
+        return topology
+
+    async def invalidate(self):
+        with self.__lock:
+            self.__generation += 1
+            self.__topology = None
+
+
+async def _event_geom(middleware, event_type, args):
+    await middleware.call('geom.cache.invalidate')
+
+
+async def _event_devfs(middleware, event_type, args):
+    if args['data'].get('subsystem') != 'CDEV':
+        return
+    await middleware.call('geom.cache.invalidate')
+
+
+def setup(middleware):
+    middleware.event_subscribe('devd.geom', _event_geom)
+    middleware.event_subscribe('devd.devfs', _event_devfs)
@@ -13,6 +13,7 @@ import uuid
 import bsd
 
 from libzfs import ZFSException
+from middlewared.common.zfs import query_attributes
 from middlewared.job import JobProgressBuffer
 from middlewared.schema import (accepts, Attribute, Bool, Cron, Dict, EnumMixin, Int, List, Patch,
                                 Str, UnixPerm)
@@ -63,6 +64,35 @@ def _null(x):
     return x
 
 
+# ZFS properties exposed by pool.dataset as (property, attribute name if renamed, value conversion)
+ZFS_DATASET_PROPERTIES = (
+    ('org.freenas:description', 'comments', None),
+    ('org.freenas:quota_warning', 'quota_warning', None),
+    ('org.freenas:quota_critical', 'quota_critical', None),
+    ('org.freenas:refquota_warning', 'refquota_warning', None),
+    ('org.freenas:refquota_critical', 'refquota_critical', None),
+    ('dedup', 'deduplication', str.upper),
+    ('atime', None, str.upper),
+    ('casesensitivity', None, str.upper),
+    ('exec', None, str.upper),
+    ('sync', None, str.upper),
+    ('compression', None, str.upper),
+    ('compressratio', None, None),
+    ('origin', None, None),
+    ('quota', None, _null),
+    ('refquota', None, _null),
+    ('reservation', None, _null),
+    ('refreservation', None, _null),
+    ('copies', None, None),
+    ('snapdir', None, str.upper),
+    ('readonly', None, str.upper),
+    ('recordsize', None, None),
+    ('sparse', None, None),
+    ('volsize', None, None),
+    ('volblocksize', None, None),
+)
+
+
 async def is_mounted(middleware, path):
     mounted = await middleware.run_in_thread(bsd.getmntinfo)
     return any(fs.dest == path for fs in mounted)
@@ -316,7 +346,8 @@ class PoolService(CRUDService):
                 [
                     ('name', 'rnin', '.system'),
                     ('pool', 'in', vol_names)
-                ]
+                ],
+                {'extra': {'properties': [], 'recursive': False}},
             )
         ]
 
@@ -918,7 +949,8 @@ class PoolService(CRUDService):
                     if not prov:
                         continue
 
-                    disk_name = await self.middleware.call('disk.label_to_disk', prov)
+                    # Cached topology is kept up to date by devd events
+                    disk_name = await self.middleware.call('disk.label_to_disk', prov, False)
                     if not disk_name:
                         continue
 
@@ -2055,47 +2087,52 @@ class PoolDatasetService(CRUDService):
 
     @filterable
     def query(self, filters=None, options=None):
+        options = options or {}
         # Otimization for cases in which they can be filtered at zfs.dataset.query
         zfsfilters = []
         for f in filters or []:
             if len(f) == 3:
                 if f[0] in ('id', 'name', 'pool', 'type'):
                     zfsfilters.append(f)
-        datasets = self.middleware.call_sync('zfs.dataset.query', zfsfilters, None)
-        return filter_list(self.__transform(datasets), filters, options)
 
-    def __transform(self, datasets):
+        # Only read the properties which will be used
+        properties = [i[0] for i in ZFS_DATASET_PROPERTIES]
+        share_type = True
+        if options.get('select'):
+            attributes = {i.split('.')[0] for i in query_attributes(filters, options)}
+            if 'children' not in attributes:
+                properties = [i[0] for i in ZFS_DATASET_PROPERTIES if (i[1] or i[0]) in attributes]
+                share_type = 'share_type' in attributes
+
+        datasets = self.middleware.call_sync('zfs.dataset.query', zfsfilters, {'extra': {'properties': properties}})
+        return filter_list(self.__transform(datasets, share_type), filters, options)
+
+    def __transform(self, datasets, share_type=True):
         """
         We need to transform the data zfs gives us to make it consistent/user-friendly,
         making it match whatever pool.dataset.{create,update} uses as input.
         """
+        share_types = {}
+        if share_type:
+            filesystems = set()
+            check = list(datasets)
+            while check:
+                dataset = check.pop()
+                if dataset['type'] == 'FILESYSTEM':
+                    filesystems.add(dataset['name'])
+                check.extend(dataset['children'])
+            if filesystems:
+                share_types = self.middleware.call_sync('notifier.get_dataset_share_types', list(filesystems))
+
+        # Children are shared between entries, transform each of them once
+        transformed = set()
+
         def transform(dataset):
-            for orig_name, new_name, method in (
-                ('org.freenas:description', 'comments', None),
-                ('org.freenas:quota_warning', 'quota_warning', None),
-                ('org.freenas:quota_critical', 'quota_critical', None),
-                ('org.freenas:refquota_warning', 'refquota_warning', None),
-                ('org.freenas:refquota_critical', 'refquota_critical', None),
-                ('dedup', 'deduplication', str.upper),
-                ('atime', None, str.upper),
-                ('casesensitivity', None, str.upper),
-                ('exec', None, str.upper),
-                ('sync', None, str.upper),
-                ('compression', None, str.upper),
-                ('compressratio', None, None),
-                ('origin', None, None),
-                ('quota', None, _null),
-                ('refquota', None, _null),
-                ('reservation', None, _null),
-                ('refreservation', None, _null),
-                ('copies', None, None),
-                ('snapdir', None, str.upper),
-                ('readonly', None, str.upper),
-                ('recordsize', None, None),
-                ('sparse', None, None),
-                ('volsize', None, None),
-                ('volblocksize', None, None),
-            ):
+            if id(dataset) in transformed:
+                return dataset
+            transformed.add(id(dataset))
+
+            for orig_name, new_name, method in ZFS_DATASET_PROPERTIES:
                 if orig_name not in dataset['properties']:
                     continue
                 i = new_name or orig_name
@@ -2104,10 +2141,8 @@ class PoolDatasetService(CRUDService):
                     dataset[i]['value'] = method(dataset[i]['value'])
             del dataset['properties']
 
-            if dataset['type'] == 'FILESYSTEM':
-                dataset['share_type'] = self.middleware.call_sync(
-                    'notifier.get_dataset_share_type', dataset['name'],
-                ).upper()
+            if dataset['type'] == 'FILESYSTEM' and share_type:
+                dataset['share_type'] = share_types[dataset['name']].upper()
             else:
                 dataset['share_type'] = None
 
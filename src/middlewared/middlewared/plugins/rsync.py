@@ -30,19 +30,20 @@ import errno
 import pwd
 import tempfile
 import subprocess
-import threading
 import shutil
 import asyncssh
 import glob
 import asyncio
 
 from collections import defaultdict
+from middlewared.job import JobProgressBuffer
 from middlewared.schema import accepts, Bool, Cron, Dict, Str, Int, List, Patch
 from middlewared.validators import Range, Match
 from middlewared.service import (
     Service, job, CallError, CRUDService, private, SystemServiceService, ValidationErrors
 )
 from middlewared.logger import Logger
+from middlewared.utils.rsync import parse_progress2, read_lines
 
 
 logger = Logger('rsync').getLogger()
@@ -67,95 +68,45 @@ def demote(user):
 
 class RsyncService(Service):
 
-    def __rsync_worker(self, line, user, job):
-        proc_stdout = tempfile.TemporaryFile(mode='w+b', buffering=0)
+    async def __rsync_worker(self, line, user, job):
         try:
-            rsync_proc = subprocess.Popen(
+            rsync_proc = await asyncio.create_subprocess_shell(
                 line,
-                shell=True,
-                stdout=proc_stdout.fileno(),
+                stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
-                bufsize=0,
-                preexec_fn=demote(user)
+                preexec_fn=demote(user),
             )
-            seek = 0
-            old_seek = 0
-            progress = 0
-            message = 'Starting rsync copy job...'
-            while rsync_proc.poll() is None:
-                job.set_progress(progress, message)
-                proc_op = ''
-                proc_stdout.seek(seek)
-                try:
-                    while True:
-                        op_byte = proc_stdout.read(1).decode('utf8')
-                        if op_byte == '':
-                            # In this case break before incrementing `seek`
-                            break
-                        seek += 1
-                        if op_byte == '\r':
-                            break
-                        proc_op += op_byte
-                        seek += 1
-                    if old_seek != seek:
-                        old_seek = seek
-                        message = proc_op.strip()
-                        try:
-                            progress = int([x for x in message.split(' ') if '%' in x][0][:-1])
-                        except (IndexError, ValueError):
-                            pass
-                except BaseException as err:
-                    # Catch IOERROR Errno 9 which usually arises because
-                    # of already closed fileobject being used here therby
-                    # raising Bad File Descriptor error. In this case break
-                    # and the outer while loop will check for rsync_proc.poll()
-                    # to be None or not and DTRT
-                    if hasattr(err, 'errno') and err.errno == 9:
-                        break
-                    logger.debug('Error whilst parsing rsync progress', exc_info=True)
-
-        except BaseException as e:
+        except Exception as e:
             raise CallError(f'Rsync copy job id: {job.id} failed due to: {e}', errno.EIO)
 
+        job.set_progress(0, 'Starting rsync copy job...')
+        progress_buffer = JobProgressBuffer(job)
+        try:
+            stderr = asyncio.ensure_future(rsync_proc.stderr.read())
+            async for proc_op in read_lines(rsync_proc.stdout):
+                progress = parse_progress2(proc_op)
+                if progress is None:
+                    continue
+                progress_buffer.set_progress(progress.pop('percent'), proc_op.strip(), extra=progress)
+            progress_buffer.flush()
+            await rsync_proc.wait()
+            stderr = (await stderr).decode('utf8', 'ignore')
+        except asyncio.CancelledError:
+            progress_buffer.cancel()
+            rsync_proc.kill()
+            raise
+
         if rsync_proc.returncode != 0:
             job.set_progress(None, 'Rsync copy job failed')
             raise CallError(
-                f'Rsync copy job id: {job.id} returned non-zero exit code. Command used was: {line}. Error: {rsync_proc.stderr.read()}'
+                f'Rsync copy job id: {job.id} returned non-zero exit code. Command used was: {line}. Error: {stderr}'
             )
 
-    @accepts(Dict(
-        'rsync-copy',
-        Str('user', required=True),
-        Str('path', required=True),
-        Str('remote_user'),
-        Str('remote_host', required=True),
-        Str('remote_path'),
-        Int('remote_ssh_port'),
-        Str('remote_module'),
-        Str('direction', enum=['PUSH', 'PULL'], required=True),
-        Str('mode', enum=['MODULE', 'SSH'], required=True),
-        Str('remote_password'),
-        Dict(
-            'properties',
-            Bool('recursive'),
-            Bool('compress'),
-            Bool('times'),
-            Bool('archive'),
-            Bool('delete'),
-            Bool('preserve_permissions'),
-            Bool('preserve_attributes'),
-            Bool('delay_updates')
-        ),
-        required=True
-    ))
-    @job()
-    def copy(self, job, rcopy):
+    def __rsync_command(self, rcopy):
         """
-        Starts an rsync copy task between current freenas machine
-        and specified remote host (or local copy too). It reports
-        the progress of the copy task.
+        Validate `rcopy` and build the rsync command line. Checks users and paths
+        and writes the password file, so it is run in a thread.
         """
-
         # Assigning variables and such
         user = rcopy.get('user')
         path = rcopy.get('path')
@@ -246,14 +197,49 @@ class RsyncService(Service):
                 else:
                     line += f' {remote_address}:\\""{remote_path}"\\" "{path}"'
 
+        return line, password_file
+
+    @accepts(Dict(
+        'rsync-copy',
+        Str('user', required=True),
+        Str('path', required=True),
+        Str('remote_user'),
+        Str('remote_host', required=True),
+        Str('remote_path'),
+        Int('remote_ssh_port'),
+        Str('remote_module'),
+        Str('direction', enum=['PUSH', 'PULL'], required=True),
+        Str('mode', enum=['MODULE', 'SSH'], required=True),
+        Str('remote_password'),
+        Dict(
+            'properties',
+            Bool('recursive'),
+            Bool('compress'),
+            Bool('times'),
+            Bool('archive'),
+            Bool('delete'),
+            Bool('preserve_permissions'),
+            Bool('preserve_attributes'),
+            Bool('delay_updates')
+        ),
+        required=True
+    ))
+    @job()
+    async def copy(self, job, rcopy):
+        """
+        Starts an rsync copy task between current freenas machine
+        and specified remote host (or local copy too). It reports
+        the progress of the copy task.
+        """
+
+        line, password_file = await self.middleware.run_in_thread(self.__rsync_command, rcopy)
+
         logger.debug(f'Executing rsync job id: {job.id} with the following command {line}')
         try:
-            t = threading.Thread(target=self.__rsync_worker, args=(line, user, job), daemon=True)
-            t.start()
-            t.join()
+            await self.__rsync_worker(line, rcopy['user'], job)
         finally:
             if password_file:
-                password_file.close()
+                await self.middleware.run_in_thread(password_file.close)
 
         job.set_progress(100, 'Rsync copy job successfully completed')
 
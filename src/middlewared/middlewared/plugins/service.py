@@ -6,12 +6,16 @@ import signal
 import sysctl
 import threading
 import time
-from subprocess import DEVNULL, PIPE
+from subprocess import DEVNULL
 
+from middlewared.common.pgrep import pgrep
 from middlewared.schema import accepts, Bool, Dict, Ref, Str
 from middlewared.service import filterable, CallError, CRUDService
 from middlewared.utils import Popen, filter_list
 
+# How long the status of a service from `SERVICE_DEFS` is trusted
+SERVICE_STATUS_CACHE_TTL = 5
+
 
 class ServiceDefinition:
     def __init__(self, *args):
@@ -104,6 +108,11 @@ class ServiceService(CRUDService):
         'netdata': ServiceDefinition('netdata', '/var/db/netdata/netdata.pid')
     }
 
+    def __init__(self, *args, **kwargs):
+        super(ServiceService, self).__init__(*args, **kwargs)
+        self.__status_cache = {}
+        self.__status_generation = 0
+
     @filterable
     async def query(self, filters=None, options=None):
         if options is None:
@@ -186,7 +195,10 @@ class ServiceService(CRUDService):
         If the method does not exist, it would fallback using service(8)."""
         await self.middleware.call_hook('service.pre_action', service, 'start', options)
         sn = self._started_notify("start", service)
-        await self._simplecmd("start", service, options)
+        try:
+            await self._simplecmd("start", service, options)
+        finally:
+            self._status_cache_invalidate()
         return await self.started(service, sn)
 
     async def started(self, service, sn=None):
@@ -195,6 +207,7 @@ class ServiceService(CRUDService):
         """
         if sn:
             await self.middleware.run_in_thread(sn.join)
+            self._status_cache_invalidate()
 
         try:
             svc = await self.query([('service', '=', service)], {'get': True})
@@ -221,7 +234,10 @@ class ServiceService(CRUDService):
         If the method does not exist, it would fallback using service(8)."""
         await self.middleware.call_hook('service.pre_action', service, 'stop', options)
         sn = self._started_notify("stop", service)
-        await self._simplecmd("stop", service, options)
+        try:
+            await self._simplecmd("stop", service, options)
+        finally:
+            self._status_cache_invalidate()
         return await self.started(service, sn)
 
     @accepts(
@@ -236,7 +252,10 @@ class ServiceService(CRUDService):
         If the method does not exist, it would fallback using service(8)."""
         await self.middleware.call_hook('service.pre_action', service, 'restart', options)
         sn = self._started_notify("restart", service)
-        await self._simplecmd("restart", service, options)
+        try:
+            await self._simplecmd("restart", service, options)
+        finally:
+            self._status_cache_invalidate()
         return await self.started(service, sn)
 
     @accepts(
@@ -255,6 +274,7 @@ class ServiceService(CRUDService):
             await self._simplecmd("reload", service, options)
         except Exception as e:
             await self.restart(service, options)
+        self._status_cache_invalidate()
         return await self.started(service)
 
     async def _get_status(self, service):
@@ -351,7 +371,10 @@ class ServiceService(CRUDService):
         """
         This is the second step::
         Wait for the StartNotify thread to finish and then check for the
-        status of pidfile/procname using pgrep
+        status of pidfile/procname (same semantics as pgrep, without forking).
+
+        Status is cached for `SERVICE_STATUS_CACHE_TTL` seconds, any
+        start/stop/restart/reload invalidates it.
 
         Returns:
             True whether the service is alive, False otherwise
@@ -360,24 +383,27 @@ class ServiceService(CRUDService):
         if what in self.SERVICE_DEFS:
             if notify:
                 await self.middleware.run_in_thread(notify.join)
+                self._status_cache_invalidate()
 
-            if self.SERVICE_DEFS[what].pidfile:
-                pgrep = "/bin/pgrep -F {}{}".format(
-                    self.SERVICE_DEFS[what].pidfile,
-                    ' ' + self.SERVICE_DEFS[what].procname if self.SERVICE_DEFS[what].procname else '',
-                )
-            else:
-                pgrep = "/bin/pgrep {}".format(self.SERVICE_DEFS[what].procname)
-            proc = await Popen(pgrep, shell=True, stdout=PIPE, stderr=PIPE, close_fds=True)
-            data = (await proc.communicate())[0].decode()
-
-            if proc.returncode == 0:
-                return True, [
-                    int(i)
-                    for i in data.strip().split('\n') if i.isdigit()
-                ]
+            cached = self.__status_cache.get(what)
+            if cached and cached[0] > time.monotonic():
+                return cached[1], list(cached[2])
+
+            generation = self.__status_generation
+            pids = await self.middleware.run_in_thread(
+                pgrep, self.SERVICE_DEFS[what].procname, self.SERVICE_DEFS[what].pidfile,
+            )
+            # Do not cache a status probed while the service was being acted upon
+            if generation == self.__status_generation:
+                self.__status_cache[what] = (time.monotonic() + SERVICE_STATUS_CACHE_TTL, bool(pids), pids)
+
+            return bool(pids), list(pids)
         return False, []
 
+    def _status_cache_invalidate(self):
+        self.__status_generation += 1
+        self.__status_cache.clear()
+
     async def _start_webdav(self, **kwargs):
         await self.middleware.call('etc.generate', 'webdav')
         await self._service("apache24", "start", **kwargs)
@@ -1,18 +1,12 @@
-from middlewared.client import ejson as json
 from middlewared.schema import Dict, Int, List, Str, accepts
 from middlewared.service import CallError, Service, ValidationError
-from middlewared.utils import Popen
+from middlewared.utils import rrd
 
 import glob
 import os
-import re
-import subprocess
 
 
 RRD_PATH = '/var/db/collectd/rrd/localhost/'
-RE_DSTYPE = re.compile(r'ds\[(\w+)\]\.type = "(\w+)"')
-RE_STEP = re.compile(r'step = (\d+)')
-RE_LAST_UPDATE = re.compile(r'last_update = (\d+)')
 
 
 class StatsService(Service):
@@ -35,36 +29,18 @@ class StatsService(Service):
         return sources
 
     @accepts(Str('source'), Str('type'))
-    async def get_dataset_info(self, source, _type):
+    def get_dataset_info(self, source, _type):
         """
         Returns info about a given dataset from some source.
         """
         rrdfile = '{}/{}/{}.rrd'.format(RRD_PATH, source, _type)
-        proc = await Popen(
-            ['/usr/local/bin/rrdtool', 'info', rrdfile],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-        )
-        data, err = await proc.communicate()
-        if proc.returncode != 0:
-            raise ValueError('rrdtool failed: {}'.format(err.decode()))
-        data = data.decode()
+        try:
+            with rrd.RRD(rrdfile) as f:
+                info = f.info()
+        except (OSError, rrd.RRDError) as e:
+            raise CallError(f'Failed to read {rrdfile}: {e}')
 
-        info = {
-            'source': source,
-            'type': _type,
-            'datasets': {}
-        }
-        for dataset, _type in RE_DSTYPE.findall(data):
-            info['datasets'][dataset] = {'type': _type}
-
-        reg = RE_STEP.search(data)
-        if reg:
-            info['step'] = int(reg.group(1))
-        reg = RE_LAST_UPDATE.search(data)
-        if reg:
-            info['last_update'] = int(reg.group(1))
-        return info
+        return dict(info, source=source, type=_type)
 
     @accepts(
         List('stats_list', items=[
@@ -82,37 +58,49 @@ class StatsService(Service):
             Int('step', default=10),
             Str('start', default='now-1h'),
             Str('end', default='now'),
+            Int('max_points', null=True, default=400),
         ),
     )
-    async def get_data(self, data_list, stats):
+    def get_data(self, data_list, stats):
         """
         Get data points from rrd files.
+
+        Data points are consolidated (using the `cf` of each dataset) so that
+        there are at most `max_points` of them, 400 by default like `rrdtool xport`
+        (`null` for no limit).
         """
         if not data_list:
             raise ValidationError('stats_list', 'This parameter cannot be empty')
 
+        try:
+            start, end = rrd.parse_times(stats['start'], stats['end'])
+        except ValueError as e:
+            raise ValidationError('stats_filter', str(e))
+
+        if stats['max_points'] is not None and stats['max_points'] < 1:
+            raise ValidationError('stats_filter.max_points', 'This parameter must be positive')
+
         defs = []
         names_pair = []
-        for i, data in enumerate(data_list):
+        for data in data_list:
             names_pair.append([data['source'], data['type']])
             rrdfile = '{}/{}/{}.rrd'.format(RRD_PATH, data['source'], data['type'])
-            defs.extend([
-                'DEF:xxx{}={}:{}:{}'.format(i, rrdfile, data['dataset'], data['cf']),
-                'XPORT:xxx{}:{}/{}'.format(i, data['source'], data['type']),
-            ])
-        proc = await Popen(
-            [
-                '/usr/local/bin/rrdtool', 'xport', '--json',
-                '--start', stats['start'], '--end', stats['end'],
-            ] + (['--step', str(stats['step'])] if stats.get('step') else []) + defs,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-        )
-        data, err = await proc.communicate()
-        if proc.returncode != 0:
-            raise CallError('rrdtool failed: {}'.format(err.decode()))
-        data = json.loads(data.decode())
+            defs.append((rrdfile, data['dataset'], data['cf']))
+
+        try:
+            start, end, step, rows = rrd.xport(defs, start, end, stats.get('step') or 1, stats['max_points'])
+        except (OSError, rrd.RRDError) as e:
+            raise CallError(f'Failed to read data: {e}')
 
-        # Custom about property
-        data['about'] = 'Data for ' + ','.join(['/'.join(i) for i in names_pair])
-        return data
+        return {
+            # Custom about property
+            'about': 'Data for ' + ','.join(['/'.join(i) for i in names_pair]),
+            # Same as `rrdtool xport`
+            'meta': {
+                'start': start + step,
+                'end': end,
+                'step': step,
+                'legend': ['/'.join(i) for i in names_pair],
+            },
+            'data': rows,
+        }
@@ -4,9 +4,9 @@ import threading
 import time
 from collections import defaultdict
 
-from bsd import geom
 import libzfs
 
+from middlewared.common.zfs import SNAPSHOT_ATTRIBUTES, attach_children, projected_properties, query_attributes
 from middlewared.schema import Dict, List, Str, Bool, Int, accepts
 from middlewared.service import (
     CallError, CRUDService, ValidationError, ValidationErrors, filterable, job,
@@ -15,6 +15,9 @@ from middlewared.utils import filter_list, start_daemon_thread
 
 SCAN_THREADS = {}
 
+# Up to this number of snapshots, opening each one by name is cheaper than iterating all of them
+SNAPSHOT_OPEN_MAX = 32
+
 
 def convert_topology(zfs, vdevs):
     topology = defaultdict(list)
@@ -36,6 +39,26 @@ def convert_topology(zfs, vdevs):
     return topology
 
 
+def dataset_state(dataset, properties=None):
+    """
+    Same as py-libzfs `ZFSDataset.__getstate__` without `children`, reading only
+    `properties` (or all of them if None) instead of every property.
+    """
+    if properties is None:
+        props = {k: v.__getstate__() for k, v in dataset.properties.items()}
+    else:
+        dsprops = dataset.properties
+        props = {k: dsprops[k].__getstate__() for k in properties if k in dsprops}
+    return {
+        'id': dataset.name,
+        'name': dataset.name,
+        'pool': dataset.pool.name,
+        'type': dataset.type.name,
+        'properties': props,
+        'mountpoint': dataset.mountpoint,
+    }
+
+
 def find_vdev(pool, vname):
     """
     Find a vdev in the given `pool` using `vname` looking for
@@ -147,20 +170,11 @@ class ZFSPoolService(CRUDService):
     def get_disks(self, name):
         disks = self.get_devices(name)
 
-        geom.scan()
-        labelclass = geom.class_by_name('LABEL')
+        topology = self.middleware.call_sync('geom.cache.get')
         for dev in disks:
             dev = dev.replace('.eli', '')
-            find = labelclass.xml.findall(f".//provider[name='{dev}']/../consumer/provider")
-            name = None
-            if find:
-                name = geom.provider_by_id(find[0].get('ref')).geom.name
-            else:
-                g = geom.geom_by_name('DEV', dev)
-                if g:
-                    name = g.consumer.provider.geom.name
-
-            if name and geom.geom_by_name('DISK', name):
+            name = topology.dev_to_disk(dev)
+            if name:
                 yield name
             else:
                 self.logger.debug(f'Could not find disk for {dev}')
@@ -356,15 +370,41 @@ class ZFSDatasetService(CRUDService):
 
     @filterable
     def query(self, filters=None, options=None):
+        """
+        In `query-options.extra`:
+          - `properties`: list of properties to read, defaults to all of them or,
+            if `select` is used, to the ones referenced in `select`, `order_by` and filters.
+          - `recursive`: whether to include `children` (default: true).
+          - `depth`: how many levels of `children` to include.
+        """
+        options = options or {}
+        extra = options.get('extra') or {}
+        properties = extra.get('properties')
+        if properties is None:
+            properties = projected_properties(filters, options)
+        recursive = extra.get('recursive', True)
+
         with libzfs.ZFS() as zfs:
-            # Handle `id` filter specially to avoiding getting all datasets
-            if filters and len(filters) == 1 and list(filters[0][:2]) == ['id', '=']:
+            # Handle `id` and `pool` filters specially to avoid getting all datasets
+            if filters and len(filters) == 1 and list(filters[0][:2]) in (['id', '='], ['name', '=']):
                 try:
-                    datasets = [zfs.get_dataset(filters[0][2]).__getstate__()]
+                    ds = zfs.get_dataset(filters[0][2])
                 except libzfs.ZFSException:
-                    datasets = []
+                    return filter_list([], filters, options)
+                datasets = [ds] + (list(ds.children_recursive) if recursive else [])
+            elif filters and len(filters) == 1 and list(filters[0][:2]) == ['pool', '=']:
+                try:
+                    ds = zfs.get_dataset(filters[0][2])
+                except libzfs.ZFSException:
+                    return filter_list([], filters, options)
+                datasets = [ds] + list(ds.children_recursive)
             else:
-                datasets = [i.__getstate__() for i in zfs.datasets]
+                datasets = zfs.datasets
+
+            datasets = [dataset_state(i, properties) for i in datasets]
+
+        if recursive:
+            datasets = attach_children(datasets, extra.get('depth'))
         return filter_list(datasets, filters, options)
 
     @accepts(Dict(
@@ -499,34 +539,57 @@ class ZFSSnapshot(CRUDService):
 
     @filterable
     def query(self, filters=None, options=None):
-        # Special case for faster listing of snapshot names (#53149)
-        if options and options.get('select') == ['name']:
-            # Using zfs list -o name is dozens of times faster than py-libzfs
-            cmd = ['zfs', 'list', '-H', '-o', 'name', '-t', 'snapshot']
-            order_by = options.get('order_by')
-            # -s name makes it even faster
-            if not order_by or order_by == ['name']:
-                cmd += ['-s', 'name']
-            cp = subprocess.run(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                universal_newlines=True,
-            )
-            if cp.returncode != 0:
-                raise CallError(f'Failed to retrieve snapshots: {cp.stderr}')
-            snaps = [{'name': i} for i in cp.stdout.strip().split()]
-            if filters:
-                return filter_list(snaps, filters, options)
-            return snaps
+        """
+        Query snapshots using `zfs.snapshot.index`.
+
+        Besides libzfs snapshot attributes entries include `creation`, `used` and
+        `referenced` (integers). Filters on `id`/`name`, `dataset` and `creation`
+        are answered from the index and, if only index attributes are used in
+        filters, `select` and `order_by`, libzfs is not queried at all.
+        """
+        filters = filters or []
+        options = options or {}
+
+        snapshots, filters = self.middleware.call_sync('zfs.snapshot.index.lookup', filters)
+
+        attributes = query_attributes(filters, options)
+        if not options.get('select') and not options.get('count'):
+            # Full entries have been requested
+            attributes.add('properties')
+
+        if attributes <= SNAPSHOT_ATTRIBUTES:
+            rv = filter_list(snapshots, filters, options)
+            if options.get('count') or options.get('select'):
+                return rv
+            # Do not hand out the index entries themselves
+            return dict(rv) if options.get('get') else [dict(i) for i in rv]
+
+        sliced = False
+        if not filters and not options.get('order_by'):
+            # Only read properties of the snapshots that will be returned
+            offset = options.get('offset') or 0
+            limit = options.get('limit') or 0
+            sliced = bool(offset or limit)
+            snapshots = snapshots[offset:offset + limit if limit else None]
+            options = dict(options, offset=0, limit=0)
+
         with libzfs.ZFS() as zfs:
-            # Handle `id` filter to avoid getting all snapshots first
-            if filters and len(filters) == 1 and list(filters[0][:2]) == ['id', '=']:
-                snapshots = [zfs.get_snapshot(filters[0][2]).__getstate__()]
+            states = {}
+            if sliced or len(snapshots) <= SNAPSHOT_OPEN_MAX:
+                for snapshot in snapshots:
+                    try:
+                        states[snapshot['name']] = zfs.get_snapshot(snapshot['name']).__getstate__()
+                    except libzfs.ZFSException:
+                        # Destroyed since the index was updated
+                        continue
             else:
-                snapshots = [i.__getstate__() for i in list(zfs.snapshots)]
-        # FIXME: awful performance with hundreds/thousands of snapshots
-        return filter_list(snapshots, filters, options)
+                names = {snapshot['name'] for snapshot in snapshots}
+                for snapshot in zfs.snapshots:
+                    if snapshot.name in names:
+                        states[snapshot.name] = snapshot.__getstate__()
+        # Snapshots missing from `states` have been destroyed since the index was updated
+        rv = [dict(snapshot, **states[snapshot['name']]) for snapshot in snapshots if snapshot['name'] in states]
+        return filter_list(rv, filters, options)
 
     @accepts(Dict(
         'snapshot_create',
@@ -562,6 +625,7 @@ class ZFSSnapshot(CRUDService):
                     ds.properties['freenas:vmsynced'] = libzfs.ZFSUserProperty('Y')
 
             self.logger.info(f"Snapshot taken: {dataset}@{name}")
+            self.middleware.call_sync('zfs.snapshot.index.snapshot_created', dataset, name, recursive)
             return True
         except libzfs.ZFSException as err:
             self.logger.error(f"{err}")
@@ -591,6 +655,11 @@ class ZFSSnapshot(CRUDService):
             return False
         else:
             self.logger.info(f"Destroyed snapshot: {snapshot_name}")
+            if data.get('defer_delete'):
+                # Snapshot is kept while it has holds or clones
+                self.middleware.call_sync('zfs.snapshot.index.refresh_dataset', data['dataset'])
+            else:
+                self.middleware.call_sync('zfs.snapshot.index.remove', [snapshot_name])
 
         return True
 
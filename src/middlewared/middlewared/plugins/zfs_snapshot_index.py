@@ -0,0 +1,141 @@
+import subprocess
+import threading
+import time
+
+from middlewared.common.zfs import SnapshotIndex, zfs_list_snapshots
+from middlewared.service import CallError, Service
+
+# Safety net for snapshots changed outside of middleware without a devd event
+SNAPSHOT_INDEX_TTL = 600
+
+# ZFS history events which change snapshots of a single dataset
+HISTORY_DATASET_EVENTS = ('snapshot', 'destroy', 'receive', 'finish receiving', 'rollback')
+
+
+class ZFSSnapshotIndexService(Service):
+
+    class Config:
+        namespace = 'zfs.snapshot.index'
+        private = True
+
+    def __init__(self, *args, **kwargs):
+        super(ZFSSnapshotIndexService, self).__init__(*args, **kwargs)
+        self.__lock = threading.Lock()
+        self.__generation = 0
+        self.__index = None
+        self.__expires = 0
+
+    def __get(self):
+        with self.__lock:
+            if self.__index is not None and time.monotonic() < self.__expires:
+                return self.__index
+            generation = self.__generation
+
+        try:
+            index = SnapshotIndex(zfs_list_snapshots())
+        except OSError as e:
+            raise CallError(str(e))
+
+        with self.__lock:
+            # Do not store an index read before an invalidation happened
+            if generation == self.__generation:
+                self.__index = index
+                self.__expires = time.monotonic() + SNAPSHOT_INDEX_TTL
+        return index
+
+    def lookup(self, filters):
+        """
+        Narrow down snapshots matching `filters` using the index, building it
+        with a single `zfs list` if needed. See `SnapshotIndex.lookup`.
+        """
+        index = self.__get()
+        with self.__lock:
+            return index.lookup(filters)
+
+    def add(self, names):
+        """
+        Add (or update) snapshots `names` to the index.
+        """
+        snapshots = zfs_list_snapshots(*names)
+        with self.__lock:
+            if self.__index is None:
+                return
+            for snapshot in snapshots:
+                self.__index.add(snapshot)
+
+    def remove(self, names):
+        with self.__lock:
+            if self.__index is None:
+                return
+            for name in names:
+                self.__index.remove(name)
+
+    def refresh_dataset(self, dataset):
+        """
+        Re-read snapshots of `dataset` (not its children) into the index.
+        """
+        with self.__lock:
+            if self.__index is None:
+                return
+            generation = self.__generation
+
+        snapshots = zfs_list_snapshots('-d', '1', dataset)
+
+        with self.__lock:
+            if self.__index is not None and generation == self.__generation:
+                self.__index.replace_dataset(dataset, snapshots)
+
+    def remove_dataset(self, dataset):
+        """
+        Remove snapshots of `dataset` and its children from the index.
+        """
+        with self.__lock:
+            if self.__index is not None:
+                self.__index.remove_dataset(dataset, recursive=True)
+
+    def invalidate(self):
+        with self.__lock:
+            self.__generation += 1
+            self.__index = None
+
+    def snapshot_created(self, dataset, name, recursive=False):
+        """
+        Update the index after snapshot `name` of `dataset` was taken.
+        """
+        datasets = [dataset]
+        if recursive:
+            cp = subprocess.run(
+                ['zfs', 'list', '-H', '-o', 'name', '-t', 'filesystem,volume', '-r', dataset],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                universal_newlines=True,
+            )
+            if cp.returncode != 0:
+                self.invalidate()
+                return
+            datasets = cp.stdout.split()
+        self.add([f'{d}@{name}' for d in datasets])
+
+
+async def _handle_zfs_events(middleware, event_type, args):
+    data = args['data']
+    if data.get('type') == 'misc.fs.zfs.history_event':
+        dsname = data.get('history_dsname')
+        operation = data.get('history_internal_name')
+        if not dsname or not operation:
+            return
+        if operation in ('rename', 'promote', 'clone swap'):
+            # Snapshots may have moved between datasets
+            await middleware.call('zfs.snapshot.index.invalidate')
+        elif operation in HISTORY_DATASET_EVENTS:
+            dataset, _, snapshot = dsname.partition('@')
+            if operation == 'destroy' and not snapshot:
+                await middleware.call('zfs.snapshot.index.remove_dataset', dataset)
+            else:
+                await middleware.call('zfs.snapshot.index.refresh_dataset', dataset)
+    elif data.get('type') in ('misc.fs.zfs.pool_import', 'misc.fs.zfs.pool_destroy'):
+        await middleware.call('zfs.snapshot.index.invalidate')
+
+
+def setup(middleware):
+    middleware.event_subscribe('devd.zfs', _handle_zfs_events)
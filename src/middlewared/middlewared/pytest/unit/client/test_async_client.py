@@ -0,0 +1,177 @@
+import asyncio
+import os
+
+from aiohttp import web
+import pytest
+
+from middlewared.client import ClientException, ValidationErrors
+from middlewared.client import ejson as json
+from middlewared.client.async_client import AsyncClient
+
+
+class Error(Exception):
+    pass
+
+
+class FakeMiddleware(object):
+    """
+    Websocket server speaking enough of the middlewared protocol to test the client.
+    """
+
+    def __init__(self):
+        self.methods = {}
+        self.events = set()
+        self.ws = None
+
+    async def handler(self, request):
+        self.ws = web.WebSocketResponse()
+        await self.ws.prepare(request)
+        async for msg in self.ws:
+            message = json.loads(msg.data)
+            if message['msg'] == 'connect':
+                await self.send({'msg': 'connected', 'session': 'session'})
+            elif message['msg'] == 'method':
+                asyncio.ensure_future(self.call(message))
+            elif message['msg'] == 'sub':
+                if message['name'] in self.events:
+                    await self.send({'msg': 'ready', 'subs': [message['id']]})
+                elif message['name'] != 'hang':
+                    await self.send({'msg': 'nosub', 'id': message['id'], 'error': {'error': 'Not allowed'}})
+        return self.ws
+
+    async def send(self, message):
+        await self.ws.send_str(json.dumps(message))
+
+    async def call(self, message):
+        try:
+            result = await self.methods[message['method']](*message['params'])
+        except Error as e:
+            await self.send({'msg': 'result', 'id': message['id'], 'error': e.args[0]})
+        else:
+            await self.send({'msg': 'result', 'id': message['id'], 'result': result})
+
+
+@pytest.fixture
+async def middleware(tmpdir):
+    server = FakeMiddleware()
+    app = web.Application()
+    app.router.add_route('GET', '/websocket', server.handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    socket = os.path.join(str(tmpdir), 'middlewared.sock')
+    await web.UnixSite(runner, socket).start()
+
+    server.uri = f'ws+unix://{socket}'
+    yield server
+    await runner.cleanup()
+
+
+@pytest.mark.asyncio
+async def test__async_client__concurrent_calls(middleware):
+    async def echo(value, delay):
+        await asyncio.sleep(delay)
+        return value
+
+    middleware.methods['test.echo'] = echo
+
+    async with AsyncClient(middleware.uri) as c:
+        assert await asyncio.gather(*[c.call('test.echo', i, (5 - i) / 100) for i in range(5)]) == list(range(5))
+
+
+@pytest.mark.asyncio
+async def test__async_client__call_error(middleware):
+    async def fail():
+        raise Error({'error': 2, 'reason': 'No such file', 'trace': None, 'extra': None})
+
+    async def invalid():
+        raise Error({
+            'error': 22, 'type': 'VALIDATION', 'reason': 'Invalid', 'trace': {'formatted': ''},
+            'extra': [['test.invalid.name', 'Name is required', 22]],
+        })
+
+    middleware.methods.update({'test.fail': fail, 'test.invalid': invalid})
+
+    async with AsyncClient(middleware.uri) as c:
+        with pytest.raises(ClientException) as e:
+            await c.call('test.fail')
+        assert e.value.errno == 2
+        assert e.value.error == 'No such file'
+
+        with pytest.raises(ValidationErrors) as e:
+            await c.call('test.invalid')
+        assert e.value.errors[0].attribute == 'test.invalid.name'
+
+
+@pytest.mark.asyncio
+async def test__async_client__job_wait(middleware):
+    async def start():
+        return 5
+
+    async def job_wait(job_id):
+        await middleware.send({
+            'msg': 'changed', 'collection': 'core.get_jobs', 'id': job_id,
+            'fields': {'id': job_id, 'progress': {'percent': 50}},
+        })
+        return {'state': 'SUCCESS', 'result': 'done', 'error': None, 'exception': None, 'exc_info': None}
+
+    middleware.methods.update({'test.job': start, 'core.job_wait': job_wait})
+    middleware.events.add('core.get_jobs')
+    progress = []
+
+    async with AsyncClient(middleware.uri) as c:
+        assert await c.call('test.job', job=True, callback=progress.append) == 'done'
+
+    assert progress == [{'id': 5, 'progress': {'percent': 50}}]
+
+
+@pytest.mark.asyncio
+async def test__async_client__job_failed(middleware):
+    async def start():
+        return 5
+
+    async def job_wait(job_id):
+        return {'state': 'FAILED', 'result': None, 'error': 'Failed', 'exception': 'Traceback', 'exc_info': None}
+
+    middleware.methods.update({'test.job': start, 'core.job_wait': job_wait})
+
+    async with AsyncClient(middleware.uri) as c:
+        with pytest.raises(ClientException) as e:
+            await c.call('test.job', job=True)
+        assert e.value.error == 'Failed'
+
+
+@pytest.mark.asyncio
+async def test__async_client__subscribe(middleware):
+    middleware.events.add('test.event')
+    received = asyncio.get_event_loop().create_future()
+
+    async with AsyncClient(middleware.uri) as c:
+        await c.subscribe('test.event', lambda mtype, **message: received.set_result((mtype, message['fields'])))
+        await middleware.send({'msg': 'added', 'collection': 'test.event', 'fields': {'value': 1}})
+        assert await asyncio.wait_for(received, 5) == ('ADDED', {'value': 1})
+
+        with pytest.raises(ClientException) as e:
+            await c.subscribe('test.forbidden', lambda mtype, **message: None)
+        assert e.value.error == 'Not allowed'
+
+
+@pytest.mark.asyncio
+async def test__async_client__disconnect_fails_pending(middleware):
+    async def hang():
+        await asyncio.sleep(60)
+
+    middleware.methods['test.hang'] = hang
+
+    async with AsyncClient(middleware.uri) as c:
+        call = asyncio.ensure_future(c.call('test.hang'))
+        subscribe = asyncio.ensure_future(c.subscribe('hang', lambda mtype, **message: None))
+        await asyncio.sleep(0.1)
+        await middleware.ws.close()
+
+        for future in (call, subscribe):
+            with pytest.raises(ClientException) as e:
+                await asyncio.wait_for(future, 5)
+            assert e.value.error == 'Connection closed'
+
+        with pytest.raises(ClientException):
+            await c.call('test.hang')
@@ -0,0 +1,264 @@
+import textwrap
+
+import pytest
+
+from middlewared.common.geom import GeomTopology
+
+# kern.geom.confxml of a VM with ada0 partitioned as a data disk (swap + zfs)
+# and ada1 used as a whole disk, trimmed to the relevant classes.
+CONFXML = textwrap.dedent("""\
+    <mesh>
+      <class id="0xffffffff81a1c0a0">
+        <name>DISK</name>
+        <geom id="0xfffff80003a1d100">
+          <class ref="0xffffffff81a1c0a0"/>
+          <name>ada0</name>
+          <rank>1</rank>
+          <config>
+          </config>
+          <provider id="0xfffff80003a1cf00">
+            <geom ref="0xfffff80003a1d100"/>
+            <mode>r2w2e5</mode>
+            <name>ada0</name>
+            <mediasize>21474836480</mediasize>
+            <sectorsize>512</sectorsize>
+            <stripesize>4096</stripesize>
+            <stripeoffset>0</stripeoffset>
+            <config>
+              <fwheads>16</fwheads>
+              <fwsectors>63</fwsectors>
+              <rotationrate>0</rotationrate>
+              <ident>VB3b8f0e33-59d7bd48</ident>
+              <lunid>5000c500a1b2c3d4</lunid>
+              <descr>VBOX HARDDISK</descr>
+            </config>
+          </provider>
+        </geom>
+        <geom id="0xfffff80003a1d200">
+          <class ref="0xffffffff81a1c0a0"/>
+          <name>ada1</name>
+          <rank>1</rank>
+          <config>
+          </config>
+          <provider id="0xfffff80003a1ce00">
+            <geom ref="0xfffff80003a1d200"/>
+            <mode>r1w1e1</mode>
+            <name>ada1</name>
+            <mediasize>10737418240</mediasize>
+            <sectorsize>512</sectorsize>
+            <stripesize>0</stripesize>
+            <stripeoffset>0</stripeoffset>
+            <config>
+              <fwheads>16</fwheads>
+              <fwsectors>63</fwsectors>
+              <rotationrate>unknown</rotationrate>
+              <ident>VB8d1c3f02-aa01b3c2</ident>
+              <descr>VBOX HARDDISK</descr>
+            </config>
+          </provider>
+        </geom>
+        <geom id="0xfffff80003a1d300">
+          <class ref="0xffffffff81a1c0a0"/>
+          <name>cd0</name>
+          <rank>1</rank>
+          <config>
+          </config>
+          <provider id="0xfffff80003a1cd00">
+            <geom ref="0xfffff80003a1d300"/>
+            <mode>r0w0e0</mode>
+            <name>cd0</name>
+            <mediasize>0</mediasize>
+            <sectorsize>2048</sectorsize>
+            <stripesize>0</stripesize>
+            <stripeoffset>0</stripeoffset>
+            <config>
+              <ident></ident>
+              <descr>VBOX CD-ROM</descr>
+            </config>
+          </provider>
+        </geom>
+      </class>
+      <class id="0xffffffff81a25e60">
+        <name>PART</name>
+        <geom id="0xfffff80003b4e500">
+          <class ref="0xffffffff81a25e60"/>
+          <name>ada0</name>
+          <rank>2</rank>
+          <config>
+            <scheme>GPT</scheme>
+            <entries>128</entries>
+            <first>40</first>
+            <last>41942999</last>
+            <fwsectors>63</fwsectors>
+            <fwheads>16</fwheads>
+            <state>OK</state>
+            <modified>false</modified>
+          </config>
+          <consumer id="0xfffff80003b4e280">
+            <geom ref="0xfffff80003b4e500"/>
+            <provider ref="0xfffff80003a1cf00"/>
+            <mode>r2w2e5</mode>
+          </consumer>
+          <provider id="0xfffff80003b4e000">
+            <geom ref="0xfffff80003b4e500"/>
+            <mode>r1w1e1</mode>
+            <name>ada0p1</name>
+            <mediasize>2147483648</mediasize>
+            <sectorsize>512</sectorsize>
+            <stripesize>4096</stripesize>
+            <stripeoffset>0</stripeoffset>
+            <config>
+              <start>128</start>
+              <end>4194431</end>
+              <index>1</index>
+              <type>freebsd-swap</type>
+              <offset>65536</offset>
+              <length>2147483648</length>
+              <rawtype>516e7cb5-6ecf-11d6-8ff8-00022d09712b</rawtype>
+              <rawuuid>0b0f5a9c-3c3f-11e8-a4b5-080027a8f3b1</rawuuid>
+              <efimedia>HD(1,GPT,0b0f5a9c-3c3f-11e8-a4b5-080027a8f3b1,0x80,0x400000)</efimedia>
+            </config>
+          </provider>
+          <provider id="0xfffff80003b4de00">
+            <geom ref="0xfffff80003b4e500"/>
+            <mode>r1w1e2</mode>
+            <name>ada0p2</name>
+            <mediasize>19327287296</mediasize>
+            <sectorsize>512</sectorsize>
+            <stripesize>4096</stripesize>
+            <stripeoffset>0</stripeoffset>
+            <config>
+              <start>4194432</start>
+              <end>41942991</end>
+              <index>2</index>
+              <type>freebsd-zfs</type>
+              <offset>2147549184</offset>
+              <length>19327287296</length>
+              <rawtype>516e7cba-6ecf-11d6-8ff8-00022d09712b</rawtype>
+              <rawuuid>0b1d8e2a-3c3f-11e8-a4b5-080027a8f3b1</rawuuid>
+              <efimedia>HD(2,GPT,0b1d8e2a-3c3f-11e8-a4b5-080027a8f3b1,0x400080,0x2400000)</efimedia>
+            </config>
+          </provider>
+        </geom>
+      </class>
+      <class id="0xffffffff81a1e1c8">
+        <name>LABEL</name>
+        <geom id="0xfffff80003c60800">
+          <class ref="0xffffffff81a1e1c8"/>
+          <name>ada0p2</name>
+          <rank>3</rank>
+          <config>
+          </config>
+          <consumer id="0xfffff80003c60680">
+            <geom ref="0xfffff80003c60800"/>
+            <provider ref="0xfffff80003b4de00"/>
+            <mode>r1w1e1</mode>
+          </consumer>
+          <provider id="0xfffff80003c60500">
+            <geom ref="0xfffff80003c60800"/>
+            <mode>r1w1e1</mode>
+            <name>gptid/0b1d8e2a-3c3f-11e8-a4b5-080027a8f3b1</name>
+            <mediasize>19327287296</mediasize>
+            <sectorsize>512</sectorsize>
+            <stripesize>4096</stripesize>
+            <stripeoffset>0</stripeoffset>
+            <config>
+              <index>0</index>
+              <length>19327287296</length>
+              <seclength>37748608</seclength>
+              <offset>0</offset>
+              <secoffset>0</secoffset>
+            </config>
+          </provider>
+        </geom>
+      </class>
+      <class id="0xffffffff81a1d8e0">
+        <name>DEV</name>
+        <geom id="0xfffff80003a1c900">
+          <class ref="0xffffffff81a1d8e0"/>
+          <name>ada0</name>
+          <rank>2</rank>
+          <consumer id="0xfffff80003a1c880">
+            <geom ref="0xfffff80003a1c900"/>
+            <provider ref="0xfffff80003a1cf00"/>
+            <mode>r0w0e0</mode>
+          </consumer>
+        </geom>
+        <geom id="0xfffff80003a1c700">
+          <class ref="0xffffffff81a1d8e0"/>
+          <name>ada1</name>
+          <rank>2</rank>
+          <consumer id="0xfffff80003a1c680">
+            <geom ref="0xfffff80003a1c700"/>
+            <provider ref="0xfffff80003a1ce00"/>
+            <mode>r0w0e0</mode>
+          </consumer>
+        </geom>
+        <geom id="0xfffff80003b4d900">
+          <class ref="0xffffffff81a1d8e0"/>
+          <name>ada0p2</name>
+          <rank>3</rank>
+          <consumer id="0xfffff80003b4d880">
+            <geom ref="0xfffff80003b4d900"/>
+            <provider ref="0xfffff80003b4de00"/>
+            <mode>r0w0e0</mode>
+          </consumer>
+        </geom>
+      </class>
+    </mesh>
+""")
+
+
+@pytest.fixture(scope='module')
+def topology():
+    return GeomTopology(CONFXML)
+
+
+def test__geom_topology__disks(topology):
+    assert set(topology.disks) == {'ada0', 'ada1', 'cd0'}
+    assert topology.disks['ada0'] == {
+        'name': 'ada0',
+        'mediasize': 21474836480,
+        'sectorsize': 512,
+        'stripesize': 4096,
+        'fwheads': '16',
+        'fwsectors': '63',
+        'rotationrate': '0',
+        'ident': 'VB3b8f0e33-59d7bd48',
+        'lunid': '5000c500a1b2c3d4',
+        'descr': 'VBOX HARDDISK',
+    }
+
+
+def test__geom_topology__serial_to_disk(topology):
+    assert topology.serial_to_disk('VB8d1c3f02-aa01b3c2') == 'ada1'
+    assert topology.serial_to_disk('nonexistent') is None
+
+
+def test__geom_topology__partitions(topology):
+    assert set(topology.partitions) == {'ada0p1', 'ada0p2'}
+    assert topology.partitions['ada0p2']['disk'] == 'ada0'
+    assert topology.partitions['ada0p2']['config']['rawuuid'] == '0b1d8e2a-3c3f-11e8-a4b5-080027a8f3b1'
+    assert topology.has_partitions('ada0')
+    assert not topology.has_partitions('ada1')
+
+
+@pytest.mark.parametrize('label,dev,disk', [
+    ('gptid/0b1d8e2a-3c3f-11e8-a4b5-080027a8f3b1', 'ada0p2', 'ada0'),
+    ('ada0p1', None, 'ada0'),
+    ('ada1', None, None),
+])
+def test__geom_topology__label_to_dev_disk(topology, label, dev, disk):
+    assert topology.label_to_dev(label) == dev
+    assert topology.label_to_disk(label) == disk
+
+
+@pytest.mark.parametrize('dev,disk', [
+    ('gptid/0b1d8e2a-3c3f-11e8-a4b5-080027a8f3b1', 'ada0'),
+    ('ada0p2', 'ada0'),
+    ('ada1', 'ada1'),
+    ('ada0p1', None),
+    ('da0', None),
+])
+def test__geom_topology__dev_to_disk(topology, dev, disk):
+    assert topology.dev_to_disk(dev) == disk
@@ -0,0 +1,47 @@
+import os
+
+import psutil
+import pytest
+
+from middlewared.common.pgrep import pgrep
+
+PROCNAME = psutil.Process().name()
+
+
+@pytest.fixture()
+def pidfile(tmpdir):
+    pidfile = tmpdir.join('test.pid')
+    pidfile.write(f'{os.getpid()}\n')
+    return str(pidfile)
+
+
+def test__pgrep__pidfile(pidfile):
+    assert pgrep(None, pidfile) == [os.getpid()]
+    assert pgrep(PROCNAME, pidfile) == [os.getpid()]
+
+
+def test__pgrep__pidfile_procname_mismatch(pidfile):
+    assert pgrep('nonexistent-procname', pidfile) == []
+
+
+def test__pgrep__pidfile_stale(tmpdir):
+    process = psutil.Popen(['sleep', '0'])
+    process.wait()
+    pidfile = tmpdir.join('test.pid')
+    pidfile.write(f'{process.pid}\n')
+
+    assert pgrep(None, str(pidfile)) == []
+
+
+@pytest.mark.parametrize('content', [None, '', 'garbage\n'])
+def test__pgrep__pidfile_invalid(tmpdir, content):
+    pidfile = tmpdir.join('test.pid')
+    if content is not None:
+        pidfile.write(content)
+
+    assert pgrep(PROCNAME, str(pidfile)) == []
+
+
+def test__pgrep__procname():
+    assert os.getpid() in pgrep(f'^{PROCNAME}$')
+    assert pgrep('^nonexistent-procname$') == []
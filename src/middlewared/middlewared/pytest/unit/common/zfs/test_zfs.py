@@ -0,0 +1,186 @@
+import subprocess
+
+from mock import Mock, patch
+import pytest
+
+from middlewared.common.zfs import (
+    SnapshotIndex, attach_children, filter_attributes, projected_properties, query_attributes, zfs_list_snapshots,
+)
+from middlewared.utils import filter_list
+
+DATASETS = [f'tank/ds{i}' for i in range(100)]
+SNAPSHOTS_PER_DATASET = 1000
+CREATION = 1500000000
+
+
+def zfs_list_output():
+    # 100 datasets x 1000 hourly snapshots
+    return ''.join(
+        f'{dataset}@auto-{i:05d}\t{CREATION + i * 3600}\t{i * 1024}\t{i * 4096}\n'
+        for dataset in DATASETS
+        for i in range(SNAPSHOTS_PER_DATASET)
+    )
+
+
+@pytest.fixture(scope='module')
+def snapshots():
+    with patch('middlewared.common.zfs.subprocess.run', Mock(return_value=subprocess.CompletedProcess(
+        [], 0, stdout=zfs_list_output(), stderr='',
+    ))):
+        return zfs_list_snapshots()
+
+
+@pytest.fixture()
+def index(snapshots):
+    return SnapshotIndex(snapshots)
+
+
+def lookup(index, filters, options=None):
+    snapshots, filters = index.lookup(filters)
+    return filter_list(snapshots, filters, options)
+
+
+def test__zfs_list_snapshots(snapshots):
+    assert len(snapshots) == 100000
+    assert snapshots[1001] == {
+        'id': 'tank/ds1@auto-00001',
+        'name': 'tank/ds1@auto-00001',
+        'pool': 'tank',
+        'type': 'SNAPSHOT',
+        'dataset': 'tank/ds1',
+        'snapshot_name': 'auto-00001',
+        'creation': CREATION + 3600,
+        'used': 1024,
+        'referenced': 4096,
+    }
+
+
+def test__zfs_list_snapshots__nonexistent():
+    with patch('middlewared.common.zfs.subprocess.run', Mock(return_value=subprocess.CompletedProcess(
+        [], 1, stdout='', stderr="cannot open 'tank@nope': dataset does not exist\n",
+    ))):
+        assert zfs_list_snapshots('tank@nope') == []
+
+
+def test__snapshot_index__name(index):
+    snapshots, filters = index.lookup([('id', '=', 'tank/ds5@auto-00010'), ('used', '>', 0)])
+    assert [s['name'] for s in snapshots] == ['tank/ds5@auto-00010']
+    assert filters == [('used', '>', 0)]
+
+    assert lookup(index, [('name', '=', 'tank/ds5@nonexistent')]) == []
+
+
+def test__snapshot_index__dataset(index):
+    snapshots, filters = index.lookup([('dataset', '=', 'tank/ds42')])
+    assert len(snapshots) == SNAPSHOTS_PER_DATASET
+    assert all(s['dataset'] == 'tank/ds42' for s in snapshots)
+    assert filters == []
+
+
+def test__snapshot_index__dataset_creation(index):
+    snapshots, filters = index.lookup([
+        ('dataset', '=', 'tank/ds42'),
+        ('creation', '>=', CREATION + 10 * 3600),
+        ('creation', '<', CREATION + 20 * 3600),
+    ])
+    assert [s['snapshot_name'] for s in snapshots] == [f'auto-{i:05d}' for i in range(10, 20)]
+    assert filters == []
+
+
+def test__snapshot_index__creation(index):
+    snapshots, filters = index.lookup([('creation', '>', CREATION + 998 * 3600)])
+    assert sorted(s['name'] for s in snapshots) == sorted(f'{d}@auto-00999' for d in DATASETS)
+    assert filters == []
+
+
+def test__snapshot_index__prefix(index):
+    snapshots, filters = index.lookup([('name', '^', 'tank/ds7@auto-001'), ('creation', '<', CREATION + 105 * 3600)])
+    assert [s['snapshot_name'] for s in snapshots] == [f'auto-{i:05d}' for i in range(100, 200)]
+    assert filters == [('creation', '<', CREATION + 105 * 3600)]
+
+    assert len(lookup(index, [('name', '^', 'tank/ds7@auto-001'), ('creation', '<', CREATION + 105 * 3600)])) == 5
+
+
+def test__snapshot_index__limit(index):
+    assert [s['name'] for s in lookup(index, [('dataset', '=', 'tank/ds3')], {
+        'order_by': ['-creation'], 'limit': 2,
+    })] == ['tank/ds3@auto-00999', 'tank/ds3@auto-00998']
+
+
+def test__snapshot_index__unindexed_filters(index):
+    filters = [('used', '=', 0), ('OR', [('pool', '=', 'tank'), ('pool', '=', 'other')])]
+    snapshots, residual = index.lookup(filters)
+    assert len(snapshots) == 100000
+    assert residual == filters
+    assert filter_attributes(residual) == {'used', 'pool'}
+
+
+def test__snapshot_index__add_remove(index):
+    assert index.lookup([('creation', '>', CREATION + 999 * 3600)])[0] == []
+
+    index.add({
+        'id': 'tank/ds1@manual', 'name': 'tank/ds1@manual', 'pool': 'tank', 'type': 'SNAPSHOT',
+        'dataset': 'tank/ds1', 'snapshot_name': 'manual', 'creation': CREATION + 1000 * 3600,
+        'used': 0, 'referenced': 0,
+    })
+    assert [s['name'] for s in index.lookup([('creation', '>', CREATION + 999 * 3600)])[0]] == ['tank/ds1@manual']
+    assert index.lookup([('dataset', '=', 'tank/ds1')])[0][-1]['name'] == 'tank/ds1@manual'
+    assert len(index.lookup([('name', '^', 'tank/ds1@')])[0]) == SNAPSHOTS_PER_DATASET + 1
+
+    index.remove('tank/ds1@manual')
+    index.remove('tank/ds1@auto-00000')
+    assert len(index) == 100000 - 1
+    assert index.lookup([('name', '=', 'tank/ds1@auto-00000')])[0] == []
+    assert len(index.lookup([('name', '^', 'tank/ds1@')])[0]) == SNAPSHOTS_PER_DATASET - 1
+
+
+def test__snapshot_index__replace_remove_dataset(index):
+    index.replace_dataset('tank/ds1', [])
+    assert index.lookup([('dataset', '=', 'tank/ds1')])[0] == []
+    assert len(index.lookup([('name', '^', 'tank/ds1')])[0]) == 11 * SNAPSHOTS_PER_DATASET - SNAPSHOTS_PER_DATASET
+
+    index.remove_dataset('tank/ds2', recursive=True)
+    assert len(index) == 100000 - 2 * SNAPSHOTS_PER_DATASET
+
+
+@pytest.mark.parametrize('filters,options,properties', [
+    ([], {}, None),
+    ([('properties.used.parsed', '>', 0)], {}, None),
+    ([], {'select': ['name']}, []),
+    ([], {'select': ['name', 'properties']}, None),
+    (
+        [('OR', [('properties.quota.parsed', '=', None), ('name', '^', 'tank')])],
+        {'select': ['name'], 'order_by': ['-properties.used.parsed']},
+        ['quota', 'used'],
+    ),
+])
+def test__projected_properties(filters, options, properties):
+    assert projected_properties(filters, options) == properties
+
+
+def test__query_attributes():
+    assert query_attributes([('id', '=', 'tank')], {'select': ['name'], 'order_by': ['-type']}) == {
+        'id', 'name', 'type',
+    }
+
+
+def datasets():
+    return [{'name': name} for name in ('tank', 'tank/a', 'tank/a/b', 'tank/c', 'other', 'other/a')]
+
+
+def test__attach_children():
+    rv = {i['name']: i for i in attach_children(datasets())}
+    assert [c['name'] for c in rv['tank']['children']] == ['tank/a', 'tank/c']
+    assert rv['tank']['children'][0] is rv['tank/a']
+    assert [c['name'] for c in rv['tank/a']['children']] == ['tank/a/b']
+    assert [c['name'] for c in rv['other']['children']] == ['other/a']
+    assert rv['tank/c']['children'] == []
+
+
+def test__attach_children__depth():
+    rv = {i['name']: i for i in attach_children(datasets(), depth=1)}
+    assert [c['name'] for c in rv['tank']['children']] == ['tank/a', 'tank/c']
+    assert rv['tank']['children'][0]['children'] == []
+    assert [c['name'] for c in rv['tank/a']['children']] == ['tank/a/b']
+
+    assert all(i['children'] == [] for i in attach_children(datasets(), depth=0))
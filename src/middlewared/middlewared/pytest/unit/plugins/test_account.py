@@ -0,0 +1,48 @@
+from mock import Mock, patch
+import pytest
+
+from middlewared.plugins.account import GroupService, UserService
+
+
+def test__user_service__user_extend_many__single_query():
+    middleware = Mock()
+    middleware.call_sync = Mock(return_value=[
+        {'id': 1, 'user': {'id': 1}, 'group': {'id': 10}},
+        {'id': 2, 'user': {'id': 1}, 'group': {'id': 20}},
+        {'id': 3, 'user': {'id': 2}, 'group': {'id': 10}},
+    ])
+
+    with patch('middlewared.plugins.account.os.path.exists', Mock(return_value=False)):
+        users = UserService(middleware).user_extend_many([
+            {'id': 1, 'home': '/nonexistent'},
+            {'id': 2, 'home': '/nonexistent'},
+            {'id': 3, 'home': '/nonexistent'},
+        ])
+
+    middleware.call_sync.assert_called_once_with(
+        'datastore.query', 'account.bsdgroupmembership', [('user', 'in', [1, 2, 3])], {'prefix': 'bsdgrpmember_'},
+    )
+    assert [user['groups'] for user in users] == [[10, 20], [10], []]
+    assert all(user['sshpubkey'] is None for user in users)
+
+
+@pytest.mark.asyncio
+async def test__group_service__group_extend_many__filtered_queries():
+    calls = []
+
+    async def call(method, datastore, filters, options):
+        calls.append((datastore, filters))
+        if datastore == 'account.bsdgroupmembership':
+            return [{'id': 1, 'user': {'id': 1}, 'group': {'id': 10}}]
+        return [{'id': 2, 'bsdusr_group': {'id': 10}}, {'id': 3, 'bsdusr_group': {'id': 20}}]
+
+    middleware = Mock()
+    middleware.call = call
+
+    groups = await GroupService(middleware).group_extend_many([{'id': 10}, {'id': 20}])
+
+    assert calls == [
+        ('account.bsdgroupmembership', [('group', 'in', [10, 20])]),
+        ('account.bsdusers', [('bsdusr_group_id', 'in', [10, 20])]),
+    ]
+    assert [group['users'] for group in groups] == [[1, 2], [3]]
@@ -0,0 +1,84 @@
+import sys
+import threading
+import time
+
+from mock import Mock, patch
+
+from middlewared.plugins.cache import CacheService, sizeof
+
+
+def test__cache_service__evicts_least_recently_used():
+    cache = CacheService(Mock())
+    cache.set_capacity('pool', 2)
+
+    cache.put('pool.a', 1)
+    cache.put('pool.b', 2)
+    cache.get('pool.a')
+    cache.put('pool.c', 3)
+    cache.put('other', 4)
+
+    assert cache.has_key('pool.a')
+    assert not cache.has_key('pool.b')
+    assert cache.has_key('pool.c')
+    assert cache.has_key('other')
+
+    stats = cache.stats()
+    assert stats['pool']['keys'] == 2
+    assert stats['pool']['evictions'] == 1
+    assert stats['pool']['hits'] == 1
+    assert stats['default']['keys'] == 1
+
+
+def test__cache_service__sweep_removes_expired():
+    cache = CacheService(Mock())
+    with patch('middlewared.plugins.cache.time.monotonic', Mock(return_value=100)):
+        cache.put('update.a', 'a', 10)
+        cache.put('update.b', 'b')
+
+    with patch('middlewared.plugins.cache.time.monotonic', Mock(return_value=111)):
+        cache.sweep()
+
+    assert cache.stats()['update']['keys'] == 1
+    assert cache.stats()['update']['expired'] == 1
+    assert cache.get('update.b') == 'b'
+
+
+def test__cache_service__get_or_put_single_flight():
+    cache = CacheService(Mock())
+    calls = []
+
+    def method():
+        calls.append(1)
+        time.sleep(0.1)
+        return 'value'
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get_or_put('system.pools', 60, method)))
+        for i in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == ['value'] * 8
+
+
+def test__cache_service__put_deeply_nested_value():
+    cache = CacheService(Mock())
+    value = []
+    for i in range(sys.getrecursionlimit()):
+        value = [value]
+
+    assert cache.get_or_put('pool.nested', 0, lambda: value) is value
+
+    assert cache.get('pool.nested') is value
+    assert cache.stats()['pool']['size'] > 0
+
+
+def test__sizeof__depth():
+    value = {'a': ['x' * 1000]}
+
+    assert sizeof(value) > sizeof(value, depth=1) > sizeof(value, depth=0)
@@ -0,0 +1,67 @@
+import asyncio
+import os
+import time
+
+from mock import Mock
+import pytest
+
+from middlewared.plugins.etc import EtcService, MakoRenderer, PyRenderer
+
+
+def test__py_renderer__module_reloaded_when_changed(tmpdir):
+    path = os.path.join(str(tmpdir), 'rendered')
+    with open(f'{path}.py', 'w') as f:
+        f.write('VALUE = 1\n')
+
+    renderer = PyRenderer(Mock())
+    module = renderer.get_module(path)
+    assert renderer.get_module(path) is module
+
+    with open(f'{path}.py', 'w') as f:
+        f.write('VALUE = 2\n')
+    os.utime(f'{path}.py', (0, 0))
+
+    assert renderer.get_module(path).VALUE == 2
+
+
+def test__mako_renderer__namespace_reloaded_when_changed(tmpdir):
+    with open(os.path.join(str(tmpdir), 'pam.inc'), 'w') as f:
+        f.write('<%def name="auth()">auth 1</%def>\n')
+    path = os.path.join(str(tmpdir), 'login')
+    with open(path, 'w') as f:
+        f.write('<%namespace name="pam" file="pam.inc"/>\n${pam.auth()}\n')
+
+    renderer = MakoRenderer(Mock())
+    template = renderer.get_template(path)
+    assert renderer.get_template(path) is template
+    assert template.render().strip() == 'auth 1'
+
+    with open(os.path.join(str(tmpdir), 'pam.inc'), 'w') as f:
+        f.write('<%def name="auth()">auth 2</%def>\n')
+    # Make sure modification is noticed regardless of the file system timestamp resolution
+    mtime = time.time() + 10
+    os.utime(os.path.join(str(tmpdir), 'pam.inc'), (mtime, mtime))
+
+    assert renderer.get_template(path).render().strip() == 'auth 2'
+
+
+@pytest.mark.asyncio
+async def test__etc_service__generate_all_after_dependencies():
+    etc = EtcService(Mock())
+    etc.GROUPS = {'nginx': [], 'ssl': [], 'nfsd': []}
+    etc.GENERATE_CONCURRENCY = 2
+    generated = []
+    running = []
+
+    async def generate(name):
+        running.append(name)
+        assert len(running) <= etc.GENERATE_CONCURRENCY
+        await asyncio.sleep(0.01)
+        running.remove(name)
+        generated.append(name)
+
+    etc.generate = generate
+    await etc.generate_all()
+
+    assert sorted(generated) == ['nfsd', 'nginx', 'ssl']
+    assert generated.index('ssl') < generated.index('nginx')
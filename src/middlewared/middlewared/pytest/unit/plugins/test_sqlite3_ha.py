@@ -0,0 +1,136 @@
+import os
+import pickle
+import sys
+
+from mock import Mock, patch
+import pytest
+
+pytest.importorskip('django')
+sys.path.append('/usr/local/www')
+base = pytest.importorskip('freenasUI.freeadmin.sqlite3_ha.base')
+
+from freenasUI.middleware.client import ClientException  # noqa
+
+
+def test__failover_status__looked_up_again_after_ttl():
+    status = base.FailoverStatus()
+    status.push()
+
+    with patch('freenasUI.freeadmin.sqlite3_ha.base.time.monotonic', Mock(return_value=100)):
+        with patch.object(status, '_lookup', Mock(return_value=('MASTER', status.TTL))):
+            assert status.get() == 'MASTER'
+
+        with patch.object(status, '_lookup', Mock(return_value=('BACKUP', status.TTL))) as lookup:
+            assert status.get() == 'MASTER'
+            lookup.assert_not_called()
+
+    with patch('freenasUI.freeadmin.sqlite3_ha.base.time.monotonic', Mock(return_value=100 + status.TTL)):
+        with patch.object(status, '_lookup', Mock(return_value=('BACKUP', status.TTL))):
+            assert status.get() == 'BACKUP'
+
+
+def test__failover_status__set_by_event():
+    status = base.FailoverStatus()
+    status.push()
+    status.set('BACKUP')
+
+    with patch.object(status, '_lookup', Mock(return_value=('MASTER', status.TTL))) as lookup:
+        assert status.get() == 'BACKUP'
+        lookup.assert_not_called()
+
+
+@pytest.fixture
+def journal_file(tmpdir):
+    path = str(tmpdir.join('ha-journal'))
+    with patch.object(base.Journal, 'JOURNAL_FILE', path):
+        yield path
+
+
+def queries(start, count):
+    return [('INSERT INTO test (id) VALUES (?)', [i]) for i in range(start, start + count)]
+
+
+def read_journal():
+    with base.Journal() as j:
+        return list(j.queries)
+
+
+def test__journal__append_only(journal_file):
+    with base.Journal() as j:
+        j.append(queries(0, 2))
+    size = os.path.getsize(journal_file)
+
+    with base.Journal() as j:
+        j.append(queries(2, 1))
+
+    with open(journal_file, 'rb') as f:
+        data = f.read()
+    assert data[:size] == b''.join(base.Journal._record(q) for q in queries(0, 2))
+    assert read_journal() == queries(0, 3)
+
+
+@pytest.mark.parametrize('corrupt,valid', [
+    # Torn write of the last record
+    (lambda data, last: data[:-5], 2),
+    # Checksum mismatch of the last record
+    (lambda data, last: data[:-1] + bytes([data[-1] ^ 0xff]), 2),
+    # Garbage after the last record
+    (lambda data, last: data + b'garbage', 3),
+])
+def test__journal__corrupted_tail_discarded(journal_file, corrupt, valid):
+    records = [base.Journal._record(q) for q in queries(0, 3)]
+    data = b''.join(records)
+    with open(journal_file, 'wb') as f:
+        f.write(corrupt(data, len(data) - len(records[-1])))
+
+    assert read_journal() == queries(0, valid)
+
+    # Journal has been compacted to the valid records
+    with open(journal_file, 'rb') as f:
+        assert f.read() == b''.join(records[:valid])
+
+
+def test__journal__legacy_format_converted(journal_file):
+    with open(journal_file, 'wb') as f:
+        f.write(pickle.dumps(queries(0, 3)))
+
+    assert read_journal() == queries(0, 3)
+
+    with open(journal_file, 'rb') as f:
+        assert f.read() == b''.join(base.Journal._record(q) for q in queries(0, 3))
+
+
+class FakeStandby(object):
+
+    def __init__(self, error=None):
+        self.error = error
+        self.queries = []
+
+    def sql_batch(self, queries):
+        if self.error is not None:
+            raise self.error
+        self.queries.extend(queries)
+
+
+@pytest.mark.parametrize('error', [ClientException('Standby is offline'), ConnectionRefusedError()])
+def test__replicator__replays_journal_after_outage(journal_file, error):
+    standby = FakeStandby(error)
+    replicator = base.Replicator(send=standby.sql_batch, flush_interval=0)
+    replicator.start()
+
+    for sql, params in queries(0, 3):
+        replicator.put(sql, params)
+    replicator.flush()
+    assert read_journal() == queries(0, 3)
+
+    # Journal is not replayed until RETRY_INTERVAL elapsed, queries keep being journaled
+    standby.error = None
+    replicator.put(*queries(3, 1)[0], wait=True)
+    assert standby.queries == []
+    assert read_journal() == queries(0, 4)
+
+    replicator._retry_at = 0
+    replicator.put(*queries(4, 1)[0], wait=True)
+    assert standby.queries == queries(0, 5)
+    # Journal has been compacted once replayed
+    assert os.path.getsize(journal_file) == 0
@@ -0,0 +1,93 @@
+import asyncio
+
+from mock import Mock
+import pytest
+
+from middlewared.service import CallError, CoreService, job
+
+
+class FakeMiddleware(object):
+
+    def __init__(self, methods):
+        self.methods = methods
+
+    def _method_lookup(self, name):
+        if name not in self.methods:
+            raise CallError(f'Method "{name}" not found', CallError.ENOMETHOD)
+        return None, self.methods[name]
+
+    async def call(self, name, *params):
+        return await self._method_lookup(name)[1](*params)
+
+
+async def bulk(methods, method, params, concurrency=1):
+    return await CoreService(FakeMiddleware(methods)).bulk(Mock(), method, params, {'concurrency': concurrency})
+
+
+@pytest.mark.asyncio
+async def test__bulk__results_in_order():
+    async def method(value, delay):
+        await asyncio.sleep(delay)
+        if value < 0:
+            raise CallError('Negative value')
+        return value * 2
+
+    assert await bulk({'test.method': method}, 'test.method', [[1, 0.03], [-1, 0.01], [3, 0]], 3) == [
+        {'result': 2, 'error': None},
+        {'result': None, 'error': '[EFAULT] Negative value'},
+        {'result': 6, 'error': None},
+    ]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('concurrency', [1, 2, 4])
+async def test__bulk__concurrency(concurrency):
+    running = 0
+    max_running = 0
+
+    async def method(value):
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return value
+
+    result = await bulk({'test.method': method}, 'test.method', [[i] for i in range(8)], concurrency)
+
+    assert [i['result'] for i in result] == list(range(8))
+    assert max_running == concurrency
+
+
+@pytest.mark.asyncio
+async def test__bulk__lock_serializes_items():
+    running = set()
+    overlapping = []
+
+    @job(lock=lambda args: f'test:{args[0]}')
+    async def method(name, value):
+        if name in running:
+            overlapping.append(name)
+        running.add(name)
+        await asyncio.sleep(0.01)
+        running.discard(name)
+        return value
+
+    params = [['a', 1], ['a', 2], ['b', 3], ['a', 4], ['b', 5]]
+    result = await bulk({'test.method': method}, 'test.method', params, 4)
+
+    assert [i['result'] for i in result] == [1, 2, 3, 4, 5]
+    assert overlapping == []
+
+
+@pytest.mark.asyncio
+async def test__bulk__lock_name_error():
+    @job(lock=lambda args: f'test:{args[0]}')
+    async def method(*args):
+        return args
+
+    result = await bulk({'test.method': method}, 'test.method', [[], ['a']], 2)
+
+    assert result[0]['result'] is None
+    assert 'index out of range' in result[0]['error']
+    assert result[1] == {'result': ('a',), 'error': None}
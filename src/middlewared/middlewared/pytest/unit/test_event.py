@@ -0,0 +1,90 @@
+import asyncio
+import json
+
+import pytest
+
+from middlewared.event import EventSendQueue, EventSubscriptions, encode_event
+
+
+def test__event_subscriptions():
+    subscriptions = EventSubscriptions()
+    subscriptions.add('core.get_jobs', 'a')
+    subscriptions.add('core.get_jobs', 'a')
+    subscriptions.add('*', 'b')
+    subscriptions.add('pool.*', 'c')
+
+    assert subscriptions.get('core.get_jobs') == {'a', 'b'}
+    assert subscriptions.get('pool.scan') == {'b', 'c'}
+
+    # Subscribed twice, still subscribed after the first removal
+    subscriptions.remove('core.get_jobs', 'a')
+    assert subscriptions.get('core.get_jobs') == {'a', 'b'}
+    subscriptions.remove('core.get_jobs', 'a')
+    subscriptions.remove('*', 'b')
+    subscriptions.remove('*', 'nonexistent')
+    assert subscriptions.get('core.get_jobs') == set()
+    assert subscriptions.get('pool.scan') == {'c'}
+
+
+def test__encode_event():
+    key, data = encode_event('core.get_jobs', 'CHANGED', {'id': 1, 'fields': {'state': 'RUNNING'}})
+    assert key == ('core.get_jobs', 1, ('state',))
+    assert json.loads(data) == {
+        'msg': 'changed', 'collection': 'core.get_jobs', 'id': 1, 'fields': {'state': 'RUNNING'},
+    }
+
+    key, data = encode_event('devd.zfs', 'ADDED', {'data': {'type': 'misc.fs.zfs.history_event'}})
+    assert key is None
+    assert json.loads(data) == {
+        'msg': 'added', 'collection': 'devd.zfs', 'extra': {'data': {'type': 'misc.fs.zfs.history_event'}},
+    }
+
+
+@pytest.mark.asyncio
+async def test__event_send_queue__coalesce_and_drop():
+    sent = []
+
+    async def send(data):
+        sent.append(data)
+
+    progress = ('core.get_jobs', 1, ('id', 'progress'))
+    queue = EventSendQueue(send, maxsize=3)
+    assert queue.put(progress, 'job 1 at 10%')
+    assert queue.put(None, 'added')
+    assert queue.put(progress, 'job 1 at 20%')
+    assert queue.coalesced == 1
+
+    # Superseded event makes room without dropping anything
+    assert queue.put(('core.get_jobs', 2, ('id', 'progress')), 'job 2 at 10%')
+    assert queue.dropped == 0
+
+    assert not queue.put(None, 'removed')
+    assert queue.dropped == 1
+
+    task = asyncio.ensure_future(queue.run())
+    await asyncio.sleep(0)
+    # Order is kept
+    assert sent == ['job 1 at 20%', 'job 2 at 10%', 'removed']
+
+    assert queue.put(progress, 'job 1 at 30%')
+    await asyncio.sleep(0)
+    assert sent[-1] == 'job 1 at 30%'
+
+    task.cancel()
+
+
+def test__event_send_queue__superseded_event_removed_when_full():
+    async def send(data):
+        pass
+
+    progress = ('core.get_jobs', 1, ('id', 'progress'))
+    queue = EventSendQueue(send, maxsize=2)
+    assert queue.put(progress, 'job 1 at 10%')
+    assert queue.put(progress, 'job 1 at 20%')
+    # Removes the superseded event, newer one is still coalesced afterwards
+    assert queue.put(None, 'added')
+    assert queue.put(progress, 'job 1 at 30%')
+
+    assert queue.dropped == 0
+    assert queue.coalesced == 2
+    assert len(queue) == 2
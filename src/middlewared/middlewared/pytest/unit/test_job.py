@@ -0,0 +1,129 @@
+import asyncio
+
+from mock import Mock
+import pytest
+
+from middlewared.job import Job, JobsQueue, Priority
+from middlewared.service import job
+
+
+def middleware():
+    m = Mock()
+
+    async def run_in_thread(method, *args, **kwargs):
+        return method(*args, **kwargs)
+
+    m.run_in_thread = run_in_thread
+    return m
+
+
+def make_job(m, name, method, args=None, **options):
+    return Job(m, name, Mock(), method, args or [], job(**options)(Mock())._job, None)
+
+
+async def run_queue(queue, jobs):
+    task = asyncio.ensure_future(queue.run())
+    try:
+        await asyncio.wait_for(asyncio.gather(*[j.wait() for j in jobs]), 5)
+    finally:
+        task.cancel()
+
+
+@pytest.mark.asyncio
+async def test__jobs_queue__priority():
+    m = middleware()
+    queue = JobsQueue(m)
+    started = []
+
+    async def method(job):
+        started.append(job.method_name)
+
+    jobs = [
+        queue.add(make_job(m, 'background', method, priority='BACKGROUND')),
+        queue.add(make_job(m, 'normal', method)),
+        queue.add(make_job(m, 'interactive', method, priority='INTERACTIVE')),
+    ]
+    assert [j.priority for j in jobs] == [Priority.BACKGROUND, Priority.NORMAL, Priority.INTERACTIVE]
+
+    await run_queue(queue, jobs)
+
+    assert started == ['interactive', 'normal', 'background']
+
+
+@pytest.mark.asyncio
+async def test__jobs_queue__lock():
+    m = middleware()
+    queue = JobsQueue(m)
+    running = []
+    max_running = []
+
+    async def method(job, i):
+        running.append(i)
+        max_running.append(len(running))
+        await asyncio.sleep(0.01)
+        running.remove(i)
+
+    jobs = [queue.add(make_job(m, 'locked', method, [i], lock='lock')) for i in range(5)]
+    await run_queue(queue, jobs)
+
+    assert max(max_running) == 1
+    assert queue.job_locks == {}
+
+
+@pytest.mark.asyncio
+async def test__jobs_queue__lock_queue_size():
+    m = middleware()
+    queue = JobsQueue(m)
+
+    async def method(job):
+        pass
+
+    first = queue.add(make_job(m, 'locked', method, lock='lock', lock_queue_size=1))
+    assert queue.add(make_job(m, 'locked', method, lock='lock', lock_queue_size=1)) is first
+
+    await run_queue(queue, [first])
+
+
+@pytest.mark.asyncio
+async def test__jobs_queue__max_concurrency():
+    m = middleware()
+    queue = JobsQueue(m)
+    running = []
+    max_running = []
+
+    async def method(job, i):
+        running.append(i)
+        max_running.append(len(running))
+        await asyncio.sleep(0.01)
+        running.remove(i)
+
+    jobs = [queue.add(make_job(m, 'capped', method, [i], max_concurrency=3)) for i in range(10)]
+    await run_queue(queue, jobs)
+
+    assert max(max_running) == 3
+    stats = queue.stats()
+    assert stats['capped']['finished'] == 10
+    assert stats['capped']['waiting'] == 0
+    assert stats['capped']['running'] == 0
+    assert stats['capped']['wait_max'] > 0
+
+
+@pytest.mark.asyncio
+async def test__jobs_queue__lock_and_max_concurrency():
+    m = middleware()
+    queue = JobsQueue(m)
+    running = []
+
+    async def method(job, i):
+        running.append(i)
+        assert len(running) <= 2
+        await asyncio.sleep(0.01)
+        running.remove(i)
+
+    jobs = [
+        queue.add(make_job(m, 'both', method, [i], lock=lambda args: f'lock{args[0] % 2}', max_concurrency=2))
+        for i in range(8)
+    ]
+    await run_queue(queue, jobs)
+
+    assert all(j.state.name == 'SUCCESS' for j in jobs)
@@ -0,0 +1,224 @@
+import asyncio
+import base64
+import errno
+
+from aiohttp import web
+from mock import Mock
+import pytest
+
+from middlewared.client import ejson as json
+from middlewared.main import Application, Middleware
+from middlewared.restful import RESTfulAPI
+from middlewared.service import CallError, ValidationError
+
+
+class FakeMiddleware(object):
+    call_method = Middleware.call_method
+    run_concurrently = Middleware.run_concurrently
+
+    def __init__(self, methods):
+        self.methods = methods
+
+    def _method_lookup(self, name):
+        if name not in self.methods:
+            raise CallError(f'Method "{name}" not found', CallError.ENOMETHOD)
+        return None, self.methods[name]
+
+    async def _call(self, name, serviceobj, methodobj, params, **kwargs):
+        return await methodobj(*params)
+
+    async def call(self, name, *params):
+        return await self._call(name, *self._method_lookup(name), params)
+
+    def dump_args(self, args, method=None, method_name=None):
+        return args
+
+
+async def sleep(value, delay):
+    await asyncio.sleep(delay)
+    return value
+
+
+async def fail():
+    raise CallError('Failed', errno.ENOENT)
+
+
+async def invalid():
+    raise ValidationError('test.invalid.name', 'Name is required', errno.EINVAL)
+
+
+async def check_user(username, password):
+    return password == 'secret'
+
+
+async def login():
+    return True
+
+
+login._no_auth_required = True
+
+METHODS = {
+    'test.sleep': sleep,
+    'test.fail': fail,
+    'test.invalid': invalid,
+    'test.login': login,
+    'auth.check_user': check_user,
+}
+
+
+def application(authenticated=True):
+    app = Application(FakeMiddleware(METHODS), asyncio.get_event_loop(), Mock(), Mock())
+    app.authenticated = authenticated
+    app.sent = []
+    app._send = app.sent.append
+    return app
+
+
+@pytest.mark.asyncio
+async def test__call_multi__results_in_order():
+    app = application()
+    await app.call_multi({'id': 'multi', 'msg': 'multi', 'calls': [
+        {'method': 'test.sleep', 'params': [i, (5 - i) / 100]} for i in range(5)
+    ]})
+
+    assert app.sent == [{
+        'id': 'multi',
+        'msg': 'result',
+        'result': [{'id': i, 'msg': 'result', 'result': i} for i in range(5)],
+    }]
+
+
+@pytest.mark.asyncio
+async def test__call_multi__errors_per_call():
+    app = application()
+    await app.call_multi({'id': 'multi', 'msg': 'multi', 'calls': [
+        {'method': 'test.fail'},
+        {'method': 'test.sleep', 'params': ['ok', 0]},
+        {'method': 'test.invalid'},
+        {'method': 'test.missing'},
+    ]})
+
+    results = app.sent[0]['result']
+    assert results[0]['error']['error'] == errno.ENOENT
+    assert results[1]['result'] == 'ok'
+    assert results[2]['error']['type'] == 'VALIDATION'
+    assert results[2]['error']['extra'] == [('test.invalid.name', 'Name is required', errno.EINVAL)]
+    assert results[3]['error']['error'] == CallError.ENOMETHOD
+
+
+@pytest.mark.asyncio
+async def test__call_multi__timeout():
+    app = application()
+    await app.call_multi({'id': 'multi', 'msg': 'multi', 'timeout': 0.1, 'concurrency': 1, 'calls': [
+        {'method': 'test.sleep', 'params': ['fast', 0]},
+        {'method': 'test.sleep', 'params': ['slow', 1]},
+        {'method': 'test.sleep', 'params': ['queued', 0]},
+    ]})
+
+    results = app.sent[0]['result']
+    assert results[0]['result'] == 'fast'
+    assert results[1]['error']['error'] == errno.ETIMEDOUT
+    assert results[2]['error']['error'] == errno.ETIMEDOUT
+
+
+@pytest.mark.asyncio
+async def test__call_multi__not_authenticated():
+    app = application(authenticated=False)
+    await app.call_multi({'id': 'multi', 'msg': 'multi', 'calls': [
+        {'method': 'test.sleep', 'params': ['ok', 0]},
+        {'method': 'test.login'},
+    ]})
+
+    results = app.sent[0]['result']
+    assert results[0]['error']['error'] == errno.EACCES
+    assert results[1]['result'] is True
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('message', [
+    {'calls': 'test.sleep'},
+    {'calls': [{'params': []}]},
+    {'calls': [], 'timeout': 'soon'},
+    {'calls': [], 'concurrency': 1.5},
+])
+async def test__call_multi__invalid(message):
+    app = application()
+    await app.call_multi(dict(message, id='multi', msg='multi'))
+
+    assert app.sent[0]['error']['error'] == errno.EINVAL
+
+
+@pytest.mark.asyncio
+async def test__run_concurrently__concurrency_limit():
+    running = []
+    peak = []
+
+    async def call():
+        running.append(1)
+        peak.append(len(running))
+        await asyncio.sleep(0.01)
+        running.pop()
+
+    tasks = await FakeMiddleware({}).run_concurrently([call] * 10, concurrency=3)
+
+    assert all(task.done() for task in tasks)
+    assert max(peak) == 3
+
+
+def request(body, password='secret'):
+    async def json_():
+        return body
+
+    auth = base64.b64encode(f'root:{password}'.encode()).decode()
+    return Mock(headers={'Authorization': f'Basic {auth}'}, json=json_)
+
+
+def restful_api():
+    api = RESTfulAPI(FakeMiddleware(METHODS), Mock())
+    api._methods = {name: {'require_websocket': False} for name in METHODS}
+    return api
+
+
+@pytest.mark.asyncio
+async def test__restful_multi__results():
+    resp = await restful_api().multi(request({'calls': [
+        {'method': 'test.sleep', 'params': ['slow', 0.05]},
+        {'method': 'test.fail'},
+        {'method': 'test.invalid'},
+        {'method': 'test.missing'},
+        {'method': 'test.sleep', 'params': ['fast', 0]},
+    ]}))
+
+    assert json.loads(resp.text) == [
+        {'result': 'slow'},
+        {'error': {'message': 'Failed', 'errno': errno.ENOENT}},
+        {'error': {'test.invalid.name': [{'message': 'Name is required', 'errno': errno.EINVAL}]}},
+        {'error': {'message': 'Method test.missing not found', 'errno': CallError.ENOMETHOD}},
+        {'result': 'fast'},
+    ]
+
+
+@pytest.mark.asyncio
+async def test__restful_multi__timeout():
+    resp = await restful_api().multi(request({'timeout': 0.1, 'calls': [
+        {'method': 'test.sleep', 'params': ['slow', 1]},
+        {'method': 'test.sleep', 'params': ['fast', 0]},
+    ]}))
+
+    assert json.loads(resp.text) == [
+        {'error': {'message': 'Call timed out', 'errno': errno.ETIMEDOUT}},
+        {'result': 'fast'},
+    ]
+
+
+@pytest.mark.asyncio
+async def test__restful_multi__not_authenticated():
+    with pytest.raises(web.HTTPUnauthorized):
+        await restful_api().multi(request({'calls': []}, password='wrong'))
+
+
+@pytest.mark.asyncio
+async def test__restful_multi__invalid():
+    resp = await restful_api().multi(request({'calls': [], 'timeout': 'soon'}))
+
+    assert resp.status == 400
@@ -0,0 +1,82 @@
+import asyncio
+import os
+import threading
+
+from mock import Mock
+import pytest
+
+from middlewared.pipe import Pipe
+
+DATA = os.urandom(3 * 1048576 + 1)
+
+
+def middleware():
+    m = Mock()
+
+    async def run_in_thread(method, *args, **kwargs):
+        return await asyncio.get_event_loop().run_in_executor(None, lambda: method(*args, **kwargs))
+
+    m.run_in_thread = run_in_thread
+    return m
+
+
+@pytest.mark.asyncio
+async def test__pipe_reader():
+    pipe = Pipe(middleware())
+
+    def write():
+        pipe.w.write(DATA)
+        pipe.w.close()
+
+    thread = threading.Thread(target=write)
+    thread.start()
+
+    reader = await pipe.reader(65536)
+    chunks = []
+    while True:
+        read = await reader.read(65536)
+        if read == b'':
+            break
+        assert len(read) <= 65536
+        chunks.append(read)
+    thread.join()
+    await pipe.close()
+
+    assert b''.join(chunks) == DATA
+
+
+@pytest.mark.asyncio
+async def test__pipe_writer():
+    m = middleware()
+    pipe = Pipe(m)
+    read = asyncio.ensure_future(m.run_in_thread(pipe.r.read))
+
+    writer = await pipe.writer()
+    for i in range(0, len(DATA), 65536):
+        writer.write(DATA[i:i + 65536])
+        await writer.drain()
+    writer.close()
+
+    assert await read == DATA
+    await pipe.close()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('file_response', [False, True])
+async def test__pipe_copy_file(tmpdir, file_response):
+    path = str(tmpdir.join('file'))
+    with open(path, 'wb') as f:
+        f.write(DATA)
+
+    m = middleware()
+    pipe = Pipe(m, file_response)
+    read = asyncio.ensure_future(m.run_in_thread(pipe.r.read))
+    await pipe.copy_file(path)
+
+    if file_response:
+        assert await read == b''
+        assert pipe.path == path
+    else:
+        assert await read == DATA
+        assert pipe.path is None
+    await pipe.close()
@@ -0,0 +1,119 @@
+import os
+import tracemalloc
+
+import aiohttp
+from aiohttp import web
+import pytest
+
+from middlewared.client import ejson as json
+from middlewared.restful import STREAM_CHUNK_SIZE, decode_cursor, encode_cursor, json_chunks, write_json_chunks
+from middlewared.utils import filter_list
+
+ROWS = 100000
+
+
+def rows():
+    for i in range(ROWS):
+        yield {'id': i, 'name': f'tank/ds{i % 100}@auto-{i:06d}', 'used': i * 1024, 'properties': {'a': None}}
+
+
+@pytest.mark.parametrize('result', [[], [1], {'a': [1, 2]}, None, list(rows())[:100]])
+@pytest.mark.parametrize('indent', [None, True])
+def test__json_chunks__same_as_dumps(result, indent):
+    assert ''.join(json_chunks(result, indent)) == json.dumps(result, indent=indent)
+
+
+def peak_memory(fn):
+    tracemalloc.start()
+    try:
+        rv = fn()
+        return rv, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def test__json_chunks__peak_memory():
+    size, full_peak = peak_memory(lambda: len(json.dumps(list(rows()))))
+    streamed, streamed_peak = peak_memory(lambda: sum(len(chunk) for chunk in json_chunks(rows())))
+
+    assert streamed == size
+    assert streamed_peak < full_peak / 10
+
+
+def page(items, query, limit):
+    filters = []
+    options = {'limit': limit, 'order_by': ['id']}
+    if query is not None:
+        decode_cursor(query, filters, options)
+    result = filter_list(items, filters, options)
+    cursor = None
+    if len(result) == limit:
+        cursor = encode_cursor(options['order_by'], result[-1], (options.get('offset') or 0) + len(result))
+    return result, cursor
+
+
+def test__cursor__stable_pages():
+    items = list(rows())[:1000]
+
+    first, cursor = page(items, None, 100)
+    assert [i['id'] for i in first] == list(range(100))
+
+    # Items removed before the cursor do not shift the next page
+    del items[:50]
+    second, cursor = page(items, cursor, 100)
+    assert [i['id'] for i in second] == list(range(100, 200))
+
+
+def test__cursor__offset():
+    filters = []
+    options = {}
+    decode_cursor(encode_cursor(['-used', 'id'], {'id': 5}, 200), filters, options)
+    assert filters == []
+    assert options == {'order_by': ['-used', 'id'], 'offset': 200}
+
+
+def test__cursor__invalid():
+    with pytest.raises(ValueError):
+        decode_cursor('not a cursor', [], {})
+
+
+def failing_rows(count):
+    for i in range(count):
+        yield {'id': i, 'name': 'x' * 100}
+    raise RuntimeError('Failed')
+
+
+async def get_streamed(tmpdir, result):
+    async def handler(request):
+        return await write_json_chunks(request, web.StreamResponse(), json_chunks(result))
+
+    app = web.Application()
+    app.router.add_route('GET', '/', handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    socket = os.path.join(str(tmpdir), 'middlewared.sock')
+    await web.UnixSite(runner, socket).start()
+    try:
+        async with aiohttp.ClientSession(connector=aiohttp.UnixConnector(path=socket)) as session:
+            async with session.get('http://localhost/') as resp:
+                return resp.status, await resp.text()
+    finally:
+        await runner.cleanup()
+
+
+@pytest.mark.asyncio
+async def test__write_json_chunks__complete(tmpdir):
+    result = list(rows())[:2000]
+    assert await get_streamed(tmpdir, (row for row in result)) == (200, json.dumps(result))
+
+
+@pytest.mark.asyncio
+async def test__write_json_chunks__early_failure(tmpdir):
+    assert (await get_streamed(tmpdir, failing_rows(1)))[0] == 500
+
+
+@pytest.mark.asyncio
+async def test__write_json_chunks__late_failure(tmpdir):
+    # Fails after the first chunk has been sent
+    with pytest.raises(aiohttp.ClientPayloadError):
+        await get_streamed(tmpdir, failing_rows(2 * STREAM_CHUNK_SIZE // 100))
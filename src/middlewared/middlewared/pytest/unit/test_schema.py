@@ -533,3 +533,40 @@ def test__schema_str_job_default():
     jobm = Mock()
 
     assert strdef(self, jobm, 'foo') == 'BAR'
+
+
+def test__schema_args_not_modified():
+
+    @accepts(Dict(
+        'data',
+        List('list', items=[Dict('item', Str('name', default='NAME'))]),
+        Dict('extra', additional_attrs=True),
+        Str('default', default='DEFAULT'),
+    ))
+    def dictdef(self, data):
+        data['list'][0]['new'] = True
+        data['extra']['a'].append(2)
+        return data
+
+    self = Mock()
+    data = {'list': [{}], 'extra': {'a': [1]}}
+
+    assert dictdef(self, data) == {
+        'list': [{'name': 'NAME', 'new': True}],
+        'extra': {'a': [1, 2]},
+        'default': 'DEFAULT',
+    }
+    assert data == {'list': [{}], 'extra': {'a': [1]}}
+
+
+def test__schema_default_not_shared():
+
+    @accepts(List('data', default=[]))
+    def listdef(self, data):
+        data.append(1)
+        return data
+
+    self = Mock()
+
+    assert listdef(self) == [1]
+    assert listdef(self) == [1]
@@ -0,0 +1,117 @@
+import sys
+import types
+
+import pytest
+
+django = pytest.importorskip('django')
+
+from django.conf import settings  # noqa
+
+if not settings.configured:
+    settings.configure(
+        DATABASES={'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}},
+        INSTALLED_APPS=['django.contrib.contenttypes'],
+    )
+    django.setup()
+
+from django.db import connection, models  # noqa
+from django.test.utils import CaptureQueriesContext  # noqa
+from mock import patch  # noqa
+
+from middlewared.utils import django_modelobj_serialize, django_queryset_optimize  # noqa
+
+
+class Group(models.Model):
+    name = models.CharField(max_length=120)
+
+    class Meta:
+        app_label = 'contenttypes'
+
+
+class Host(models.Model):
+    name = models.CharField(max_length=120)
+
+    class Meta:
+        app_label = 'contenttypes'
+
+
+class User(models.Model):
+    name = models.CharField(max_length=120)
+    group = models.ForeignKey(Group, on_delete=models.CASCADE)
+    hosts = models.ManyToManyField(Host)
+
+    class Meta:
+        app_label = 'contenttypes'
+
+
+class Share(models.Model):
+    share_name = models.CharField(max_length=120)
+    share_comment = models.CharField(max_length=120)
+    share_owner = models.ForeignKey(User, null=True, on_delete=models.SET_NULL)
+    share_hosts = models.ManyToManyField(Host)
+
+    class Meta:
+        app_label = 'contenttypes'
+
+
+# `django_modelobj_serialize` special cases freenasUI address fields
+IPAddressField = types.ModuleType('freenasUI.contrib.IPAddressField')
+for name in ('IPAddressField', 'IP4AddressField', 'IP6AddressField'):
+    setattr(IPAddressField, name, type(name, (models.Field,), {}))
+
+
+@pytest.fixture(scope='module')
+def shares():
+    with connection.schema_editor() as editor:
+        for model in (Group, Host, User, Share):
+            editor.create_model(model)
+
+    hosts = [Host.objects.create(name=f'host{i}') for i in range(3)]
+    for i in range(20):
+        user = User.objects.create(name=f'user{i}', group=Group.objects.create(name=f'group{i}'))
+        user.hosts.add(*hosts[:2])
+        share = Share.objects.create(share_name=f'share{i}', share_comment='', share_owner=user if i % 2 else None)
+        share.share_hosts.add(*hosts)
+
+    # Dangling foreign key, should be serialized as `None` and the row kept
+    with connection.constraint_checks_disabled():
+        User.objects.create(name='orphan', group_id=1000)
+
+    with patch.dict(sys.modules, {'freenasUI.contrib.IPAddressField': IPAddressField}):
+        yield
+
+
+def serialize(qs, **kwargs):
+    return [django_modelobj_serialize(None, i, **kwargs) for i in qs]
+
+
+def test__django_queryset_optimize__query_count(shares):
+    with CaptureQueriesContext(connection) as unoptimized:
+        expected = serialize(Share.objects.all(), field_prefix='share_')
+
+    with CaptureQueriesContext(connection) as optimized:
+        result = serialize(django_queryset_optimize(Share.objects.all(), field_prefix='share_'), field_prefix='share_')
+
+    assert result == expected
+    assert len(unoptimized.captured_queries) > 20
+    # shares joined with owner, then owner group, owner hosts and share hosts prefetched
+    assert len(optimized.captured_queries) == 4
+
+
+def test__django_queryset_optimize__select(shares):
+    qs = django_queryset_optimize(Share.objects.all(), field_prefix='share_', select=['id', 'name', 'hosts'])
+    with CaptureQueriesContext(connection) as optimized:
+        result = serialize(qs, field_prefix='share_', select=['id', 'name', 'hosts'])
+
+    assert set(result[0].keys()) == {'id', 'name', 'hosts'}
+    assert len(result[0]['hosts']) == 3
+    assert len(optimized.captured_queries) == 2
+    assert 'share_comment' not in optimized.captured_queries[0]['sql']
+
+
+def test__django_queryset_optimize__dangling_foreign_key(shares):
+    result = serialize(django_queryset_optimize(User.objects.order_by('id')))
+
+    assert len(result) == 21
+    assert result[-1]['name'] == 'orphan'
+    assert result[-1]['group'] is None
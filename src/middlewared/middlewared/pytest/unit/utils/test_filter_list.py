@@ -1,3 +1,5 @@
+import pytest
+
 from middlewared.utils import filter_list
 
 
@@ -84,3 +86,62 @@ def test__filter_list_OR_eq2():
         ['number', '=', 1],
         ['number', '=', 2],
     ]]])) == 2
+
+
+def test__filter_list_nested_path():
+    assert filter_list([{'a': {'b': 1}}, {'a': {'b': 2}}], [['a.b', '=', 2]]) == [{'a': {'b': 2}}]
+
+
+def test__filter_list_invalid_operation():
+    with pytest.raises(ValueError):
+        filter_list(DATA, [['number', 'foo', 1]])
+
+
+def test__filter_list_order_by():
+    assert [i['number'] for i in filter_list(DATA, [], {'order_by': ['-number']})] == [3, 2, 1]
+
+
+def test__filter_list_order_by_multiple_keys():
+    data = [
+        {'a': 1, 'b': 'x'},
+        {'a': 2, 'b': 'y'},
+        {'a': 1, 'b': 'y'},
+        {'a': 2, 'b': 'x'},
+    ]
+    assert [(i['a'], i['b']) for i in filter_list(data, [], {'order_by': ['a', '-b']})] == [
+        (1, 'y'), (1, 'x'), (2, 'y'), (2, 'x'),
+    ]
+    assert [(i['a'], i['b']) for i in filter_list(data, [], {'order_by': ['-a', '-b']})] == [
+        (2, 'y'), (2, 'x'), (1, 'y'), (1, 'x'),
+    ]
+
+
+def test__filter_list_order_by_none():
+    data = [{'a': 2}, {'a': None}, {'a': 1}]
+    assert [i['a'] for i in filter_list(data, [], {'order_by': ['a']})] == [None, 1, 2]
+
+
+def test__filter_list_order_by_select():
+    assert filter_list(DATA, [], {'order_by': ['-number'], 'select': ['foo']}) == [
+        {'foo': '_foo_'}, {'foo': 'foo2'}, {'foo': 'foo1'},
+    ]
+
+
+def test__filter_list_limit_offset():
+    assert [i['number'] for i in filter_list(DATA, [], {'limit': 2})] == [1, 2]
+    assert [i['number'] for i in filter_list(DATA, [], {'offset': 1})] == [2, 3]
+    assert [i['number'] for i in filter_list(DATA, [], {'offset': 1, 'limit': 1})] == [2]
+    assert [i['number'] for i in filter_list(DATA, [['number', '>', 1]], {
+        'order_by': ['-number'], 'limit': 1,
+    })] == [3]
+
+
+def test__filter_list_count_ignores_limit():
+    assert filter_list(DATA, [['number', '>', 1]], {'count': True, 'limit': 1}) == 2
+
+
+def test__filter_list_get():
+    assert filter_list(DATA, [['number', '>', 1]], {'get': True})['number'] == 2
+    assert filter_list(DATA, [], {'get': True, 'order_by': ['-number']})['number'] == 3
+    with pytest.raises(IndexError):
+        filter_list(DATA, [['number', '>', 3]], {'get': True})
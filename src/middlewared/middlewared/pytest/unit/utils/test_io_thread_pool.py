@@ -0,0 +1,130 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from middlewared.utils.io_thread_pool import IoThreadPoolExecutor
+
+
+def test__io_thread_pool__reuses_idle_threads():
+    pool = IoThreadPoolExecutor(max_workers=4)
+
+    idents = set()
+    for i in range(20):
+        idents.add(pool.submit(threading.get_ident).result())
+        # Give the thread a chance to go back to idle
+        time.sleep(0.01)
+
+    assert len(idents) == 1
+    assert pool.stats()['threads'] == 1
+
+
+def test__io_thread_pool__result_and_exception():
+    pool = IoThreadPoolExecutor()
+
+    assert pool.submit(lambda x, y=0: x + y, 1, y=2).result() == 3
+
+    def fail():
+        raise ValueError('fail')
+
+    with pytest.raises(ValueError):
+        pool.submit(fail).result()
+
+
+def test__io_thread_pool__nested_call_does_not_deadlock():
+    pool = IoThreadPoolExecutor(max_workers=1)
+
+    def nested(depth):
+        if depth == 0:
+            return 0
+        return pool.submit(nested, depth - 1).result(timeout=5) + 1
+
+    assert pool.submit(nested, 5).result(timeout=10) == 5
+    assert pool.stats()['overflows'] == 5
+
+
+def test__io_thread_pool__queues_calls_past_limit():
+    pool = IoThreadPoolExecutor(max_workers=2)
+    event = threading.Event()
+
+    futures = [pool.submit(event.wait) for i in range(5)]
+    stats = pool.stats()
+    assert stats['threads'] == 2
+    assert stats['transient'] == 0
+    assert stats['queued'] == 3
+
+    event.set()
+    for f in futures:
+        f.result(timeout=5)
+
+    stats = pool.stats()
+    assert stats['threads'] == 2
+    assert stats['queued'] == 0
+    assert stats['methods']['Event.wait']['calls'] == 5
+
+
+def test__io_thread_pool__nested_call_through_coroutine():
+    pool = IoThreadPoolExecutor(max_workers=1)
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    async def run_in_thread(method):
+        return await loop.run_in_executor(pool, method)
+
+    def call_sync():
+        # The only pooled thread is busy running this method
+        return asyncio.run_coroutine_threadsafe(run_in_thread(lambda: 1), loop).result(timeout=5)
+
+    try:
+        assert asyncio.run_coroutine_threadsafe(run_in_thread(call_sync), loop).result(timeout=10) == 1
+        assert pool.stats()['overflows'] == 1
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+
+
+def test__io_thread_pool__shutdown_waits():
+    pool = IoThreadPoolExecutor(max_workers=2)
+    done = []
+
+    def method():
+        time.sleep(0.1)
+        done.append(1)
+
+    for i in range(3):
+        pool.submit(method)
+    pool.shutdown(wait=True)
+
+    assert done == [1, 1, 1]
+    assert pool.stats()['threads'] == 0
+    with pytest.raises(RuntimeError):
+        pool.submit(method)
+
+
+def test__io_thread_pool__idle_timeout():
+    pool = IoThreadPoolExecutor(idle_timeout=0.1)
+    pool.submit(lambda: None).result()
+
+    for i in range(50):
+        if pool.stats()['threads'] == 0:
+            break
+        time.sleep(0.1)
+    assert pool.stats()['threads'] == 0
+
+    assert pool.submit(lambda: 1).result() == 1
+
+
+def test__io_thread_pool__method_stats():
+    pool = IoThreadPoolExecutor()
+
+    def method():
+        pass
+
+    for i in range(3):
+        pool.submit(method).result()
+
+    stats = pool.stats()['methods'][method.__qualname__]
+    assert stats['calls'] == 3
+    assert stats['wait_max'] >= stats['wait_avg'] >= 0
@@ -0,0 +1,183 @@
+import math
+import os
+import struct
+
+from mock import Mock, patch
+import pytest
+
+from middlewared.plugins.stats import StatsService
+from middlewared.utils import rrd
+
+LAST_UPDATE = 1000000005
+
+
+def create_rrd(path, step, last_update, datasources, rras):
+    """
+    Write an RRD file the way rrdtool does. `rras` is a list of
+    `(cf, pdp_cnt, cur_row, rows)`, `rows` being oldest first and holding one
+    value per datasource.
+    """
+    data = rrd.STAT_HEAD.pack(b'RRD\0', b'0003', rrd.FLOAT_COOKIE, len(datasources), len(rras), step)
+    for name, dst in datasources:
+        data += rrd.DS_DEF.pack(name.encode(), dst.encode())
+    for cf, pdp_cnt, cur_row, rows in rras:
+        data += rrd.RRA_DEF.pack(cf.encode(), len(rows), pdp_cnt)
+    data += rrd.LIVE_HEAD.pack(last_update)
+    data += bytes(rrd.PDP_PREP_SIZE * len(datasources) + rrd.CDP_PREP_SIZE * len(datasources) * len(rras))
+    for cf, pdp_cnt, cur_row, rows in rras:
+        data += rrd.RRA_PTR.pack(cur_row)
+    for cf, pdp_cnt, cur_row, rows in rras:
+        # Newest row is stored at `cur_row`
+        for i in range(len(rows)):
+            data += struct.pack(f'<{len(datasources)}d', *rows[(i - cur_row - 1) % len(rows)])
+
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+@pytest.fixture
+def rrd_path(tmpdir):
+    """
+    `rrdtool create load.rrd --step 10 DS:value:GAUGE:20:U:U DS:other:GAUGE:20:U:U
+    RRA:AVERAGE:0.5:1:6 RRA:AVERAGE:0.5:3:4 RRA:MAX:0.5:1:6` updated up to
+    `LAST_UPDATE`.
+    """
+    os.makedirs(os.path.join(str(tmpdir), 'cpu-0'))
+    path = os.path.join(str(tmpdir), 'cpu-0', 'load.rrd')
+    create_rrd(path, 10, LAST_UPDATE, [('value', 'GAUGE'), ('other', 'GAUGE')], [
+        # 999999950 to 1000000000
+        ('AVERAGE', 1, 2, [(1, 2), (2, math.nan), (3, 6), (4, 8), (5, math.nan), (6, 12)]),
+        # 999999900 to 999999990
+        ('AVERAGE', 3, 0, [(10, 1), (20, 2), (30, 3), (40, 4)]),
+        ('MAX', 1, 5, [(1.5, 2), (2.5, 4), (3.5, 6), (4.5, 8), (5.5, 10), (6.5, 12)]),
+    ])
+    return path
+
+
+def test__rrd__info(rrd_path):
+    with rrd.RRD(rrd_path) as f:
+        assert f.info() == {
+            'step': 10,
+            'last_update': LAST_UPDATE,
+            'datasets': {'value': {'type': 'GAUGE'}, 'other': {'type': 'GAUGE'}},
+        }
+
+
+def test__rrd__not_an_rrd(tmpdir):
+    path = os.path.join(str(tmpdir), 'file')
+    with open(path, 'wb') as f:
+        f.write(b'0' * 1024)
+
+    with pytest.raises(rrd.RRDError):
+        rrd.RRD(path)
+
+
+@pytest.mark.parametrize('cf,start,end,step,expected', [
+    # rrdtool fetch load.rrd AVERAGE -s 999999960 -e 1000000000 -r 10
+    ('AVERAGE', 999999960, 1000000000, 10, (999999960, 1000000000, 10, (3, 4, 5, 6))),
+    # rrdtool fetch load.rrd AVERAGE -s 999999900 -e 1000000000 -r 10
+    ('AVERAGE', 999999900, 1000000000, 10, (999999900, 1000000020, 30, (20, 30, 40, math.nan))),
+    # rrdtool fetch load.rrd AVERAGE -s 999999960 -e 1000000000 -r 30
+    ('AVERAGE', 999999960, 1000000000, 30, (999999960, 1000000020, 30, (40, math.nan))),
+    # rrdtool fetch load.rrd MAX -s 999999955 -e 999999985 -r 10
+    ('MAX', 999999955, 999999985, 10, (999999950, 999999990, 10, (2.5, 3.5, 4.5, 5.5))),
+])
+def test__rrd__fetch(rrd_path, cf, start, end, step, expected):
+    result = rrd.fetch(rrd_path, 'value', cf, start, end, step)
+
+    assert result[:3] == expected[:3]
+    assert [None if math.isnan(v) else v for v in result[3]] == [
+        None if math.isnan(v) else v for v in expected[3]
+    ]
+
+
+def test__rrd__fetch_unknown_cf(rrd_path):
+    with pytest.raises(rrd.RRDError):
+        rrd.fetch(rrd_path, 'value', 'MIN', 999999960, 1000000000, 10)
+
+
+@pytest.mark.parametrize('defs,start,end,step,max_points,expected', [
+    # rrdtool xport -s 999999940 -e 1000000000 --step 10 DEF:a=load.rrd:value:AVERAGE XPORT:a
+    #   DEF:b=load.rrd:other:AVERAGE XPORT:b
+    (
+        [('value', 'AVERAGE'), ('other', 'AVERAGE')], 999999940, 1000000000, 10, None,
+        (999999940, 1000000000, 10, [[1, 2], [2, None], [3, 6], [4, 8], [5, None], [6, 12]]),
+    ),
+    # rrdtool xport -s 999999940 -e 1000000000 --step 10 --maxrows 3 ...
+    (
+        [('value', 'AVERAGE'), ('other', 'AVERAGE')], 999999940, 1000000000, 10, 3,
+        (999999940, 1000000000, 20, [[1.5, 2], [3.5, 7], [5.5, 12]]),
+    ),
+    # rrdtool xport -s 999999940 -e 1000000000 --step 20 DEF:a=load.rrd:value:MAX XPORT:a
+    (
+        [('value', 'MAX')], 999999940, 1000000000, 20, None,
+        (999999940, 1000000000, 20, [[2.5], [4.5], [6.5]]),
+    ),
+])
+def test__rrd__xport(rrd_path, defs, start, end, step, max_points, expected):
+    assert rrd.xport(
+        [(rrd_path, ds, cf) for ds, cf in defs], start, end, step, max_points,
+    ) == expected
+
+
+def test__rrd__fetch_cached_until_updated(rrd_path):
+    rrd.fetch(rrd_path, 'value', 'AVERAGE', 999999960, 1000000000, 10)
+    with patch('middlewared.utils.rrd.RRD.read') as read:
+        rrd.fetch(rrd_path, 'value', 'AVERAGE', 999999960, 1000000000, 10)
+        read.assert_not_called()
+
+    create_rrd(rrd_path, 10, LAST_UPDATE + 10, [('value', 'GAUGE'), ('other', 'GAUGE')], [
+        ('AVERAGE', 1, 0, [(2, 0), (3, 0), (4, 0), (5, 0), (6, 0), (7, 0)]),
+    ])
+    assert rrd.fetch(rrd_path, 'value', 'AVERAGE', 999999960, 1000000010, 10)[3] == (3, 4, 5, 6, 7)
+
+
+@pytest.mark.parametrize('start,end,expected', [
+    ('now-1h', 'now', (1000000000 - 3600, 1000000000)),
+    ('end-2d', 'now-30min', (1000000000 - 1800 - 2 * 86400, 1000000000 - 1800)),
+    ('999990000', 'start+1w', (999990000, 999990000 + 604800)),
+    ('N-90s', 'N', (1000000000 - 90, 1000000000)),
+    ('-1h', '-30min', (1000000000 - 3600, 1000000000 - 1800)),
+    ('-86400', 'now', (1000000000 - 86400, 1000000000)),
+])
+def test__rrd__parse_times(start, end, expected):
+    assert rrd.parse_times(start, end, now=1000000000) == expected
+
+
+@pytest.mark.parametrize('start,end', [
+    ('yesterday', 'now'),
+    ('now-1fortnight', 'now'),
+    ('end-1h', 'start+1h'),
+    ('', 'now'),
+])
+def test__rrd__parse_times_invalid(start, end):
+    with pytest.raises(ValueError):
+        rrd.parse_times(start, end, now=1000000000)
+
+
+def test__stats_service__get_data(rrd_path, tmpdir):
+    with patch('middlewared.plugins.stats.RRD_PATH', str(tmpdir)):
+        data = StatsService(Mock()).get_data([
+            {'source': 'cpu-0', 'type': 'load', 'dataset': 'value', 'cf': 'AVERAGE'},
+        ], {'step': 10, 'start': '999999960', 'end': '1000000000', 'max_points': None})
+
+    assert data == {
+        'about': 'Data for cpu-0/load',
+        'meta': {'start': 999999970, 'end': 1000000000, 'step': 10, 'legend': ['cpu-0/load']},
+        'data': [[3], [4], [5], [6]],
+    }
+
+
+def test__stats_service__get_data_max_points_default(rrd_path, tmpdir):
+    with patch('middlewared.plugins.stats.RRD_PATH', str(tmpdir)):
+        service = StatsService(Mock())
+        stats = service.get_data.accepts[1].clean({'step': 10, 'start': '999999940', 'end': '1000000000'})
+        assert stats['max_points'] == 400
+
+        stats['max_points'] = 3
+        data = service.get_data([
+            {'source': 'cpu-0', 'type': 'load', 'dataset': 'value', 'cf': 'AVERAGE'},
+        ], stats)
+
+    assert data['meta']['step'] == 20
+    assert len(data['data']) == 3
@@ -0,0 +1,74 @@
+import asyncio
+import subprocess
+import textwrap
+
+import pytest
+
+from middlewared.utils.rsync import parse_progress2, parse_size, read_lines
+
+# Progress as printed by `rsync --info=progress2 -h`, rewriting the line with CR
+FAKE_RSYNC = textwrap.dedent("""\
+    #!/bin/sh
+    echo "sending incremental file list"
+    printf "              0   0%%    0.00kB/s    0:00:00\\r"
+    printf "         32.77K   1%%   31.25MB/s    0:00:00\\r"
+    printf "          1.05M  50%%    1.00MB/s    0:00:01 (xfr#1, to-chk=2/4)\\r"
+    printf "          2.10M 100%%    2.00MB/s    0:00:01 (xfr#2, to-chk=0/4)\\n"
+    echo ""
+    echo "sent 2.10M bytes  received 54 bytes  1.40M bytes/sec"
+""")
+
+
+@pytest.mark.parametrize('size,value', [
+    ('0', 0),
+    ('1,234,567', 1234567),
+    ('32.77K', 32770),
+    ('1.05M', 1050000),
+    ('2G', 2000000000),
+])
+def test__parse_size(size, value):
+    assert parse_size(size) == value
+
+
+def test__parse_progress2():
+    assert parse_progress2('      1,234,567  45%   12.34MB/s    1:02:03 (xfr#3, ir-chk=1000/1020)') == {
+        'percent': 45,
+        'bytes_transferred': 1234567,
+        'rate': 12340000,
+        'eta': 3723,
+        'files_transferred': 3,
+        'files_remaining': 1000,
+        'files_total': 1020,
+    }
+
+
+@pytest.mark.parametrize('line', ['sending incremental file list', 'sent 2.10M bytes  received 54 bytes', ''])
+def test__parse_progress2__not_progress(line):
+    assert parse_progress2(line) is None
+
+
+@pytest.mark.asyncio
+async def test__read_lines__fake_rsync(tmpdir):
+    rsync = tmpdir.join('rsync')
+    rsync.write(FAKE_RSYNC)
+    rsync.chmod(0o755)
+
+    proc = await asyncio.create_subprocess_exec(str(rsync), stdout=subprocess.PIPE)
+    lines = [line async for line in read_lines(proc.stdout, chunk_size=16)]
+    await proc.wait()
+
+    assert len(lines) == 6
+    assert lines[0] == 'sending incremental file list'
+    assert lines[-1] == 'sent 2.10M bytes  received 54 bytes  1.40M bytes/sec'
+
+    progress = [p for p in map(parse_progress2, lines) if p is not None]
+    assert [p['percent'] for p in progress] == [0, 1, 50, 100]
+    assert progress[-1] == {
+        'percent': 100,
+        'bytes_transferred': 2100000,
+        'rate': 2000000,
+        'eta': 1,
+        'files_transferred': 2,
+        'files_remaining': 0,
+        'files_total': 4,
+    }
@@ -5,6 +5,8 @@ import asyncio
 import base64
 import binascii
 import copy
+import errno
+import functools
 import types
 
 from .client import ejson as json
@@ -12,6 +14,9 @@ from .job import Job
 from .schema import Error as SchemaError
 from .service import CallError, ValidationError, ValidationErrors
 
+# Size of the chunks list responses are written in
+STREAM_CHUNK_SIZE = 65536
+
 
 async def authenticate(middleware, req):
 
@@ -32,6 +37,99 @@ async def authenticate(middleware, req):
         raise web.HTTPUnauthorized()
 
 
+def encode_cursor(order_by, last, offset):
+    """
+    Returns an opaque cursor to the page after item `last` of a query sorted by `order_by`.
+
+    Pages sorted by `id` only are continued after the last `id` seen, so items added or
+    removed meanwhile do not shift the following pages. Other sorts continue from `offset`.
+    """
+    cursor = {'order_by': order_by}
+    if order_by in (['id'], ['-id']) and isinstance(last, dict) and 'id' in last:
+        cursor['id'] = last['id']
+    else:
+        cursor['offset'] = offset
+    return base64.urlsafe_b64encode(json.dumps(cursor).encode('utf8')).decode('ascii')
+
+
+def decode_cursor(cursor, filters, options):
+    """
+    Update `filters` and `options` of a query to return the page pointed by `cursor`.
+    """
+    try:
+        cursor = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf8'))
+        order_by = cursor['order_by']
+        if not isinstance(order_by, list) or not all(isinstance(o, str) for o in order_by):
+            raise ValueError()
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+    options['order_by'] = order_by
+    if 'id' in cursor:
+        filters.append(('id', '<' if order_by == ['-id'] else '>', cursor['id']))
+        options.pop('offset', None)
+    else:
+        options['offset'] = cursor.get('offset') or 0
+
+
+def json_chunks(result, indent=None):
+    """
+    Yields `result` encoded as JSON in chunks of about `STREAM_CHUNK_SIZE` characters,
+    so a large list is never held in memory as a single string.
+
+    The output is the same as `json.dumps(result, indent=indent)`.
+    """
+    if not isinstance(result, (list, types.GeneratorType)):
+        yield json.dumps(result, indent=indent)
+        return
+
+    chunk = []
+    size = 0
+    empty = True
+    for item in result:
+        if indent:
+            item = '\n'.join(' ' * indent + line for line in json.dumps(item, indent=indent).split('\n'))
+            item = ('[\n' if empty else ',\n') + item
+        else:
+            item = ('[' if empty else ', ') + json.dumps(item)
+        empty = False
+        chunk.append(item)
+        size += len(item)
+        if size >= STREAM_CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk = []
+            size = 0
+
+    if empty:
+        chunk.append('[]')
+    else:
+        chunk.append('\n]' if indent else ']')
+    yield ''.join(chunk)
+
+
+async def write_json_chunks(req, stream, chunks):
+    """
+    Send `chunks` (from `json_chunks`) as `stream` response.
+
+    The first chunk is encoded before sending the headers so that a result
+    generator failing early still ends up in a 500 response. Once the headers
+    are sent, a failure aborts the connection so the client cannot mistake a
+    truncated list for a complete one.
+    """
+    first = next(chunks)
+    await stream.prepare(req)
+    try:
+        await stream.write(first.encode('utf8'))
+        for chunk in chunks:
+            await stream.write(chunk.encode('utf8'))
+    except Exception:
+        if req.transport is not None:
+            req.transport.close()
+        raise
+    await stream.write_eof()
+    return stream
+
+
 class RESTfulAPI(object):
 
     def __init__(self, middleware, app):
@@ -44,9 +142,86 @@ class RESTfulAPI(object):
 
         self._openapi = OpenAPIResource(self)
 
+        self.app.router.add_route('POST', '/api/v2.0/multi', self.multi)
+        self.app.router.add_route('POST', '/api/v2.0/multi/', self.multi)
+
     def get_app(self):
         return self.app
 
+    async def multi(self, req):
+        """
+        Run many method calls in a single request, concurrently, e.g.
+
+            {"calls": [{"method": "pool.query"}, {"method": "alert.list"}], "timeout": 10}
+
+        Returns a list with a `result` or an `error` for each call, in the same order.
+        """
+        await authenticate(self.middleware, req)
+
+        try:
+            data = await req.json()
+            calls = data['calls']
+            if not isinstance(calls, list) or not all(isinstance(c, dict) and 'method' in c for c in calls):
+                raise ValueError('calls must be a list of method calls')
+            timeout = data.get('timeout')
+            concurrency = data.get('concurrency')
+            if timeout is not None and not isinstance(timeout, (int, float)):
+                raise ValueError('timeout must be a number')
+            if concurrency is not None and not isinstance(concurrency, int):
+                raise ValueError('concurrency must be an integer')
+        except Exception as e:
+            resp = web.Response(status=400)
+            resp.text = json.dumps({'message': str(e)})
+            return resp
+
+        tasks = await self.middleware.run_concurrently(
+            [functools.partial(self._multi_call, c['method'], c.get('params') or []) for c in calls],
+            timeout,
+            concurrency,
+        )
+
+        results = []
+        for task in tasks:
+            if task.done() and not task.cancelled():
+                results.append(task.result())
+            else:
+                results.append({'error': {'message': 'Call timed out', 'errno': errno.ETIMEDOUT}})
+
+        resp = web.Response()
+        resp.text = json.dumps(results)
+        return resp
+
+    async def _multi_call(self, methodname, params):
+        method = self._methods.get(methodname)
+        if method is None or method['require_websocket']:
+            return {'error': {'message': f'Method {methodname} not found', 'errno': CallError.ENOMETHOD}}
+
+        try:
+            result = await self.middleware.call(methodname, *params)
+        except CallError as e:
+            return {'error': {'message': e.errmsg, 'errno': e.errno}}
+        except (SchemaError, ValidationError, ValidationErrors) as e:
+            if isinstance(e, (SchemaError, ValidationError)):
+                e = [(e.attribute, e.errmsg, e.errno)]
+            error = defaultdict(list)
+            for attr, errmsg, err_no in e:
+                error[attr].append({
+                    'message': errmsg,
+                    'errno': err_no,
+                })
+            return {'error': error}
+        except Exception as e:
+            self.middleware.logger.warn(f'Exception while calling {methodname}', exc_info=True)
+            return {'error': {'message': str(e), 'errno': errno.EINVAL}}
+
+        if isinstance(result, types.GeneratorType):
+            result = list(result)
+        elif isinstance(result, types.AsyncGeneratorType):
+            result = [i async for i in result]
+        elif isinstance(result, Job):
+            result = result.id
+        return {'result': result}
+
     async def register_resources(self):
         for methodname, method in list((await self.middleware.call('core.get_methods')).items()):
             self._methods[methodname] = method
@@ -194,6 +369,13 @@ class OpenAPIResource(object):
                         'required': False,
                         'schema': {'type': 'string'},
                     },
+                    {
+                        'name': 'cursor',
+                        'in': 'query',
+                        'required': False,
+                        'schema': {'type': 'string'},
+                        'description': 'Cursor to the next page, returned in the X-Next-Cursor header',
+                    },
                 ]
             elif accepts:
                 opobject['requestBody'] = self._accepts_to_request(methodname, method, accepts)
@@ -395,6 +577,7 @@ class Resource(object):
     def _filterable_args(self, req):
         filters = []
         options = {}
+        cursor = None
         for key, val in list(req.query.items()):
             if '__' in key:
                 field, op = key.split('__', 1)
@@ -415,7 +598,12 @@ class Resource(object):
                 options[key] = convert(val)
                 continue
             elif key == 'sort':
-                options[key] = [convert(v) for v in val.split(',')]
+                options['order_by'] = val.split(',')
+                continue
+            elif key == 'cursor':
+                cursor = val
+                continue
+            elif key == 'pretty':
                 continue
 
             op_map = {
@@ -440,6 +628,14 @@ class Resource(object):
                 val = None
             filters.append((field, op, val))
 
+        if cursor is not None:
+            decode_cursor(cursor, filters, options)
+        elif options.get('limit'):
+            # Sort pages so they can be continued with a cursor
+            order_by = options.setdefault('order_by', [])
+            if 'id' not in order_by and '-id' not in order_by:
+                order_by.append('id')
+
         return [filters, options]
 
     async def do(self, http_method, req, resp, **kwargs):
@@ -504,7 +700,14 @@ class Resource(object):
                         filterid = int(filterid)
                     method_args = [[('id', '=', filterid)], {'get': True}]
                 else:
-                    method_args = self._filterable_args(req)
+                    try:
+                        method_args = self._filterable_args(req)
+                    except ValueError as e:
+                        resp.set_status(400)
+                        resp.body = json.dumps({
+                            'message': str(e),
+                        })
+                        return resp
             else:
                 method_args = []
 
@@ -527,18 +730,32 @@ class Resource(object):
             if isinstance(e, (SchemaError, ValidationError)):
                 e = [(e.attribute, e.errmsg, e.errno)]
             result = defaultdict(list)
-            for attr, errmsg, errno in e:
+            for attr, errmsg, err_no in e:
                 result[attr].append({
                     'message': errmsg,
-                    'errno': errno,
+                    'errno': err_no,
                 })
             resp = web.Response(status=422)
 
-        if isinstance(result, types.GeneratorType):
-            result = list(result)
-        elif isinstance(result, types.AsyncGeneratorType):
+        if isinstance(result, types.AsyncGeneratorType):
             result = [i async for i in result]
         elif isinstance(result, Job):
             result = result.id
-        resp.text = json.dumps(result, indent=True)
-        return resp
+
+        indent = True if req.query.get('pretty', '').lower() in ('1', 'true') else None
+
+        if resp.status != 200 or not isinstance(result, (list, types.GeneratorType)):
+            resp.text = json.dumps(result, indent=indent)
+            return resp
+
+        # Write lists as they are encoded instead of building the whole response in memory
+        stream = web.StreamResponse(status=200)
+        stream.content_type = 'text/plain'
+        stream.charset = 'utf-8'
+        if http_method == 'get' and method['filterable'] and isinstance(result, list):
+            filters, options = method_args[-2:]
+            if options.get('limit') and len(result) == options['limit']:
+                stream.headers['X-Next-Cursor'] = encode_cursor(
+                    options['order_by'], result[-1], (options.get('offset') or 0) + len(result),
+                )
+        return await write_json_chunks(req, stream, json_chunks(result, indent))
@@ -11,6 +11,16 @@ from middlewared.service_exception import ValidationErrors
 NOT_PROVIDED = object()
 
 
+def _copy(value):
+    """
+    Copy `value` if it can be mutated, so it is not shared with the caller
+    (or between calls, for defaults).
+    """
+    if isinstance(value, (dict, list, set)):
+        return copy.deepcopy(value)
+    return value
+
+
 class Schemas(dict):
 
     def add(self, schema):
@@ -72,7 +82,7 @@ class Attribute(object):
             raise Error(self.name, 'null not allowed')
         if value is NOT_PROVIDED:
             if self.has_default:
-                return copy.deepcopy(self.default)
+                return _copy(self.default)
             else:
                 raise Error(self.name, 'attribute required')
         return value
@@ -83,6 +93,12 @@ class Attribute(object):
 
         return value
 
+    def has_validation(self):
+        """
+        Whether `validate` can raise any error, it is skipped by `accepts` otherwise.
+        """
+        return bool(self.validators) or type(self).validate is not Attribute.validate
+
     def validate(self, value):
         verrors = ValidationErrors()
 
@@ -123,6 +139,10 @@ class Attribute(object):
 
 class Any(Attribute):
 
+    def clean(self, value):
+        # Values are not cleaned so there is no copy of them
+        return _copy(super().clean(value))
+
     def to_json_schema(self, parent=None):
         schema = {
             'anyOf': [
@@ -364,22 +384,25 @@ class List(EnumMixin, Attribute):
     def clean(self, value):
         value = super(List, self).clean(value)
         if value is None:
-            return copy.deepcopy(self.default)
+            return _copy(self.default)
         if not isinstance(value, list):
             raise Error(self.name, 'Not a list')
         if not self.empty and not value:
             raise Error(self.name, 'Empty value not allowed')
-        if self.items:
-            for index, v in enumerate(value):
-                for i in self.items:
-                    try:
-                        value[index] = i.clean(v)
-                        found = True
-                    except Error as e:
-                        found = e
-                        break
-                if self.items and found is not True:
-                    raise Error(self.name, 'Item#{0} is not valid per list types: {1}'.format(index, found))
+        # Return a new list, the one given belongs to the caller
+        if not self.items:
+            return [_copy(v) for v in value]
+        value = list(value)
+        for index, v in enumerate(value):
+            for i in self.items:
+                try:
+                    value[index] = i.clean(v)
+                    found = True
+                except Error as e:
+                    found = e
+                    break
+            if found is not True:
+                raise Error(self.name, 'Item#{0} is not valid per list types: {1}'.format(index, found))
         return value
 
     def dump(self, value):
@@ -388,6 +411,12 @@ class List(EnumMixin, Attribute):
 
         return value
 
+    def has_validation(self):
+        if self.validators or self.unique or type(self).validate is not List.validate:
+            return True
+
+        return any(i.has_validation() for i in self.items)
+
     def validate(self, value):
         if value is None:
             return
@@ -464,19 +493,20 @@ class Dict(Attribute):
         data = super().clean(data)
 
         if data is None:
-            return copy.deepcopy(self.default)
+            return _copy(self.default)
 
         self.errors = []
         if not isinstance(data, dict):
             raise Error(self.name, 'A dict was expected')
 
-        for key, value in list(data.items()):
-            if not self.additional_attrs:
-                if key not in self.attrs:
-                    raise Error(key, 'Field was not expected')
-
+        # Return a new dict, the one given belongs to the caller
+        data = dict(data)
+        for key, value in data.items():
             attr = self.attrs.get(key)
             if not attr:
+                if not self.additional_attrs:
+                    raise Error(key, 'Field was not expected')
+                data[key] = _copy(value)
                 continue
 
             data[key] = attr.clean(value)
@@ -508,6 +538,12 @@ class Dict(Attribute):
 
         return value
 
+    def has_validation(self):
+        if type(self).validate is not Dict.validate:
+            return True
+
+        return any(attr.has_validation() for attr in self.attrs.values())
+
     def validate(self, value):
         if value is None:
             return
@@ -692,6 +728,8 @@ def resolver(schemas, f):
     # FIXME: for some reason assigning params (f.accepts = new_params) does not work
     f.accepts.clear()
     f.accepts.extend(new_params)
+    if hasattr(f, 'compile_accepts'):
+        f.compile_accepts()
 
 
 def resolve_methods(schemas, to_resolve):
@@ -721,57 +759,16 @@ def accepts(*schema):
             args_index += f._skip_arg
         assert len(schema) == f.__code__.co_argcount - args_index  # -1 for self
 
-        def clean_and_validate_args(args, kwargs):
-            args = list(args)
-            args = args[:args_index] + copy.deepcopy(args[args_index:])
-            kwargs = copy.deepcopy(kwargs)
-
-            verrors = ValidationErrors()
-
-            # Iterate over positional args first, excluding self
-            i = 0
-            for _ in args[args_index:]:
-                attr = nf.accepts[i]
-
-                value = attr.clean(args[args_index + i])
-                args[args_index + i] = value
-
-                try:
-                    attr.validate(value)
-                except ValidationErrors as e:
-                    verrors.extend(e)
-
-                i += 1
-
-            # Use i counter to map keyword argument to rpc positional
-            for x in list(range(i + args_index, f.__code__.co_argcount)):
-                kwarg = f.__code__.co_varnames[x]
-
-                if kwarg in kwargs:
-                    attr = nf.accepts[i]
-                    i += 1
-
-                    value = kwargs[kwarg]
-                elif len(nf.accepts) >= i + 1:
-                    attr = nf.accepts[i]
-                    i += 1
-                    value = NOT_PROVIDED
-                else:
-                    i += 1
-                    continue
-
-                value = attr.clean(value)
-                kwargs[kwarg] = value
-
-                try:
-                    attr.validate(value)
-                except ValidationErrors as e:
-                    verrors.extend(e)
+        # Compiled when the schemas are resolved (or on first call)
+        compiled = []
 
-            if verrors:
-                raise verrors
+        def compile_accepts():
+            compiled[:] = [compile_args_validator(f, nf.accepts, args_index)]
 
-            return args, kwargs
+        def clean_and_validate_args(args, kwargs):
+            if not compiled:
+                compile_accepts()
+            return compiled[0](args, kwargs)
 
         if asyncio.iscoroutinefunction(f):
             async def nf(*args, **kwargs):
@@ -792,11 +789,60 @@ def accepts(*schema):
             if i.startswith('_'):
                 setattr(nf, i, getattr(f, i))
         nf.accepts = list(schema)
+        nf.compile_accepts = compile_accepts
 
         return nf
     return wrap
 
 
+def compile_args_validator(f, schema, args_index):
+    """
+    Build the function cleaning and validating arguments of `f` with `schema`
+    (resolved `accepts` attributes) once, so calls only do the necessary work:
+    validation which cannot fail is skipped and arguments are not deep copied,
+    `clean` returns copies of dicts and lists instead.
+    """
+    argnames = f.__code__.co_varnames[args_index:f.__code__.co_argcount]
+    attrs = [(attr, attr.clean, attr.validate if attr.has_validation() else None) for attr in schema]
+
+    def clean_and_validate_args(args, kwargs):
+        args = list(args)
+        verrors = None
+
+        # Positional args first, excluding self
+        positional = len(args) - args_index
+        for i in range(positional):
+            attr, clean, validate = attrs[i]
+            value = args[args_index + i] = clean(args[args_index + i])
+            if validate is not None:
+                try:
+                    validate(value)
+                except ValidationErrors as e:
+                    verrors = verrors or ValidationErrors()
+                    verrors.extend(e)
+
+        # Then keyword arguments, using defaults for the ones not provided
+        if positional < len(attrs):
+            kwargs = dict(kwargs)
+            for i in range(positional, len(attrs)):
+                attr, clean, validate = attrs[i]
+                name = argnames[i]
+                value = kwargs[name] = clean(kwargs.get(name, NOT_PROVIDED))
+                if validate is not None:
+                    try:
+                        validate(value)
+                    except ValidationErrors as e:
+                        verrors = verrors or ValidationErrors()
+                        verrors.extend(e)
+
+        if verrors:
+            raise verrors
+
+        return args, kwargs
+
+    return clean_and_validate_args
+
+
 class UnixPerm(Str):
 
     def validate(self, value):
@@ -1,5 +1,6 @@
 from collections import defaultdict, namedtuple
 
+import asyncio
 import errno
 import inspect
 import json
@@ -29,8 +30,13 @@ def item_method(fn):
     return fn
 
 
-def job(lock=None, lock_queue_size=None, logs=False, process=False, pipes=None, check_pipes=True, transient=False):
-    """Flag method as a long running job."""
+def job(lock=None, lock_queue_size=None, logs=False, process=False, pipes=None, check_pipes=True, transient=False,
+        priority=None, max_concurrency=None):
+    """Flag method as a long running job.
+
+    `priority` is the name of a `Priority` class. Jobs started by clients default
+    to "INTERACTIVE" and the other ones to "NORMAL", bulk work should use "BACKGROUND".
+    `max_concurrency` limits how many jobs of the method can run at once."""
     def check_job(fn):
         fn._job = {
             'lock': lock,
@@ -40,6 +46,8 @@ def job(lock=None, lock_queue_size=None, logs=False, process=False, pipes=None,
             'pipes': pipes or [],
             'check_pipes': check_pipes,
             'transient': transient,
+            'priority': priority,
+            'max_concurrency': max_concurrency,
         }
         return fn
     return check_job
@@ -107,6 +115,8 @@ class ServiceBase(type):
     Currently the following options are allowed:
       - datastore: name of the datastore mainly used in the service
       - datastore_extend: datastore `extend` option used in common `query` method
+      - datastore_extend_many: datastore `extend_many` option used in common `query` method,
+        same as `datastore_extend` but called once with all the rows
       - datastore_prefix: datastore `prefix` option used in helper methods
       - datastore_filters: datastore default filters to be used in `query` method
       - service: system service `name` option used by `SystemServiceService`
@@ -137,6 +147,7 @@ class ServiceBase(type):
             'datastore': None,
             'datastore_prefix': None,
             'datastore_extend': None,
+            'datastore_extend_many': None,
             'datastore_filters': None,
             'service': None,
             'service_model': None,
@@ -204,6 +215,8 @@ class ConfigService(ServiceChangeMixin, Service):
             options['prefix'] = self._config.datastore_prefix
         if self._config.datastore_extend:
             options['extend'] = self._config.datastore_extend
+        if self._config.datastore_extend_many:
+            options['extend_many'] = self._config.datastore_extend_many
         return await self._get_or_insert(self._config.datastore, options)
 
     async def update(self, data):
@@ -232,6 +245,7 @@ class SystemServiceService(ConfigService):
         return await self._get_or_insert(
             f'services.{self._config.service_model or self._config.service}', {
                 'extend': self._config.datastore_extend,
+                'extend_many': self._config.datastore_extend_many,
                 'prefix': self._config.datastore_prefix
             }
         )
@@ -266,16 +280,20 @@ class CRUDService(ServiceChangeMixin, Service):
             options['prefix'] = self._config.datastore_prefix
         if self._config.datastore_extend:
             options['extend'] = self._config.datastore_extend
+        if self._config.datastore_extend_many:
+            options['extend_many'] = self._config.datastore_extend_many
         if self._config.datastore_filters:
             if not filters:
                 filters = []
             filters += self._config.datastore_filters
         # In case we are extending which may transform the result in numerous ways
         # we can only filter the final result.
-        if 'extend' in options:
+        if 'extend' in options or 'extend_many' in options:
             datastore_options = options.copy()
             datastore_options.pop('count', None)
             datastore_options.pop('get', None)
+            datastore_options.pop('offset', None)
+            datastore_options.pop('limit', None)
             result = await self.middleware.call(
                 'datastore.query', self._config.datastore, [], datastore_options
             )
@@ -344,6 +362,18 @@ class CoreService(Service):
                 extra=progress.get('extra'),
             )
 
+    @accepts(Int('id'))
+    async def job_wait(self, id):
+        """
+        Wait for job `id` to finish and return it, so a client can wait for a
+        single job without subscribing to every job event.
+        """
+        job = self.middleware.jobs.get(id)
+        if job is None:
+            raise CallError(f'Job {id} does not exist', errno.ENOENT)
+        await job.wait()
+        return job.__encode__()
+
     @accepts(Int('id'))
     def job_abort(self, id):
         job = self.middleware.jobs.all()[id]
@@ -478,6 +508,31 @@ class CoreService(Service):
                 }
         return data
 
+    @private
+    async def threadpool_stats(self):
+        """
+        Usage of the I/O thread pool used by `run_in_thread`: thread counts,
+        number of queued calls and how long calls waited for a thread, per method.
+        """
+        return self.middleware.threadpool_stats()
+
+    @private
+    async def procpool_stats(self):
+        """
+        Usage of the process pool running `process_pool` services and `process` jobs:
+        number of workers, calls running and queued, and per method timings.
+        `wait` is how long calls waited for a free worker.
+        """
+        return self.middleware.procpool_stats()
+
+    @private
+    async def jobs_stats(self):
+        """
+        Per method number of jobs waiting, running and finished, and how long
+        they waited in the queue (`wait_*`) and ran (`run_*`).
+        """
+        return self.middleware.jobs.stats()
+
     @private
     async def event_send(self, name, event_type, kwargs):
         self.middleware.send_event(name, event_type, **kwargs)
@@ -502,7 +557,7 @@ class CoreService(Service):
 
         Returns the job id and the URL for download.
         """
-        job = await self.middleware.call(method, *args, pipes=Pipes(output=self.middleware.pipe()))
+        job = await self.middleware.call(method, *args, pipes=Pipes(output=self.middleware.pipe(file_response=True)))
         token = await self.middleware.call('auth.generate_token', 300, {'filename': filename, 'job': job.id})
         self.middleware.fileapp.register_job(job.id)
         return job.id, f'/_download/{job.id}?auth_token={token}'
@@ -600,9 +655,13 @@ class CoreService(Service):
             pydevd.stoptrace()
             pydevd.settrace(host=options['host'])
 
-    @accepts(Str("method"), List("params", default=[]))
+    @accepts(
+        Str("method"),
+        List("params", default=[]),
+        Dict("bulk_options", Int("concurrency", default=1)),
+    )
     @job(lock=lambda args: f"bulk:{args[0]}")
-    async def bulk(self, job, method, params):
+    async def bulk(self, job, method, params, options):
         """
         Will loop on a list of items for the given method, returning a list of
         dicts containing a result and error key.
@@ -610,28 +669,66 @@ class CoreService(Service):
         Result will be the message returned by the method being called,
         or a string of an error, in which case the error key will be the
         exception
+
+        `bulk_options.concurrency` is the number of items run at the same time.
+        Results are in the same order as `params` regardless. If the method is
+        a job with a lock, items sharing the same lock are run one after another.
         """
-        statuses = []
-        progress_step = 100 / len(params)
-        current_progress = 0
+        total = len(params)
+        statuses = [None] * total
+        completed = 0
 
-        for p in params:
+        try:
+            serviceobj, methodobj = self.middleware._method_lookup(method)
+        except CallError:
+            # Every item will fail with the same error
+            methodobj = None
+        job_options = getattr(methodobj, '_job', None)
+        semaphore = asyncio.Semaphore(max(options['concurrency'], 1))
+        job_locks = defaultdict(asyncio.Lock)
+
+        def item_done(i, status):
+            nonlocal completed
+            statuses[i] = status
+            completed += 1
+            job.set_progress(completed * 100 / total, f'{completed}/{total}', {'completed': completed, 'total': total})
+
+        async def run(i, p):
             try:
                 msg = await self.middleware.call(method, *p)
                 error = None
 
                 if isinstance(msg, Job):
-                    job = msg
+                    call_job = msg
                     msg = await msg.wait()
 
-                    if job.error:
-                        error = job.error
+                    if call_job.error:
+                        error = call_job.error
 
-                statuses.append({"result": msg, "error": error})
+                status = {"result": msg, "error": error}
             except Exception as e:
-                statuses.append({"result": None, "error": str(e)})
+                status = {"result": None, "error": str(e)}
+
+            item_done(i, status)
+
+        async def run_item(i, p):
+            try:
+                lock_name = None
+                if job_options and job_options['lock']:
+                    # Jobs sharing a lock would only wait for each other while holding a slot
+                    lock_name = Job.lock_name(job_options, ([None] if hasattr(methodobj, '_pass_app') else []) + list(p))
+            except Exception as e:
+                item_done(i, {"result": None, "error": str(e)})
+                return
+
+            if lock_name is None:
+                async with semaphore:
+                    await run(i, p)
+            else:
+                async with job_locks[lock_name]:
+                    async with semaphore:
+                        await run(i, p)
 
-            current_progress += progress_step
-            job.set_progress(current_progress)
+        await asyncio.gather(*[run_item(i, p) for i, p in enumerate(params)])
 
         return statuses
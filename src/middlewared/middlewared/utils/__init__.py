@@ -1,6 +1,7 @@
 import asyncio
 import imp
 import inspect
+import itertools
 import os
 import re
 import sys
@@ -38,7 +39,7 @@ def django_modelobj_serialize(middleware, obj, extend=None, field_prefix=None, s
             value = getattr(obj, origname)
         except Exception as e:
             # If foreign key does not exist set it to None
-            if isinstance(field, ForeignKey) and isinstance(e, field.rel.model.DoesNotExist):
+            if isinstance(field, ForeignKey) and isinstance(e, field.remote_field.model.DoesNotExist):
                 data[name] = None
                 continue
             raise
@@ -59,6 +60,64 @@ def django_modelobj_serialize(middleware, obj, extend=None, field_prefix=None, s
     return data
 
 
+def _django_related_lookups(fields, path='', joinable=True, seen=()):
+    from django.db.models.fields.related import ForeignKey, ManyToManyField
+    select_related = []
+    prefetch_related = []
+    for field in fields:
+        if not isinstance(field, (ForeignKey, ManyToManyField)):
+            continue
+        related = field.remote_field.model
+        # Do not follow circular relations forever
+        if related in seen:
+            continue
+        name = path + field.name
+        if isinstance(field, ForeignKey):
+            # Only nullable foreign keys are joined (LEFT OUTER JOIN). A non nullable one
+            # pointing to a missing row would drop the row from the result (INNER JOIN),
+            # prefetching it makes it `None` instead, as it has always been.
+            joinable_field = joinable and field.null
+        else:
+            joinable_field = False
+        (select_related if joinable_field else prefetch_related).append(name)
+        sr, pr = _django_related_lookups(
+            chain(related._meta.fields, related._meta.many_to_many), f'{name}__', joinable_field, seen + (related,),
+        )
+        select_related += sr
+        prefetch_related += pr
+    return select_related, prefetch_related
+
+
+def django_queryset_optimize(qs, field_prefix=None, select=None):
+    """
+    Prepare queryset `qs` to be serialized with `django_modelobj_serialize`.
+
+    Related objects (foreign keys and many to many fields, recursively) are loaded
+    using `select_related`/`prefetch_related` rather than with one query per relation
+    per row, and columns which are not in `select` are not loaded at all.
+    """
+    model = qs.model
+
+    def selected(field):
+        if not select:
+            return True
+        name = field.name
+        if field_prefix and name.startswith(field_prefix):
+            name = name[len(field_prefix):]
+        return name in select
+
+    fields = [field for field in chain(model._meta.fields, model._meta.many_to_many) if selected(field)]
+    if select:
+        qs = qs.only(*[field.name for field in model._meta.fields if field.primary_key or field in fields])
+
+    select_related, prefetch_related = _django_related_lookups(fields, seen=(model,))
+    if select_related:
+        qs = qs.select_related(*select_related)
+    if prefetch_related:
+        qs = qs.prefetch_related(*prefetch_related)
+    return qs
+
+
 def Popen(args, **kwargs):
     kwargs.setdefault('encoding', 'utf8')
     shell = kwargs.pop('shell', None)
@@ -100,21 +159,21 @@ def partition(s):
             return rv + left, right
 
 
-def get(obj, path):
+def split_path(path):
     """
-    Get a path in obj using dot notation
-
-    e.g.
-        obj = {'foo': {'bar': '1'}, 'foo.bar': '2', 'foobar': ['first', 'second', 'third']}
-
-        path = 'foo.bar' returns '1'
-        path = 'foo\.bar' returns '2'
-        path = 'foobar.0' returns 'first'
+    Split a dot notation `path` into its components, honoring escaped dots.
     """
+    parts = []
     right = path
-    cur = obj
     while right:
         left, right = partition(right)
+        parts.append(left)
+    return parts
+
+
+def get_parts(obj, parts):
+    cur = obj
+    for left in parts:
         if isinstance(cur, dict):
             cur = cur.get(left)
         elif isinstance(cur, (list, tuple)):
@@ -123,105 +182,204 @@ def get(obj, path):
     return cur
 
 
+def get(obj, path):
+    """
+    Get a path in obj using dot notation
+
+    e.g.
+        obj = {'foo': {'bar': '1'}, 'foo.bar': '2', 'foobar': ['first', 'second', 'third']}
+
+        path = 'foo.bar' returns '1'
+        path = 'foo\.bar' returns '2'
+        path = 'foobar.0' returns 'first'
+    """
+    return get_parts(obj, split_path(path))
+
+
+def _regex_match(x, y):
+    return y.match(x)
+
+
+FILTER_OPMAP = {
+    '=': lambda x, y: x == y,
+    '!=': lambda x, y: x != y,
+    '>': lambda x, y: x > y,
+    '>=': lambda x, y: x >= y,
+    '<': lambda x, y: x < y,
+    '<=': lambda x, y: x <= y,
+    '~': _regex_match,
+    'in': lambda x, y: x in y,
+    'nin': lambda x, y: x not in y,
+    'rin': lambda x, y: y in x,
+    'rnin': lambda x, y: y not in x,
+    '^': lambda x, y: x.startswith(y),
+    '$': lambda x, y: x.endswith(y),
+}
+
+
+def compile_getter(name):
+    """
+    Returns a function to get attribute `name` (in dot notation for dicts) of an item.
+    """
+    parts = split_path(name)
+    if len(parts) == 1:
+        key = parts[0]
+
+        def getter(i):
+            if isinstance(i, dict):
+                return i.get(key)
+            return getattr(i, name)
+    else:
+        def getter(i):
+            if isinstance(i, dict):
+                return get_parts(i, parts)
+            return getattr(i, name)
+    return getter
+
+
+def compile_filter(f):
+    if len(f) == 2:
+        op, value = f
+        if op != 'OR':
+            raise ValueError(f'Invalid operation: {op}')
+        predicates = [compile_filter(i) for i in value]
+        if len(predicates) == 2:
+            first, second = predicates
+            return lambda i: first(i) or second(i)
+        return lambda i: any(p(i) for p in predicates)
+
+    if len(f) != 3:
+        raise ValueError(f'Invalid filter {f}')
+    name, op, value = f
+    if op not in FILTER_OPMAP:
+        raise ValueError('Invalid operation: {}'.format(op))
+    if op == '~':
+        value = re.compile(value)
+    opfunc = FILTER_OPMAP[op]
+
+    parts = split_path(name)
+    if len(parts) == 1:
+        # Most common case, avoid another function call per item
+        key = parts[0]
+        return lambda i: opfunc(i.get(key) if isinstance(i, dict) else getattr(i, name), value)
+
+    getter = compile_getter(name)
+    return lambda i: opfunc(getter(i), value)
+
+
+def compile_filters(filters):
+    """
+    Compile `query-filters` into a single predicate, so filters are only
+    interpreted once (and regular expressions compiled once) rather than per item.
+    """
+    predicates = [compile_filter(f) for f in filters]
+    if len(predicates) == 1:
+        return predicates[0]
+    if len(predicates) == 2:
+        first, second = predicates
+        return lambda i: first(i) and second(i)
+    return lambda i: all(p(i) for p in predicates)
+
+
+def compile_order_by(order_by, nulls=False):
+    """
+    Returns a list of (key, reverse) tuples to sort a list using `order_by`.
+
+    Consecutive attributes sorted in the same direction share a single key, so the
+    list is sorted once per change of direction rather than once per attribute.
+    Sorts must be applied in the given order, they are stable so the first
+    attribute takes precedence. With `nulls` keys can be compared even if some
+    values are `None`, those sort first.
+    """
+    runs = []
+    for o in order_by:
+        if o.startswith('-'):
+            getter, reverse = compile_getter(o[1:]), True
+        else:
+            getter, reverse = compile_getter(o), False
+        if runs and runs[-1][1] == reverse:
+            runs[-1][0].append(getter)
+        else:
+            runs.append(([getter], reverse))
+
+    rv = []
+    for getters, reverse in reversed(runs):
+        if len(getters) == 1:
+            getter = getters[0]
+            if nulls:
+                def key(i, getter=getter):
+                    v = getter(i)
+                    return v is not None, v
+            else:
+                key = getter
+        else:
+            if nulls:
+                def key(i, getters=getters):
+                    return tuple((v is not None, v) for v in (getter(i) for getter in getters))
+            else:
+                def key(i, getters=getters):
+                    return tuple(getter(i) for getter in getters)
+        rv.append((key, reverse))
+    return rv
+
+
+def sort_list(_list, order_by):
+    """
+    Returns a new list with items of `_list` sorted by `order_by`.
+    """
+    for nulls in (False, True):
+        rv = list(_list)
+        try:
+            for key, reverse in compile_order_by(order_by, nulls):
+                rv.sort(key=key, reverse=reverse)
+        except TypeError:
+            if nulls:
+                raise
+            # Most likely `None` being compared to other values
+            continue
+        return rv
+
+
+def _select(i, select):
+    return {s: i[s] for s in select if s in i}
+
+
 def filter_list(_list, filters=None, options=None):
 
-    opmap = {
-        '=': lambda x, y: x == y,
-        '!=': lambda x, y: x != y,
-        '>': lambda x, y: x > y,
-        '>=': lambda x, y: x >= y,
-        '<': lambda x, y: x < y,
-        '<=': lambda x, y: x <= y,
-        '~': lambda x, y: re.match(y, x),
-        'in': lambda x, y: x in y,
-        'nin': lambda x, y: x not in y,
-        'rin': lambda x, y: y in x,
-        'rnin': lambda x, y: y not in x,
-        '^': lambda x, y: x.startswith(y),
-        '$': lambda x, y: x.endswith(y),
-    }
-
-    if filters is None:
-        filters = {}
     if options is None:
         options = {}
 
     select = options.get('select')
+    order_by = options.get('order_by')
+    offset = options.get('offset') or 0
+    limit = options.get('limit') or 0
 
-    rv = []
+    rv = _list
     if filters:
-
-        def filterop(f):
-            if len(f) != 3:
-                raise ValueError(f'Invalid filter {f}')
-            name, op, value = f
-            if op not in opmap:
-                raise ValueError('Invalid operation: {}'.format(op))
-            if isinstance(i, dict):
-                source = get(i, name)
-            else:
-                source = getattr(i, name)
-            if opmap[op](source, value):
-                return True
-            return False
-
-        for i in _list:
-            valid = True
-            for f in filters:
-                if len(f) == 2:
-                    op, value = f
-                    if op == 'OR':
-                        for f in value:
-                            if filterop(f):
-                                break
-                        else:
-                            valid = False
-                            break
-                    else:
-                        raise ValueError(f'Invalid operation: {op}')
-                elif not filterop(f):
-                    valid = False
-                    break
-
-            if not valid:
-                continue
-            if select:
-                entry = {}
-                for s in select:
-                    if s in i:
-                        entry[s] = i[s]
-            else:
-                entry = i
-            rv.append(entry)
-            if options.get('get') is True:
-                return entry
-    elif select:
-        rv = []
-        for i in _list:
-            entry = {}
-            for s in select:
-                if s in i:
-                    entry[s] = i[s]
-            rv.append(entry)
-    else:
-        rv = _list
+        rv = filter(compile_filters(filters), rv)
 
     if options.get('count') is True:
+        if filters:
+            return sum(1 for i in rv)
         return len(rv)
 
-    if options.get('order_by'):
-        for o in options.get('order_by'):
-            if o.startswith('-'):
-                o = o[1:]
-                reverse = True
-            else:
-                reverse = False
-            rv = sorted(rv, key=lambda x: x[o], reverse=reverse)
+    if order_by:
+        rv = sort_list(list(rv), order_by)
+
+    if offset or limit:
+        rv = itertools.islice(rv, offset, offset + limit if limit else None)
 
     if options.get('get') is True:
-        return rv[0]
+        for i in rv:
+            return _select(i, select) if select else i
+        raise IndexError('list index out of range')
 
-    return rv
+    if select:
+        return [_select(i, select) for i in rv]
+
+    if rv is _list or isinstance(rv, list):
+        return rv
+    return list(rv)
 
 
 def sw_buildtime():
@@ -0,0 +1,188 @@
+from collections import defaultdict, deque
+
+import concurrent.futures
+import contextvars
+import functools
+import threading
+import time
+
+# Pool the current thread belongs to. Being a context variable it is also seen
+# by coroutines started from that thread (e.g. through `call_sync`), so calls
+# they make are recognized as nested too.
+_current_pool = contextvars.ContextVar('io_thread_pool', default=None)
+
+
+def _method_name(fn):
+    while isinstance(fn, functools.partial):
+        fn = fn.func
+    return getattr(fn, '__qualname__', None) or repr(fn)
+
+
+class IoThreadPoolExecutor(concurrent.futures.Executor):
+    """
+    Elastic thread pool backing `Middleware.run_in_thread`.
+
+    Idle threads are reused instead of starting (and tearing down) a brand new
+    thread for every call. At most `max_workers` threads are running, each one
+    exiting after `idle_timeout` seconds without work. Calls made while every
+    thread is busy are queued until one of them is done.
+
+    Nested calls (made from a thread of this pool, directly or through a
+    coroutine it started, e.g. `call_sync`) are never queued: when no thread is
+    idle a transient thread is started just for that call. This keeps the
+    guarantee `run_in_thread` always had, a nested call never waits for a slot
+    held by its own caller.
+    """
+
+    def __init__(self, max_workers=32, idle_timeout=60, initializer=None):
+        self.max_workers = max_workers
+        self.idle_timeout = idle_timeout
+        self.initializer = initializer
+
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        # Calls waiting for a thread, in submission order
+        self._queue = deque()
+        self._shutdown = False
+        self._threads = set()
+
+        # Number of threads in the pool (busy or idle)
+        self._workers = 0
+        # Pooled threads waiting for work
+        self._idle = 0
+        # Threads started for nested calls past `max_workers`, they exit after one call
+        self._transient = 0
+        self._active = 0
+        self._overflows = 0
+
+        self._methods = defaultdict(lambda: {
+            'calls': 0,
+            'wait_total': 0.0,
+            'wait_max': 0.0,
+        })
+
+    def submit(self, fn, *args, **kwargs):
+        future = concurrent.futures.Future()
+        item = (future, fn, args, kwargs, _method_name(fn), time.monotonic())
+        nested = _current_pool.get() is self
+
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError('cannot schedule new futures after shutdown')
+
+            if self._idle > len(self._queue):
+                # An idle thread will pick it up right away
+                self._queue.append(item)
+                self._cond.notify()
+                return future
+
+            if self._workers < self.max_workers:
+                self._workers += 1
+                persistent = True
+            elif nested:
+                self._transient += 1
+                self._overflows += 1
+                persistent = False
+            else:
+                self._queue.append(item)
+                return future
+
+            thread = threading.Thread(
+                target=self._worker, args=(item, persistent), name='io_thread', daemon=True,
+            )
+            self._threads.add(thread)
+
+        thread.start()
+        return future
+
+    def _run(self, item):
+        future, fn, args, kwargs, name, submitted = item
+        if not future.set_running_or_notify_cancel():
+            return
+
+        waited = time.monotonic() - submitted
+        with self._lock:
+            self._active += 1
+            stats = self._methods[name]
+            stats['calls'] += 1
+            stats['wait_total'] += waited
+            if waited > stats['wait_max']:
+                stats['wait_max'] = waited
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+        finally:
+            # Do not hold a reference to the result/exception while idle
+            future = item = None
+            with self._lock:
+                self._active -= 1
+
+    def _worker(self, item, persistent):
+        _current_pool.set(self)
+        if self.initializer:
+            try:
+                self.initializer()
+            except Exception:
+                pass
+
+        try:
+            while True:
+                self._run(item)
+                item = None
+
+                with self._lock:
+                    if not persistent:
+                        self._transient -= 1
+                        return
+
+                    if not self._queue:
+                        self._idle += 1
+                        self._cond.wait_for(lambda: self._queue or self._shutdown, self.idle_timeout)
+                        self._idle -= 1
+
+                    if self._queue:
+                        item = self._queue.popleft()
+                    else:
+                        # Timed out or shutting down
+                        self._workers -= 1
+                        return
+        finally:
+            with self._lock:
+                self._threads.discard(threading.current_thread())
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        with self._lock:
+            self._shutdown = True
+            if cancel_futures:
+                while self._queue:
+                    self._queue.popleft()[0].cancel()
+            self._cond.notify_all()
+            threads = list(self._threads)
+
+        if wait:
+            for thread in threads:
+                if thread is not threading.current_thread():
+                    thread.join()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_workers': self.max_workers,
+                'threads': self._workers + self._transient,
+                'active': self._active,
+                'idle': self._idle,
+                'transient': self._transient,
+                'overflows': self._overflows,
+                'queued': max(len(self._queue) - self._idle, 0),
+                'methods': {
+                    name: dict(
+                        stats,
+                        wait_avg=stats['wait_total'] / stats['calls'] if stats['calls'] else 0.0,
+                    )
+                    for name, stats in self._methods.items()
+                },
+            }
@@ -0,0 +1,369 @@
+"""
+Reader for RRD files as written by rrdtool 1.x (and collectd) on 64 bit little
+endian hosts, following the semantics of `rrdtool info`, `fetch` and `xport`.
+"""
+from array import array
+from datetime import datetime
+import calendar
+import functools
+import math
+import mmap
+import re
+import struct
+import time
+
+FLOAT_COOKIE = 8.642135E130
+
+# stat_head_t: cookie, version, float_cookie, ds_cnt, rra_cnt, pdp_step, par[10]
+STAT_HEAD = struct.Struct('<4s5s7xd3Q80x')
+# ds_def_t: ds_nam, dst, par[10]
+DS_DEF = struct.Struct('<20s20s80x')
+# rra_def_t: cf_nam, row_cnt, pdp_cnt, par[10]
+RRA_DEF = struct.Struct('<20s4x2Q80x')
+# live_head_t: last_up, last_up_usec (since version 0003)
+LIVE_HEAD = struct.Struct('<q8x')
+LIVE_HEAD_V1 = struct.Struct('<q')
+# pdp_prep_t: last_ds, scratch[10]
+PDP_PREP_SIZE = 112
+# cdp_prep_t: scratch[10]
+CDP_PREP_SIZE = 80
+# rra_ptr_t: cur_row
+RRA_PTR = struct.Struct('<Q')
+
+FETCH_CACHE_SIZE = 256
+
+TIME_UNITS = {
+    's': 1, 'sec': 1, 'second': 1, 'seconds': 1,
+    'm': 60, 'min': 60, 'minute': 60, 'minutes': 60,
+    'h': 3600, 'hour': 3600, 'hours': 3600,
+    'd': 86400, 'day': 86400, 'days': 86400,
+    'w': 604800, 'week': 604800, 'weeks': 604800,
+}
+# In months
+CALENDAR_UNITS = {
+    'mon': 1, 'month': 1, 'months': 1,
+    'y': 12, 'year': 12, 'years': 12,
+}
+RE_TIME = re.compile(r'^(now|n|start|s|end|e|\d+)?((?:[+-]\d+[a-z]*)*)$')
+RE_TIME_OFFSET = re.compile(r'([+-])(\d+)([a-z]*)')
+
+
+class RRDError(Exception):
+    pass
+
+
+def cstring(value):
+    return value.split(b'\0', 1)[0].decode()
+
+
+class RRA(object):
+
+    def __init__(self, index, cf, rows, pdp_cnt, step, cur_row, offset):
+        self.index = index
+        self.cf = cf
+        self.rows = rows
+        self.pdp_cnt = pdp_cnt
+        self.step = step
+        self.cur_row = cur_row
+        self.offset = offset
+
+
+class RRD(object):
+    """
+    Memory mapped RRD file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            try:
+                self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise RRDError(f'{path} is empty')
+
+        try:
+            self._parse()
+        except Exception:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, typ, value, traceback):
+        self.close()
+
+    def close(self):
+        self.mmap.close()
+
+    def _parse(self):
+        if len(self.mmap) < STAT_HEAD.size:
+            raise RRDError(f'{self.path} is not an RRD file')
+
+        cookie, version, float_cookie, ds_cnt, rra_cnt, self.step = STAT_HEAD.unpack_from(self.mmap, 0)
+        if cookie != b'RRD\0':
+            raise RRDError(f'{self.path} is not an RRD file')
+        if float_cookie != FLOAT_COOKIE:
+            raise RRDError(f'{self.path} was created on an incompatible architecture')
+        self.version = cstring(version)
+        offset = STAT_HEAD.size
+
+        self.datasources = []
+        for i in range(ds_cnt):
+            name, dst = DS_DEF.unpack_from(self.mmap, offset)
+            self.datasources.append((cstring(name), cstring(dst)))
+            offset += DS_DEF.size
+
+        rra_defs = []
+        for i in range(rra_cnt):
+            rra_defs.append(RRA_DEF.unpack_from(self.mmap, offset))
+            offset += RRA_DEF.size
+
+        live_head = LIVE_HEAD if self.version >= '0003' else LIVE_HEAD_V1
+        self.last_update, = live_head.unpack_from(self.mmap, offset)
+        offset += live_head.size + ds_cnt * PDP_PREP_SIZE + ds_cnt * rra_cnt * CDP_PREP_SIZE
+
+        cur_rows = []
+        for i in range(rra_cnt):
+            cur_rows.append(RRA_PTR.unpack_from(self.mmap, offset)[0])
+            offset += RRA_PTR.size
+
+        self.rras = []
+        for i, ((cf, rows, pdp_cnt), cur_row) in enumerate(zip(rra_defs, cur_rows)):
+            self.rras.append(RRA(i, cstring(cf), rows, pdp_cnt, self.step * pdp_cnt, cur_row, offset))
+            offset += rows * ds_cnt * 8
+
+        if len(self.mmap) < offset:
+            raise RRDError(f'{self.path} is truncated')
+
+    def info(self):
+        return {
+            'step': self.step,
+            'last_update': self.last_update,
+            'datasets': {name: {'type': dst} for name, dst in self.datasources},
+        }
+
+    def ds_index(self, ds):
+        for i, (name, dst) in enumerate(self.datasources):
+            if name == ds:
+                return i
+        raise RRDError(f'No DS called {ds!r} in {self.path!r}')
+
+    def choose_rra(self, cf, start, end, step):
+        """
+        RRA with `cf` covering from `start` with the closest `step`, or the one
+        covering most of `start` to `end` (as `rrdtool fetch` does).
+        """
+        full, part = None, None
+        for rra in self.rras:
+            if rra.cf != cf:
+                continue
+
+            cal_end = self.last_update - self.last_update % rra.step
+            cal_start = cal_end - rra.step * rra.rows
+            step_diff = abs(step - rra.step)
+            if cal_start <= start:
+                if full is None or step_diff < full[0]:
+                    full = (step_diff, rra)
+            else:
+                match = (end - start) - (cal_start - start)
+                if part is None or match > part[0] or (match == part[0] and step_diff < part[1]):
+                    part = (match, step_diff, rra)
+
+        if full is not None:
+            return full[-1]
+        if part is not None:
+            return part[-1]
+        raise RRDError(f'{self.path} does not contain an RRA matching the chosen CF {cf}')
+
+    def read(self, rra, ds_index, start, end):
+        """
+        Values of datasource `ds_index` stored in `rra` at `start + step`,
+        `start + 2 * step`, ... `end`, NaN where the RRA does not cover.
+        """
+        rra_end = self.last_update - self.last_update % rra.step
+        rra_start = rra_end - rra.step * (rra.rows - 1)
+        start_offset = (start + rra.step - rra_start) // rra.step
+        end_offset = (rra_end - end) // rra.step
+
+        ds_cnt = len(self.datasources)
+        rows = array('d')
+        rows.frombytes(self.mmap[rra.offset:rra.offset + rra.rows * ds_cnt * 8])
+        column = rows[ds_index::ds_cnt]
+        # Oldest row follows the current one
+        column = column[rra.cur_row + 1:] + column[:rra.cur_row + 1]
+
+        return tuple(
+            column[i] if 0 <= i < rra.rows else math.nan
+            for i in range(start_offset, rra.rows - end_offset)
+        )
+
+
+@functools.lru_cache(maxsize=FETCH_CACHE_SIZE)
+def _fetch(path, last_update, ds, rra_index, start, end):
+    with RRD(path) as rrd:
+        return rrd.read(rrd.rras[rra_index], rrd.ds_index(ds), start, end)
+
+
+def fetch(path, ds, cf, start, end, step):
+    """
+    Values of datasource `ds` of RRD file `path` consolidated with `cf` from
+    `start` to `end` (as `rrdtool fetch` does).
+
+    Returns `(start, end, step, values)`, `values[i]` being the value at
+    `start + (i + 1) * step`. Values are cached per RRA and time window until
+    the file is updated.
+    """
+    if start >= end:
+        raise RRDError(f'start ({start}) should be less than end ({end})')
+
+    with RRD(path) as rrd:
+        rrd.ds_index(ds)
+        rra = rrd.choose_rra(cf, start, end, step)
+        last_update = rrd.last_update
+
+    start -= start % rra.step
+    if end % rra.step:
+        end += rra.step - end % rra.step
+
+    return start, end, rra.step, _fetch(path, last_update, ds, rra.index, start, end)
+
+
+def rows_count(start, end, step):
+    """
+    Number of rows from `start` to `end` once aligned to `step`.
+    """
+    return (end + (-end) % step - (start - start % step)) // step
+
+
+def consolidate(values, start, end, step, cf, new_step):
+    """
+    Consolidate `values` (from `start` to `end` every `step`) with `cf` into
+    values every `new_step`, a multiple of `step`. NaN values are ignored.
+
+    Returns `(start, end, values)`.
+    """
+    if new_step == step:
+        return start, end, values
+
+    new_start = start - start % new_step
+    new_end = end + (-end) % new_step
+    values = (
+        (math.nan,) * ((start - new_start) // step) + tuple(values) + (math.nan,) * ((new_end - end) // step)
+    )
+    factor = new_step // step
+
+    consolidated = []
+    for i in range(0, len(values), factor):
+        valid = [v for v in values[i:i + factor] if not math.isnan(v)]
+        if not valid:
+            consolidated.append(math.nan)
+        elif cf == 'AVERAGE':
+            consolidated.append(sum(valid) / len(valid))
+        elif cf == 'MIN':
+            consolidated.append(min(valid))
+        elif cf == 'MAX':
+            consolidated.append(max(valid))
+        else:
+            consolidated.append(valid[-1])
+    return new_start, new_end, tuple(consolidated)
+
+
+def xport(defs, start, end, step=1, max_points=None):
+    """
+    Values of `defs`, a list of `(path, ds, cf)`, from `start` to `end` with
+    a common step of at least `step` (as `rrdtool xport` does). If there would
+    be more than `max_points` rows values are consolidated further.
+
+    Returns `(start, end, step, rows)`, `rows[i]` being the values at
+    `start + (i + 1) * step`, `None` for unknown values.
+    """
+    series = []
+    for path, ds, cf in defs:
+        s_start, s_end, s_step, values = fetch(path, ds, cf, start, end, step)
+        if s_step < step:
+            s_step_new = s_step * math.ceil(step / s_step)
+            s_start, s_end, values = consolidate(values, s_start, s_end, s_step, cf, s_step_new)
+            s_step = s_step_new
+        series.append((cf, s_start, s_end, s_step, values))
+
+    # Least common multiple of the series steps
+    xport_step = functools.reduce(lambda a, b: a * b // math.gcd(a, b), [s[3] for s in series])
+    if max_points:
+        factor = 1
+        while rows_count(start, end, xport_step * factor) > max_points:
+            factor += 1
+        xport_step *= factor
+
+    columns = []
+    for cf, s_start, s_end, s_step, values in series:
+        x_start, x_end, values = consolidate(values, s_start, s_end, s_step, cf, xport_step)
+        columns.append(values)
+
+    rows = [[None if math.isnan(v) else v for v in row] for row in zip(*columns)]
+    return x_start, x_end, xport_step, rows
+
+
+def _parse_time(value):
+    match = RE_TIME.match(str(value).strip().lower().replace(' ', ''))
+    if match is None:
+        raise ValueError(f'Invalid time specification {value!r}')
+
+    base, offsets = match.groups()
+    if base is None:
+        if not offsets:
+            raise ValueError(f'Invalid time specification {value!r}')
+        # Offset alone (e.g. `-1h`) is relative to now
+        base = 'now'
+    elif base.isdigit():
+        base = int(base)
+    else:
+        base = {'n': 'now', 's': 'start', 'e': 'end'}.get(base, base)
+
+    parsed = []
+    for sign, number, unit in RE_TIME_OFFSET.findall(offsets):
+        number = int(number) * (-1 if sign == '-' else 1)
+        if unit in CALENDAR_UNITS:
+            parsed.append((number * CALENDAR_UNITS[unit], 'months'))
+        elif unit in TIME_UNITS or unit == '':
+            parsed.append((number * TIME_UNITS.get(unit, 1), 'seconds'))
+        else:
+            raise ValueError(f'Invalid time unit {unit!r} in {value!r}')
+    return base, parsed
+
+
+def _apply_offsets(timestamp, offsets):
+    for number, unit in offsets:
+        if unit == 'months':
+            # Calendar months, in local time
+            dt = datetime.fromtimestamp(timestamp)
+            months = dt.month - 1 + number
+            year, month = dt.year + months // 12, months % 12 + 1
+            dt = dt.replace(year=year, month=month, day=min(dt.day, calendar.monthrange(year, month)[1]))
+            timestamp = int(dt.timestamp())
+        else:
+            timestamp += number
+    return timestamp
+
+
+def parse_times(start, end, now=None):
+    """
+    Parse `start` and `end` times, either seconds since the epoch or rrdtool
+    AT-style times relative to `now`, `start` or `end` (e.g. `now-1h`, `end-2d`,
+    or `-1h` which is the same as `now-1h`).
+    """
+    now = int(time.time()) if now is None else now
+    (start_base, start_offsets), (end_base, end_offsets) = _parse_time(start), _parse_time(end)
+
+    if start_base == 'start' or end_base == 'end':
+        raise ValueError('Start and end times cannot refer to themselves')
+    if start_base == 'end' and end_base == 'start':
+        raise ValueError('Start and end times cannot refer to each other')
+
+    if start_base == 'end':
+        end = _apply_offsets(now if end_base == 'now' else end_base, end_offsets)
+        start = _apply_offsets(end, start_offsets)
+    else:
+        start = _apply_offsets(now if start_base == 'now' else start_base, start_offsets)
+        end = _apply_offsets(start if end_base == 'start' else now if end_base == 'now' else end_base, end_offsets)
+    return start, end
@@ -0,0 +1,74 @@
+import re
+
+RE_PROGRESS2 = re.compile(
+    r'^\s*(?P<bytes>[\d,.]+[KMGTP]?)\s+(?P<percent>\d+)%\s+(?P<rate>[\d,.]+[kKMGTP]?B/s)\s+'
+    r'(?P<eta>\d+:\d{2}:\d{2})'
+    r'(?:\s+\(xfr#(?P<xfr>\d+),\s+(?:to|ir)-chk=(?P<remaining>\d+)/(?P<total>\d+)\))?'
+)
+UNITS = {'K': 10 ** 3, 'M': 10 ** 6, 'G': 10 ** 9, 'T': 10 ** 12, 'P': 10 ** 15}
+
+
+def parse_size(size):
+    """
+    Parse a size as printed by rsync, with digit separators (`1,234,567`) or
+    in units of 1000 with `-h` (`1.23M`).
+    """
+    size = size.replace(',', '')
+    unit = size[-1:].upper()
+    if unit in UNITS:
+        return int(float(size[:-1]) * UNITS[unit])
+    return int(float(size))
+
+
+def parse_progress2(line):
+    """
+    Parse a line of rsync `--info=progress2` output, e.g.
+
+        1.23M  45%   12.34MB/s    0:00:10 (xfr#3, to-chk=10/20)
+
+    Returns:
+        dict: percent, bytes_transferred, rate (bytes per second), eta (seconds) and,
+            once known, files_transferred, files_remaining and files_total. None if
+            `line` is not a progress line.
+    """
+    m = RE_PROGRESS2.match(line)
+    if not m:
+        return None
+
+    hours, minutes, seconds = map(int, m.group('eta').split(':'))
+    progress = {
+        'percent': int(m.group('percent')),
+        'bytes_transferred': parse_size(m.group('bytes')),
+        'rate': parse_size(m.group('rate')[:-3]),
+        'eta': hours * 3600 + minutes * 60 + seconds,
+    }
+    if m.group('xfr') is not None:
+        progress.update({
+            'files_transferred': int(m.group('xfr')),
+            'files_remaining': int(m.group('remaining')),
+            'files_total': int(m.group('total')),
+        })
+    return progress
+
+
+async def read_lines(stream, chunk_size=65536):
+    """
+    Asynchronously yields the lines of `stream` (an `asyncio.StreamReader`).
+
+    rsync rewrites progress lines using carriage returns, so both CR and LF end a line.
+    Empty lines are skipped.
+    """
+    buf = b''
+    while True:
+        chunk = await stream.read(chunk_size)
+        if not chunk:
+            break
+
+        lines = re.split(b'[\r\n]', buf + chunk)
+        buf = lines.pop()
+        for line in lines:
+            if line:
+                yield line.decode('utf8', 'ignore')
+
+    if buf:
+        yield buf.decode('utf8', 'ignore')
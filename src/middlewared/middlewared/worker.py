@@ -1,14 +1,15 @@
 #!/usr/local/bin/python3
 from middlewared.client import Client
+from middlewared.utils.io_thread_pool import IoThreadPoolExecutor
 
 import asyncio
-import concurrent.futures
 import functools
 import importlib
 import os
 import select
 import setproctitle
 import threading
+import time
 from . import logger
 
 MIDDLEWARE = None
@@ -21,34 +22,36 @@ class FakeMiddleware(object):
 
     def __init__(self):
         self.client = None
+        self.client_lock = threading.Lock()
+        self.io_threadpool = IoThreadPoolExecutor(max_workers=4)
         self.logger = logger.Logger('worker')
         self.logger.getLogger()
         self.logger.configure_logging('console')
 
     async def run_in_thread(self, method, *args, **kwargs):
-        executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
-        try:
-            return await asyncio.get_event_loop().run_in_executor(
-                executor, functools.partial(method, *args, **kwargs)
-            )
-        finally:
-            # We need this because default behavior of PoolExecutor with
-            # context manager is to shutdown(wait=True) which would block
-            # the worker until thread finishes.
-            executor.shutdown(wait=False)
+        return await asyncio.get_event_loop().run_in_executor(
+            self.io_threadpool, functools.partial(method, *args, **kwargs)
+        )
+
+    def get_client(self):
+        """
+        Returns the connection to middlewared kept for the lifetime of the worker,
+        connecting again if it has been closed.
+        """
+        with self.client_lock:
+            if self.client is None or self.client._closed.is_set():
+                self.client = Client(py_exceptions=True)
+            return self.client
 
     async def _call(self, name, serviceobj, methodobj, params=None, app=None, pipes=None, io_thread=False, job=None):
-        with Client(py_exceptions=True) as c:
-            self.client = c
-            job_options = getattr(methodobj, '_job', None)
-            if job and job_options:
-                params = list(params) if params else []
-                params.insert(0, FakeJob(job['id'], self.client))
-            if asyncio.iscoroutinefunction(methodobj):
-                return await methodobj(*params)
-            else:
-                return methodobj(*params)
-        self.client = None
+        job_options = getattr(methodobj, '_job', None)
+        if job and job_options:
+            params = list(params) if params else []
+            params.insert(0, FakeJob(job['id'], self.get_client()))
+        if asyncio.iscoroutinefunction(methodobj):
+            return await methodobj(*params)
+        else:
+            return methodobj(*params)
 
     async def _run(self, service_mod, service_name, method, args, job=None):
         module = importlib.import_module(service_mod)
@@ -60,13 +63,13 @@ class FakeMiddleware(object):
         """
         Calls a method using middleware client
         """
-        return self.client.call(method, *params, timeout=timeout, **kwargs)
+        return self.get_client().call(method, *params, timeout=timeout, **kwargs)
 
     def call_sync(self, method, *params, timeout=None, **kwargs):
         """
         Calls a method using middleware client
         """
-        return self.client.call(method, *params, timeout=timeout, **kwargs)
+        return self.get_client().call(method, *params, timeout=timeout, **kwargs)
 
 
 class FakeJob(object):
@@ -90,14 +93,21 @@ class FakeJob(object):
 
 
 def main_worker(*call_args):
+    """
+    Runs a service method in the worker.
+
+    Returns:
+        tuple: method result and how long (in seconds) it took to run
+    """
     global MIDDLEWARE
     loop = asyncio.get_event_loop()
     coro = MIDDLEWARE._run(*call_args)
+    start = time.monotonic()
     try:
         res = loop.run_until_complete(coro)
     except SystemExit:
         raise RuntimeError('Worker call raised SystemExit exception')
-    return res
+    return res, time.monotonic() - start
 
 
 def watch_parent():